@@ -0,0 +1,87 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------
+# 除權息 / 分割還原：倉庫只存原始K棒，還原因子另存一張小表
+# - 因子表 = {除權息日: [價格比例, 成交量比例]}，套用在該日之前的所有K棒
+# - 讀取時才把因子套到 OHLC，新的除息只會多一筆因子，不必整段重抓
+# -------------------------------------------------
+ADJ_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "adjustments")
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+RATIO_COLUMN = "AdjRatio"        # 資料源給的 還原收盤 / 收盤
+TOLERANCE = 1e-5                 # 還原收盤四捨五入的誤差
+RESTATE_TOLERANCE = 0.01         # 重疊K棒開盤價差超過 1% 視為資料源改寫歷史 (分割 / 減資)
+
+
+def _path(ticker):
+    return os.path.join(ADJ_DIR, f"{ticker}.json")
+
+
+def load_events(ticker):
+    try:
+        with open(_path(ticker), encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_events(ticker, events):
+    os.makedirs(ADJ_DIR, exist_ok=True)
+    tmp = f"{_path(ticker)}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(events.items())), f)
+    os.replace(tmp, _path(ticker))
+
+
+def events_from_ratio(ratio):
+    # 還原比例在兩根K棒之間變了 → 後一根是除權息日，前面的K棒都要乘上 前比例 / 後比例
+    r = ratio.dropna()
+    jump = (r.shift(1) / r).iloc[1:]
+    jump = jump[(jump - 1).abs() > TOLERANCE]
+    return {d.strftime('%Y-%m-%d'): [float(f), 1.0] for d, f in jump.items()}
+
+
+def restatement(stored, fresh):
+    # 資料源價量已含分割調整：分割後抓到的重疊K棒和倉庫裡的差一個固定比例，成交量反向調整
+    if stored is None or stored.empty: return {}
+    overlap = stored.index.intersection(fresh.index)
+    if not len(overlap): return {}
+    ratio = float((fresh.loc[overlap, "Open"] / stored.loc[overlap, "Open"]).median())
+    if not abs(ratio - 1) > RESTATE_TOLERANCE: return {}
+    return {overlap[0].strftime('%Y-%m-%d'): [ratio, 1 / ratio]}
+
+
+def update_events(ticker, stored, fresh):
+    # fresh 是剛下載的原始K棒 (含 AdjRatio 欄)；回傳更新後的因子表
+    old = load_events(ticker)
+    ratio_events = events_from_ratio(fresh[RATIO_COLUMN]) if RATIO_COLUMN in fresh else {}
+    if stored is None or stored.empty or fresh.index[0] <= stored.index[0]:
+        # 整段重抓：這段期間的因子以資料源為準
+        events = ratio_events
+    else:
+        # 只補尾段：沿用舊因子，加上這段新出現的
+        events = {**old, **ratio_events, **restatement(stored, fresh)}
+    if events != old: save_events(ticker, events)
+    return events
+
+
+def factor_series(index, events, column=0):
+    # 每根K棒的還原因子 = 之後所有除權息日因子的乘積 (column 0 = 價格, 1 = 成交量)
+    if not events: return pd.Series(1.0, index=index)
+    dates = pd.DatetimeIndex(sorted(events))
+    factors = np.array([events[d][column] for d in sorted(events)], dtype="float64")
+    cum = np.append(np.cumprod(factors[::-1])[::-1], 1.0)
+    return pd.Series(cum[dates.searchsorted(index, side="right")], index=index)
+
+
+def apply(df, events):
+    # 與 yfinance auto_adjust 相同：除權息只調整 OHLC，分割才調整成交量
+    out = df.drop(columns=[RATIO_COLUMN], errors="ignore")
+    if events:
+        out[PRICE_COLUMNS] = out[PRICE_COLUMNS].mul(factor_series(out.index, events), axis=0)
+        out["Volume"] = out["Volume"] * factor_series(out.index, events, 1)
+    out.attrs.update(df.attrs)
+    return out
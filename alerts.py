@@ -0,0 +1,210 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import requests
+
+# -------------------------------------------------
+# 訊號通知：掃描命中 → 去重 → 批次送到各個通知管道
+# 管道：JSONL 檔案 / webhook / stdout，由環境變數設定
+# - 每個管道各自確認送達；全部送達才記成已通知，失敗的留在佇列依退避時間重送
+# - 佇列存檔，行程結束 (例：排程掃描) 沒送完的下一個行程接著送
+# -------------------------------------------------
+SENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "alerts_sent.json")
+PENDING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "alerts_pending.json")
+SKIP_CHANGES = {"❌ 消失"}
+RETRY_BASE = 5          # 第一次失敗後 5 秒重送，之後加倍
+RETRY_MAX = 600         # 最長 10 分鐘重送一次
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def alert_key(alert):
+    return f"{alert['ticker']}|{alert['strategy']}|{alert['signal_date']}"
+
+
+def to_alert(hit):
+    return {
+        "ticker": hit.get("代號"),
+        "name": hit.get("名稱"),
+        "strategy": hit.get("策略"),
+        "signal_date": hit.get("訊號日期"),
+        "price": hit.get("現價"),
+        "stop_loss": hit.get("停損價(SL)"),
+        "take_profit": hit.get("停利價(TP)"),
+        "status": hit.get("狀態"),
+        "queued_at": pd.Timestamp.now().isoformat(timespec="seconds"),     # 排進佇列的時間 (重送時不變)
+    }
+
+
+# 管道的 send 沒丟例外 = 整批送達
+class JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self.name = f"jsonl:{path}"
+
+    def send(self, alerts):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for a in alerts:
+                f.write(json.dumps(a, ensure_ascii=False, default=str) + "\n")
+
+
+class WebhookSink:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.name = f"webhook:{url}"
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, alerts):
+        # 只有 2xx 算送達；4xx (含 429 限流) / 5xx / 逾時都交給 dispatcher 退避重送
+        try:
+            r = self.session.post(self.url, data=json.dumps({"alerts": alerts}, ensure_ascii=False, default=str).encode("utf-8"),
+                                  headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(f"{self.url}: {e}") from e
+        if not 200 <= r.status_code < 300: raise DeliveryError(f"{self.url}: HTTP {r.status_code}")
+
+
+class StdoutSink:
+    name = "stdout"
+
+    def send(self, alerts):
+        for a in alerts:
+            print(f"[訊號] {a['signal_date']} {a['ticker']} {a['name']} {a['strategy']} 現價 {a['price']}", file=sys.stdout, flush=True)
+
+
+class AlertDispatcher:
+    def __init__(self, sinks, batch_size=50, flush_interval=2.0, sent_path=SENT_PATH, pending_path=PENDING_PATH, keep_days=7):
+        self.sinks = list(sinks)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sent_path = sent_path
+        self.pending_path = pending_path
+        self.keep_days = keep_days
+        self._cond = threading.Condition()
+        self._sent = self._load_sent()
+        # 鍵 -> {"alert", "sinks": 還沒送達的管道名稱, "attempts", "next_try"}
+        self._pending = self._load_pending()
+        self.failures = 0
+        self._flush_lock = threading.Lock()     # 背景執行緒與掃描結束時的 flush 不能同時送同一批
+        self._thread = threading.Thread(target=self._loop, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    def _load_sent(self):
+        try:
+            with open(self.sent_path, encoding="utf-8") as f:
+                sent = json.load(f)
+        except Exception:
+            return {}
+        cutoff = (pd.Timestamp.today() - pd.Timedelta(days=self.keep_days)).strftime('%Y-%m-%d')
+        return {k: v for k, v in sent.items() if v >= cutoff}
+
+    def _load_pending(self):
+        # 上一個行程沒送完的；現在沒設定的管道不再送，已經通知過 / 超過保留天數的略過
+        try:
+            with open(self.pending_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except Exception:
+            return {}
+        names = {s.name for s in self.sinks}
+        cutoff = (pd.Timestamp.today() - pd.Timedelta(days=self.keep_days)).strftime('%Y-%m-%d')
+        pending = {}
+        for key, item in saved.items():
+            left = [n for n in item["sinks"] if n in names]
+            if left and key not in self._sent and str(item["alert"].get("queued_at")) >= cutoff: pending[key] = {"alert": item["alert"], "sinks": left, "attempts": item["attempts"], "next_try": 0.0}
+        return pending
+
+    def _dump(self, path, data):
+        if not path: return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # UI 與排程掃描的 dispatcher 可能同時寫同一個檔：暫存檔名依行程區分
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
+
+    def _save_pending(self):
+        self._dump(self.pending_path, {k: {"alert": v["alert"], "sinks": v["sinks"], "attempts": v["attempts"]} for k, v in self._pending.items()})
+
+    def publish(self, hits):
+        # 同一個 (代號, 策略, 訊號日期) 只通知一次；「消失」的訊號不通知
+        with self._cond:
+            added = 0
+            for hit in hits:
+                if hit.get("訊號變化") in SKIP_CHANGES: continue
+                alert = to_alert(hit)
+                key = alert_key(alert)
+                if key in self._sent or key in self._pending: continue
+                self._pending[key] = {"alert": alert, "sinks": [s.name for s in self.sinks], "attempts": 0, "next_try": 0.0}
+                added += 1
+            if added:
+                # 存檔失敗 (磁碟滿等) 不影響這次通知，佇列還在記憶體裡
+                try: self._save_pending()
+                except OSError as e: print(f"[通知] 佇列存檔失敗：{e}", file=sys.stderr, flush=True)
+            if len(self._pending) >= self.batch_size: self._cond.notify()
+
+    def _loop(self):
+        # 背景執行緒不能因為一次錯誤 (例：存檔失敗) 就結束，否則之後只剩掃描結束時才送
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[通知] 背景送出失敗，稍後重試：{e!r}", file=sys.stderr, flush=True)
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        # 只送到了退避時間的；每個管道只送它還沒收到的，送達後才從該筆的管道清單移除
+        now = time.monotonic()
+        with self._cond:
+            due = {k: v for k, v in self._pending.items() if v["next_try"] <= now}
+        if not due: return
+        delivered, failed = {}, set()
+        for sink in self.sinks:
+            keys = [k for k, v in due.items() if sink.name in v["sinks"]]
+            for i in range(0, len(keys), self.batch_size):
+                chunk = keys[i : i + self.batch_size]
+                try:
+                    sink.send([due[k]["alert"] for k in chunk])
+                except Exception as e:
+                    print(f"[通知] {sink.name} 送出失敗，稍後重送：{e}", file=sys.stderr, flush=True)
+                    self.failures += 1
+                    failed.update(chunk)
+                    continue
+                for k in chunk: delivered.setdefault(k, set()).add(sink.name)
+
+        today = pd.Timestamp.today().strftime('%Y-%m-%d')
+        with self._cond:
+            for k, item in due.items():
+                item["sinks"] = [n for n in item["sinks"] if n not in delivered.get(k, ())]
+                if not item["sinks"]:
+                    self._pending.pop(k, None)
+                    self._sent[k] = today
+                elif k in failed:
+                    item["attempts"] += 1
+                    item["next_try"] = time.monotonic() + min(RETRY_BASE * 2 ** (item["attempts"] - 1), RETRY_MAX)
+            self._dump(self.sent_path, self._sent)
+            self._save_pending()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+
+def dispatcher_from_env(environ=os.environ):
+    sinks = []
+    if environ.get("TW_SCAN_ALERT_JSONL"): sinks.append(JsonlSink(environ["TW_SCAN_ALERT_JSONL"]))
+    if environ.get("TW_SCAN_ALERT_WEBHOOK"): sinks.append(WebhookSink(environ["TW_SCAN_ALERT_WEBHOOK"]))
+    if environ.get("TW_SCAN_ALERT_STDOUT") == "1": sinks.append(StdoutSink())
+    return AlertDispatcher(sinks) if sinks else None
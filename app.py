@@ -1,20 +1,10 @@
 import streamlit as st
 
-import yfinance as yf
+import os
 
-import pandas as pd
+import scanner
 
-import ta
-
-import requests
-
-import warnings
-
-import time
-
-
-
-warnings.filterwarnings("ignore")
+import profiles
 
 
 
@@ -40,11 +30,15 @@ st.markdown("""
 
 **所有篩選結果僅供技術分析參考，不代表買賣建議。請務必嚴格執行停損，控制風險。**
 
+""")
 
 
----
 
-#### 🧠 策略邏輯解析：
+# 策略說明預設收合，不必每次重跑都展開整段
+
+with st.expander("🧠 策略邏輯解析"):
+
+    st.markdown("""
 
 
 
@@ -86,921 +80,527 @@ st.markdown("""
 
 
 
----
-
-""")
-
-
-
-# -------------------------------------------------
-
-# 輔助：產生外資連結
-
-# -------------------------------------------------
-
-def get_chip_link(ticker):
-
-    code = ticker.split('.')[0]
-
-    return f"https://tw.stock.yahoo.com/quote/{code}/institutional-trading"
-
-
-
-# -------------------------------------------------
-
-# 股票清單
-
-# -------------------------------------------------
-
-@st.cache_data(ttl=86400)
-
-def get_all_tw_tickers():
-
-    headers = {"User-Agent": "Mozilla/5.0"}
-
-    stock_map = {} 
-
-    for mode in ["2", "4"]:
-
-        url = f"https://isin.twse.com.tw/isin/C_public.jsp?strMode={mode}"
-
-        try:
-
-            r = requests.get(url, headers=headers, verify=False, timeout=10)
-
-            df = pd.read_html(r.text)[0].iloc[1:]
-
-            for item in df[0]:
-
-                data = str(item).split()
-
-                if len(data) >= 2:
-
-                    code = data[0]
-
-                    name = data[1]
-
-                    if code.isdigit() and len(code) == 4:
+5.  **⚡ 盤中分K 帶量過 20MA (5 / 15 / 30 / 60 分K)**：
 
-                        suffix = ".TWO" if mode == "4" else ".TW"
+    * **條件**：實體紅K穿過 20MA (開盤 < 20MA < 收盤) + 成交量 > 前一根 2 倍。
 
-                        stock_map[f"{code}{suffix}"] = name
+    * 只抓一次 5 分K，15 / 30 / 60 分K 由 5 分K 依開盤時間合成；最新一根未收完會標示「未收」。
 
-        except Exception: pass
-
-    return stock_map
-
-
-
-# -------------------------------------------------
-
-# 核心：批量下載函式
-
-# -------------------------------------------------
-
-def download_batch_data(tickers_batch):
-
-    try:
-
-        data = yf.download(tickers_batch, period="2y", interval="1d", group_by='ticker', progress=False, threads=True)
-
-        result_dict = {}
-
-        if len(tickers_batch) == 1:
-
-            t = tickers_batch[0]
-
-            if not data.empty: result_dict[t] = data
-
-            return result_dict
-
-
-
-        for t in tickers_batch:
-
-            try:
-
-                df = data[t].copy()
-
-                if df['Close'].isnull().all(): continue
-
-                df = df.dropna(how='all')
-
-                if not df.empty: result_dict[t] = df
-
-            except KeyError: continue
-
-        return result_dict
-
-    except Exception: return {}
-
-
-
-# -------------------------------------------------
-
-# 輔助：計算風控數據
-
-# -------------------------------------------------
-
-def calculate_risk_reward(c_now, sl_price, date_now, custom_target=None):
-
-    sl_price = round(sl_price, 2)
-
-    risk = c_now - sl_price
-
-    if risk <= 0: risk = c_now * 0.01 
-
-    
-
-    if custom_target:
-
-        target_price = round(custom_target, 2)
-
-        potential_profit = (target_price - c_now) / c_now
-
-    else:
+    * **停損**：現價 - 2 倍 ATR(14)。 **停利**：1.5 倍風險。
 
-        target_price = round(c_now + (risk * 1.5), 2) 
 
-        potential_profit = (risk * 1.5) / c_now
 
-    
-
-    return {
-
-        "訊號日期": date_now.strftime('%Y-%m-%d'),
-
-        "停損價(SL)": sl_price,
-
-        "停利價(TP)": target_price,
-
-        "潛在獲利": f"{round(potential_profit*100, 1)}%"
+---
 
-    }
+""")
 
 
 
 # -------------------------------------------------
 
-# 核心：回測引擎 (修復日線策略邏輯)
+# 結果表格
 
 # -------------------------------------------------
 
-def run_backtest(df, strategy_type, months):
-
-    try:
-
-        # 判斷是日線還是週線資料來決定回測長度
-
-        is_weekly = (strategy_type == "weekly_pullback")
-
-        lookback = months * 4 if is_weekly else months * 22
-
-        
-
-        if len(df) < lookback + 20: return None
-
-
-
-        trades = []
-
-        in_position = False
-
-        entry_price = 0
-
-        target_price = 0
-
-        stop_loss_price = 0
-
-        
-
-        start_idx = len(df) - lookback
+def render_results(result, selected, finished, rs_pct=None):
 
-        if start_idx < 25: start_idx = 25 # 確保有足夠前面資料算MA
+    has_data = False
 
-        
+    for k in selected:
 
-        close = df["Close"]; open_p = df["Open"]; high = df["High"]; low = df["Low"]; volume = df["Volume"]
+        if result.get(k):
 
-        
+            has_data = True
 
-        # 預先計算需要的指標
+            st.subheader(f"📊 {k}")
 
-        ma5 = ta.trend.sma_indicator(close, 5)
+            df_res = scanner.pd.DataFrame(result[k])
 
-        ma10 = ta.trend.sma_indicator(close, 10) 
+            # 相對強弱：依全市場 RS 百分位由強到弱排序
 
-        ma20 = ta.trend.sma_indicator(close, 20)
+            if rs_pct:
 
-        ma60 = ta.trend.sma_indicator(close, 60) 
+                df_res[scanner.RS_PCT] = df_res["代號"].map(rs_pct)
 
-        ma120 = ta.trend.sma_indicator(close, 120)
-
-        
-
-        bb20 = ta.volatility.BollingerBands(close=close, window=20, window_dev=2)
-
-
-
-        for i in range(start_idx, len(df) - 1):
-
-            c_curr = close.iloc[i]; h_curr = high.iloc[i]; l_curr = low.iloc[i]
+                df_res = df_res.sort_values(scanner.RS_PCT, ascending=False, na_position="last")
 
             
 
-            # === 持倉檢查 ===
-
-            if in_position:
-
-                # 停利：碰到目標價
-
-                if h_curr >= target_price: 
-
-                    trades.append((target_price - entry_price) / entry_price)
-
-                    in_position = False; continue
-
-                
-
-                # 停損出場
-
-                exit_condition = False
-
-                if strategy_type == "weekly_pullback":
-
-                    if c_curr < stop_loss_price: exit_condition = True
-
-                else:
-
-                    if c_curr < stop_loss_price: exit_condition = True 
-
-                
-
-                if exit_condition:
-
-                    trades.append((c_curr - entry_price) / entry_price)
-
-                    in_position = False; continue
+            # 欄位顯示名稱更新
 
-                
-
-                # 移動停利邏輯 (部分策略)
-
-                if strategy_type == "bollinger_mid":
-
-                    target_price = bb20.bollinger_hband().iloc[i]
-
-                continue
-
-
-
-            # === 進場訊號 ===
-
-            signal = False
-
-            curr_sl = 0
-
-            curr_tp = 0
+            base_cols = ["代號", "名稱", "現價", "停損價(SL)", "停利價(TP)", "外資詳情"]
 
             
 
-            # [日線策略通用過濾]
-
-            if not is_weekly and volume.iloc[i] < 500_000: continue
-
-
-
-            # 1. 策略：中線策略 (20MA)
-
-            if strategy_type == "bollinger_mid":
-
-                if c_curr > ma120.iloc[i]:
-
-                    mid = bb20.bollinger_mavg().iloc[i]
-
-                    if abs(c_curr - mid) / mid <= 0.015 and mid > bb20.bollinger_mavg().iloc[i-1]:
-
-                        if c_curr < open_p.iloc[i] and volume.iloc[i] < volume.iloc[i-1]:
-
-                            signal = True
-
-                            curr_sl = mid * 0.97
-
-                            curr_tp = bb20.bollinger_hband().iloc[i]
+            if "布林中線" in df_res.columns or "布林中線(10MA)" in df_res.columns:
 
+                  if "布林下軌" in df_res.columns: 
 
+                      target_cols = ["代號", "名稱", "現價", "布林下軌", "布林中線(10MA)", "停損價(SL)", "停利價(TP)", "外資詳情"]
 
-            # 2. 策略：洗盤 (Washout) - [已修復邏輯]
+                  else: 
 
-            elif strategy_type == "washout":
+                      target_cols = ["代號", "名稱", "現價", "布林中線", "布林上軌", "停損價(SL)", "停利價(TP)", "外資詳情"]
 
-                # 模擬條件：均線多頭排列 + 帶量站回 5MA
+            elif "爆量倍數" in df_res.columns:
 
-                if c_curr > ma20.iloc[i] and c_curr > ma60.iloc[i]:
+                target_cols = ["代號", "名稱", "現價", "本週量(張)", "預估週量(張)", "爆量倍數", "停損價(SL)", "停利價(TP)", "外資詳情"]
 
-                    # 昨日在5MA下，今日站上5MA (轉強)
+            elif "上週量(張)" in df_res.columns:
 
-                    if close.iloc[i-1] < ma5.iloc[i-1] and c_curr > ma5.iloc[i]:
+                # 優先顯示乖離率
 
-                         # 帶量紅K
+                target_cols = ["代號", "名稱", "現價", "5週乖離率", "本週量(張)", "預估週量(張)", "上週量(張)", "停損價(SL)", "停利價(TP)", "外資詳情"]
 
-                         if c_curr > open_p.iloc[i] and volume.iloc[i] > volume.iloc[i-1]:
+            elif "成交量倍數" in df_res.columns:
 
-                            # 回測時加上寬鬆一點的乖離率檢查 (可選)
+                target_cols = ["代號", "名稱", "時間", "現價", "20MA", "成交量倍數", "停損價(SL)", "停利價(TP)", "狀態", "外資詳情"]
 
-                            if (c_curr - ma5.iloc[i]) / ma5.iloc[i] < 0.08:
+            elif "5日乖離率" in df_res.columns:
 
-                                signal = True
+                # === 修改重點：加入 5日乖離率 到優先顯示欄位 ===
 
-                                curr_sl = ma20.iloc[i] # 跌破月線停損
+                target_cols = ["代號", "名稱", "現價", "5日乖離率", "停損價(SL)", "停利價(TP)", "外資詳情"]
 
-                                curr_tp = c_curr * 1.15 # 預期15%獲利
+            else:
 
+                target_cols = base_cols
 
+            
 
-            # 3. 策略：盤整突破 - [已修復邏輯]
-
-            elif strategy_type == "consolidation":
-
-                 # 模擬條件：均線糾結後 + 爆量長紅突破
-
-                 if c_curr > ma5.iloc[i] and c_curr > ma20.iloc[i] and c_curr > ma60.iloc[i]:
-
-                      # 實體紅K > 3% 且 成交量放大 1.5 倍
-
-                      if (c_curr - open_p.iloc[i])/open_p.iloc[i] > 0.03 and volume.iloc[i] > volume.iloc[i-1]*1.5:
-
-                          signal = True
-
-                          curr_sl = open_p.iloc[i] # 跌破起漲點停損
-
-                          curr_tp = c_curr * 1.2 # 預期20%波段獲利
-
-
-
-            # 4. 策略：週線回檔守 5MA 回測
-
-            elif strategy_type == "weekly_pullback":
-
-                # i = 本週, i-1 = 上週
-
-                c_prev = close.iloc[i-1]; o_prev = open_p.iloc[i-1]; v_prev = volume.iloc[i-1]
-
-                h_prev = high.iloc[i-1]
-
-                
-
-                # 條件
+            # 確保欄位存在才選取
 
-                if v_prev < 100000 * 1000: continue
+            final_cols = [c for c in target_cols if c in df_res.columns]
 
-                if c_curr < ma20.iloc[i]: continue
+            if "產業別" in df_res.columns and "名稱" in final_cols:
 
-                if not (c_prev > o_prev and c_prev > ma5.iloc[i-1]): continue
+                final_cols.insert(final_cols.index("名稱") + 1, "產業別")
 
-                
+            rs_cols = [c for c in [scanner.RS_PCT, *scanner.RS_PERIODS, *scanner.chips.CHIP_COLUMNS] if c in df_res.columns]
 
-                if c_curr < open_p.iloc[i] and volume.iloc[i] < v_prev and c_curr > ma5.iloc[i]:
+            if rs_cols and "現價" in final_cols:
 
-                    signal = True
+                at = final_cols.index("現價") + 1
 
-                    curr_sl = ma5.iloc[i] * 0.98 
+                final_cols[at:at] = rs_cols
 
-                    curr_tp = h_prev 
+            if "訊號變化" in df_res.columns:
 
+                final_cols = ["訊號變化"] + final_cols
 
+            
 
-            if signal:
+            if "回測勝率" in df_res.columns:
 
-                in_position = True
+                final_cols += ["回測勝率", "平均獲利", "總交易"]
 
-                entry_price = c_curr
+            
 
-                stop_loss_price = curr_sl
+            other_cols = [c for c in df_res.columns if c not in final_cols and c not in target_cols]
 
-                target_price = curr_tp
+            
 
+            st.dataframe(
 
+                df_res[final_cols + other_cols], 
 
-        if not trades: return {"回測勝率": "無訊號", "平均獲利": "0%", "總交易": 0}
+                use_container_width=True,
 
-        win_count = sum(1 for p in trades if p > 0)
+                column_config={
 
-        return {
+                    "外資詳情": st.column_config.LinkColumn(
 
-            "回測勝率": f"{round((win_count/len(trades))*100, 1)}%",
+                        "外資詳情", display_text="查看數據"
 
-            "平均獲利": f"{round((sum(trades)/len(trades))*100, 2)}%",
+                    )
 
-            "總交易": len(trades)
+                }
 
-        }
+            )
 
-    except Exception as e: 
+    if not has_data and finished:
 
-        return None
+        st.info("掃描完成，但沒有符合條件的股票。")
 
 
 
 # -------------------------------------------------
 
-# 策略函式
+# UI 介面
 
 # -------------------------------------------------
 
+st.sidebar.header("掃描設定檔")
 
+saved_profiles = profiles.load_profiles()
 
-def strategy_bollinger_mid(ticker, name, df, backtest_months):
+profile_name = st.sidebar.selectbox("設定檔", ["(自訂)", *saved_profiles])
 
-    try:
+profile = saved_profiles.get(profile_name) or profiles.ScanProfile(profile_name)
 
-        if len(df) < 125: return None
+# 元件 key 帶設定檔名稱：切換設定檔時各元件重設為該設定檔的值
 
-        close = df["Close"]; open_p = df["Open"]; volume = df["Volume"]
+pk = f"profile_{profile_name}"
 
-        c_now = float(close.iloc[-1]); o_now = float(open_p.iloc[-1])
 
-        v_now = float(volume.iloc[-1]); v_prev = float(volume.iloc[-2])
 
-        
-
-        if v_now < 500_000: return None
-
-        if c_now < ta.trend.sma_indicator(close, 120).iloc[-1]: return None 
-
-        
-
-        indicator_bb = ta.volatility.BollingerBands(close=close, window=20, window_dev=2)
-
-        bb_mavg = indicator_bb.bollinger_mavg()
-
-        bb_hband = indicator_bb.bollinger_hband()
-
-        mid_now = float(bb_mavg.iloc[-1])
-
-        upper_now = float(bb_hband.iloc[-1]) 
-
-        
-
-        if abs(c_now - mid_now) / mid_now > 0.015: return None 
-
-        if mid_now < float(bb_mavg.iloc[-2]): return None 
-
-        if c_now >= o_now: return None 
-
-        if v_now >= v_prev: return None 
-
-
-
-        bt_res = run_backtest(df, "bollinger_mid", backtest_months)
-
-        sl_price = mid_now * 0.97
-
-        rr = calculate_risk_reward(c_now, sl_price, df.index[-1], custom_target=upper_now)
-
-        
-
-        return {
-
-            "代號": ticker, "名稱": name, "現價": round(c_now, 2), 
-
-            "布林中線": round(mid_now, 2), 
-
-            "布林上軌": round(upper_now, 2),
-
-            **rr, **(bt_res or {}), 
-
-            "外資詳情": get_chip_link(ticker), 
-
-            "狀態": "中線黑K量縮 🌀"
-
-        }
-
-    except Exception: return None
-
-
-
-# === 修改重點：加入乖離率 < 6% 過濾 ===
-
-def strategy_washout_rebound(ticker, name, df, backtest_months):
-
-    try:
-
-        if len(df) < 125: return None
-
-        close = df["Close"]; open_p = df["Open"]; volume = df["Volume"]
-
-        if float(volume.iloc[-1]) < 500_000: return None
-
-        ma5 = ta.trend.sma_indicator(close, 5)
-
-        ma10 = ta.trend.sma_indicator(close, 10)
-
-        ma20 = ta.trend.sma_indicator(close, 20)
-
-        ma60 = ta.trend.sma_indicator(close, 60)
-
-        ma120 = ta.trend.sma_indicator(close, 120)
-
-        c_now = float(close.iloc[-1]); ma5_now = ma5.iloc[-1]
-
-        c_prev = float(close.iloc[-2]); o_prev = float(open_p.iloc[-2])
-
-        v_curr = float(volume.iloc[-1]); v_prev = float(volume.iloc[-2]); v_prev_2 = float(volume.iloc[-3])
-
-        
-
-        if c_prev >= o_prev: return None 
-
-        if v_prev <= v_prev_2: return None 
-
-        if c_prev < ma5.iloc[-2]: return None 
-
-        if c_now < ma5_now: return None 
-
-        if v_curr >= v_prev: return None 
-
-        if not (c_now > ma5_now and c_now > ma10.iloc[-1] and c_now > ma20.iloc[-1] and c_now > ma60.iloc[-1] and c_now > ma120.iloc[-1]): return None
-
-        
-
-        # --- [NEW] 新增乖離率過濾 ---
-
-        # 邏輯：現價距離 5MA 不超過 6%
-
-        bias_5 = ((c_now - ma5_now) / ma5_now) * 100
-
-        if bias_5 > 4: return None
-
-        # ---------------------------
-
-
-
-        bt_res = run_backtest(df, "washout", backtest_months)
-
-        rr = calculate_risk_reward(c_now, ma5_now, df.index[-1])
-
-        
-
-        return {
-
-            "代號": ticker, 
-
-            "名稱": name, 
-
-            "現價": round(c_now, 2), 
-
-            "5日乖離率": f"{round(bias_5, 2)}%",  # 顯示乖離率
-
-            **rr, 
-
-            **(bt_res or {}), 
-
-            "外資詳情": get_chip_link(ticker), 
-
-            "狀態": "強勢洗盤 🛁"
+st.sidebar.header("股票來源")
 
-        }
+source = st.sidebar.radio("選擇", profiles.SOURCES, profiles.SOURCES.index(profile.source), key=f"source_{pk}")
 
-    except: return None
+raw = ", ".join(profile.tickers)
 
+sectors = list(profile.industries)
 
+limit = profile.limit
 
-def strategy_consolidation(ticker, name, df, backtest_months):
 
-    try:
 
-        if len(df) < 130: return None
+# 名稱庫由 scanner 在行程內共用 (每個交易日抓一次)
 
-        close = df["Close"]; open_p = df["Open"]; high = df["High"]; volume = df["Volume"]
+if source == "手動":
 
-        if float(volume.iloc[-1]) < 500_000: return None
+    raw = st.sidebar.text_area("股票代碼 (可輸入代號或名稱)", raw, key=f"raw_{pk}")
 
-        c_now = float(close.iloc[-1])
+    queries = scanner.ticker_index.parse_tickers(raw)
 
-        ma5 = ta.trend.sma_indicator(close, 5).iloc[-1]
+    with st.spinner("載入名稱庫..."):
 
-        ma10 = ta.trend.sma_indicator(close, 10).iloc[-1]
+        index = scanner.get_ticker_index()
 
-        ma20 = ta.trend.sma_indicator(close, 20).iloc[-1]
+    if index is None:
 
-        ma60 = ta.trend.sma_indicator(close, 60).iloc[-1]
+        # 名稱庫抓不到：不驗證，照輸入送出，名稱在背景掃描時再查
 
-        ma120 = ta.trend.sma_indicator(close, 120).iloc[-1]
+        tickers = queries
 
-        
+        stock_map = None
 
-        if not (c_now > ma5 and c_now > ma10 and c_now > ma20 and c_now > ma60 and c_now > ma120): return None
+        st.sidebar.caption("⚠️ 名稱庫暫時無法載入，代號未驗證")
 
-        
+    else:
 
-        ma_vals = [ma5, ma10, ma20]
+        # 打錯或不存在的代號在這裡擋下，不佔下載批次
 
-        if (max(ma_vals) - min(ma_vals)) / c_now > 0.06: return None
+        tickers, invalid = index.validate(queries)
 
-        
+        stock_map = {t: index.name(t) for t in tickers}
 
-        resistance = float(high.iloc[:-1].tail(20).max())
+        for q, suggestions in invalid.items():
 
-        if c_now <= resistance: return None
+            hint = "、".join(f"{t} {index.name(t)}" for t in suggestions)
 
-        
+            st.sidebar.warning(f"找不到「{q}」" + (f"，是不是：{hint}" if hint else "")
 
-        vol_ma5 = float(volume.rolling(5).mean().iloc[-2])
+                               + ("；ETF 等不在清單的代號請加上 .TW / .TWO" if q[:1].isdigit() and "." not in q else ""))
 
-        if float(volume.iloc[-1]) < vol_ma5 * 1.5: return None
+        unlisted = index.unlisted(tickers)
 
-        if c_now < float(open_p.iloc[-1]): return None 
+        if unlisted: st.sidebar.caption(f"⚠️ 不在上市上櫃股票清單，照輸入下載：{'、'.join(unlisted)}")
 
-        
+        if tickers:
 
-        bt_res = run_backtest(df, "consolidation", backtest_months)
+            st.sidebar.caption("將掃描：" + "、".join(f"{t} {stock_map[t]}" for t in tickers))
 
-        rr = calculate_risk_reward(c_now, ma5, df.index[-1])
+        query = st.sidebar.text_input("🔍 查詢代號 / 名稱")
 
-        return {"代號": ticker, "名稱": name, "現價": round(c_now, 2), **rr, **(bt_res or {}), "狀態": "帶量突破 📦", "外資詳情": get_chip_link(ticker)}
+        if query:
 
-    except: return None
+            found = index.search(query)
 
+            st.sidebar.caption("　".join(f"{t} {index.name(t)}" for t in found) if found else "查無符合的股票")
 
+else:
 
-def strategy_weekly_breakout(ticker, name, df_daily, backtest_months):
+    if st.sidebar.button("重抓上市上櫃清單"):
 
-    try:
+        with st.spinner("更新清單中..."):
 
-        df_weekly = df_daily.resample('W').agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+            scanner.get_all_tw_tickers(refresh=True)
 
-        if len(df_weekly) < 30: return None
+            st.rerun()
 
-        close = df_weekly['Close']; volume = df_weekly['Volume']
+    with st.spinner("載入名稱庫..."):
 
-        ma5 = ta.trend.sma_indicator(close, 5); ma10 = ta.trend.sma_indicator(close, 10); ma20 = ta.trend.sma_indicator(close, 20)
+        index = scanner.get_ticker_index()
 
-        c_now = float(close.iloc[-1]); v_now = float(volume.iloc[-1]); v_prev = float(volume.iloc[-2])
+    stock_map = index.stock_map() if index else {}
 
-        ma5_now = ma5.iloc[-1]; ma10_now = ma10.iloc[-1]; ma20_now = ma20.iloc[-1]
+    st.sidebar.write(f"目前快取: {len(stock_map)} 檔")
 
-        
+    # 只掃選到的產業，縮小全市場掃描的範圍
 
-        if not (c_now > ma5_now and c_now > ma10_now and c_now > ma20_now): return None
+    counts = index.industries() if index else {}
 
-        if v_now <= v_prev * 2.8: return None
+    sectors = st.sidebar.multiselect("產業 (不選 = 全部)", list(counts), [s for s in sectors if s in counts],
 
-        
+                                     format_func=lambda s: f"{s} ({counts[s]})", key=f"sectors_{pk}")
 
-        rr = calculate_risk_reward(c_now, ma5_now, df_weekly.index[-1])
+    universe = index.tickers_in(sectors) if sectors else list(stock_map)
 
-        return {"代號": ticker, "名稱": name, "現價": round(c_now, 2), **rr, "回測勝率": "N/A", "平均獲利": "-", "總交易": "-", "本週量(張)": int(v_now/1000), "爆量倍數": f"{round(v_now/v_prev, 1)}倍", "外資詳情": get_chip_link(ticker), "狀態": "週線爆量 🔥"}
+    limit = st.sidebar.slider("掃描數量", 50, 2000, min(max(limit, 50), 2000), key=f"limit_{pk}")
 
-    except: return None
+    tickers = universe[:limit]
 
 
 
-# === 週線回檔守5MA (含回測功能 + 乖離率過濾) ===
+st.sidebar.header("策略選擇")
 
-def strategy_weekly_pullback(ticker, name, df_daily, backtest_months):
+# 盤中策略要另外抓分K，預設不勾
 
-    try:
+selected = [k for k in scanner.STRATEGIES if st.sidebar.checkbox(k, k in profile.selected(), key=f"{k}_{pk}")]
 
-        # 1. 轉換為週線
 
-        df_weekly = df_daily.resample('W').agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
 
-        
+st.sidebar.markdown("---")
 
-        # 為了回測，我們需要多一點資料
+backtest_period = st.sidebar.selectbox(
 
-        if len(df_weekly) < 40: return None
+    "回測區間 (月)", 
 
-        
+    profiles.BACKTEST_MONTHS, 
 
-        close = df_weekly['Close']
+    profiles.BACKTEST_MONTHS.index(profile.backtest_months) if profile.backtest_months in profiles.BACKTEST_MONTHS else 0,
 
-        open_p = df_weekly['Open']
+    format_func=lambda x: f"過去 {x} 個月",
 
-        high = df_weekly['High']
+    key=f"backtest_{pk}"
 
-        volume = df_weekly['Volume']
+)
 
+diff_mode = st.sidebar.checkbox("只回報訊號變化 (與上次掃描比較)", profile.diff, key=f"diff_{pk}")
 
 
-        # 2. 計算指標
 
-        ma5 = ta.trend.sma_indicator(close, 5)
+# 目前的選擇存成設定檔 (同名覆蓋)；排程 / 預熱 用 python profiles.py 讀同一個檔
 
-        ma20 = ta.trend.sma_indicator(close, 20)
+with st.sidebar.expander("💾 儲存設定檔"):
 
+    new_name = st.text_input("設定檔名稱", "" if profile_name == "(自訂)" else profile_name, key=f"name_{pk}")
 
+    schedule = st.text_input("排程時間 (HH:MM，逗號分隔，可留空)", ", ".join(profile.schedule), key=f"schedule_{pk}")
 
-        # 3. 取得數據 (T=本週, T-1=上週)
+    c1, c2 = st.columns(2)
 
-        c_now = float(close.iloc[-1]); o_now = float(open_p.iloc[-1]); v_now = float(volume.iloc[-1])
+    times, invalid = profiles.parse_schedule(schedule)
 
-        ma5_now = float(ma5.iloc[-1]); ma20_now = float(ma20.iloc[-1])
+    if c1.button("儲存", disabled=not new_name.strip() or new_name.strip() == "(自訂)"):
 
+        profiles.save_profile(profiles.ScanProfile(
 
+            new_name.strip(), source,
 
-        c_prev = float(close.iloc[-2]); o_prev = float(open_p.iloc[-2])
+            tuple(scanner.ticker_index.parse_tickers(raw)) if source == "手動" else profile.tickers,
 
-        h_prev = float(high.iloc[-2]); v_prev = float(volume.iloc[-2])
+            tuple(sectors), limit, tuple(selected), backtest_period, diff_mode,
 
-        ma5_prev = float(ma5.iloc[-2])
+            tuple(times),
 
+        ))
 
+        st.success(f"已儲存「{new_name.strip()}」")
 
-        # 4. 篩選邏輯
+        if invalid: st.warning(f"看不懂的排程時間已略過：{'、'.join(invalid)}")
 
-        # 成交量過濾：上週成交量需 > 10萬張 (100,000 * 1000 股)
+    if profile_name in saved_profiles and c2.button("刪除"):
 
-        if v_prev < 100000 * 1000: return None
+        profiles.delete_profile(profile_name)
 
+        st.rerun()
 
 
-        if c_now < ma20_now: return None
 
+# 部位試算只用已掃出的結果計算，改參數不必重掃
 
+with st.sidebar.expander("💰 部位試算"):
 
-        # 上週 (T-1): 紅K + 在 5MA 之上
+    equity = st.number_input("帳戶權益 (元)", min_value=0, value=1_000_000, step=100_000)
 
-        if not (c_prev > o_prev): return None
+    risk_pct = st.number_input("單筆風險 (%)", min_value=0.1, max_value=10.0, value=1.0, step=0.1)
 
-        if not (c_prev > ma5_prev): return None
+    heat_pct = st.number_input("總風險上限 (%)", min_value=0.5, max_value=50.0, value=6.0, step=0.5)
 
+    max_position_pct = st.number_input("單檔投入上限 (%)", min_value=1.0, max_value=100.0, value=20.0, step=1.0)
 
+    odd_lot = st.checkbox("允許零股", False)
 
-        # 本週 (T): 黑K + 量縮 + 守 5MA
+    usd_twd = st.number_input("美元匯率 (台幣，0 = 美股不試算)", min_value=0.0, value=0.0, step=0.1)
 
-        if not (c_now < o_now): return None
 
-        if not (v_now < v_prev): return None
 
-        if not (c_now > ma5_now): return None
+# -------------------------------------------------
 
+# 背景掃描：按鈕只負責送出工作，結果由輪詢畫出
 
+# -------------------------------------------------
 
-        # --- [NEW] 新增乖離率過濾 ---
+def show_scan(job_id):
 
-        # 邏輯：雖然股價守在 5MA 之上，但不能離太遠 (避免買在乖離過大處)
+    job = scanner.get_worker().get(job_id)
 
-        bias_5t = ((c_now - ma5_now) / ma5_now) * 100
+    if job is None: return
 
-        
+    snap = job.snapshot()
 
-        # 如果乖離率超過 7%，直接剔除
+    # 部分結果同步到 session state，其他元件 (匯出等) 可直接使用
 
-        if bias_5t > 7: return None
+    st.session_state["scan_results"] = snap["results"]
 
-        # ---------------------------
+    if snap["resumed_batches"]:
 
+        st.info(f"從上次中斷處續掃 (已完成 {snap['resumed_batches']} 批)")
 
+    if job.running:
 
-        # 5. 執行週線回測
+        st.progress(snap["progress"], text=snap["message"])
 
-        bt_res = run_backtest(df_weekly, "weekly_pullback", backtest_months)
+        if st.button("停止掃描"): job.cancel()
 
+    elif snap["status"] == "error":
 
+        st.error(f"掃描失敗：{snap['error']}")
 
-        # 6. 計算風控
+    elif snap["status"] == "cancelled":
 
-        sl_price = ma5_now
+        st.warning("掃描已取消，以下為已完成部分的結果。")
 
-        tp_price = h_prev # 目標：過上週高
+    if snap["failed"]:
 
-        
+        st.caption(f"⚠️ {len(snap['failed'])} 檔無法取得資料：{', '.join(snap['failed'][:20])}")
 
-        rr = calculate_risk_reward(c_now, sl_price, df_weekly.index[-1], custom_target=tp_price)
+    results = snap["results"]
 
-        
+    changes = [r.get("訊號變化") for rows in results.values() for r in rows if r.get("訊號變化")]
 
-        return {
+    if changes:
 
-            "代號": ticker, 
+        signal_store = scanner.signal_store
 
-            "名稱": name, 
+        st.caption(f"{signal_store.SIGNAL_NEW} {changes.count(signal_store.SIGNAL_NEW)} ／ "
 
-            "現價": round(c_now, 2), 
+                   f"{signal_store.SIGNAL_PERSIST} {changes.count(signal_store.SIGNAL_PERSIST)} ／ "
 
-            "5週乖離率": f"{round(bias_5t, 2)}%", # 顯示
+                   f"{signal_store.SIGNAL_DROPPED} {changes.count(signal_store.SIGNAL_DROPPED)}")
 
-            **rr,
+        if st.checkbox("隱藏持續中的訊號", True, key=f"hide_persist_{job_id}"):
 
-            **(bt_res or {}),
+            results = {k: [r for r in rows if r.get("訊號變化") != signal_store.SIGNAL_PERSIST] for k, rows in results.items()}
 
-            "本週量(張)": int(v_now/1000),
+    rs_pct = scanner.rs_percentiles(snap["panel"])
 
-            "上週量(張)": int(v_prev/1000),
+    if rs_pct:
 
-            "外資詳情": get_chip_link(ticker), 
+        min_pct = st.slider(f"只顯示 RS 百分位 ≥ (相對 {scanner.BENCHMARK} 的 {scanner.RS_RANK_BY} 排名)", 0, 100, 0, step=5, key=f"min_rs_{job_id}")
 
-            "狀態": "週線回檔守5MA 🛡️"
+        if min_pct:
 
-        }
+            results = {k: [r for r in rows if rs_pct.get(r.get("代號"), -1) >= min_pct] for k, rows in results.items()}
 
-    except Exception: return None
+    # 籌碼：三大法人近 5 日合計買超
 
+    if any(r.get("法人5日(張)") is not None for rows in results.values() for r in rows):
 
+        if st.checkbox("只顯示三大法人近 5 日買超", False, key=f"insti_buy_{job_id}"):
 
-# -------------------------------------------------
+            results = {k: [r for r in rows if (r.get("法人5日(張)") or 0) > 0] for k, rows in results.items()}
 
-# 策略集合
+    render_quality(snap["quality"])
 
-# -------------------------------------------------
+    render_sectors(snap["panel"], results)
 
-STRATEGIES = {
+    render_results(results, job.selected, finished=not job.running, rs_pct=rs_pct)
 
-    # 已移除布林下軌策略
+    render_sizing(results, rs_pct)
 
-    "🌀 布林中線 (量縮黑K)": strategy_bollinger_mid,
+    render_downloads(snap["exports"], finished=not job.running)
 
-    "🛁 爆量回檔 (洗盤)": strategy_washout_rebound,
 
-    "📦 日線盤整突破": strategy_consolidation,
 
-    "🔥 週線盤整突破 (爆量2.8倍)": strategy_weekly_breakout,
+def render_quality(quality):
 
-    "🛡️ 週線回檔守 5MA (New!)": strategy_weekly_pullback, 
+    if not quality: return
 
-}
+    actions = [r["處理"] for r in quality]
 
+    dq = scanner.data_quality
 
+    with st.expander(f"🧪 資料品質：{dq.QUARANTINED} {actions.count(dq.QUARANTINED)} 檔、"
 
-# -------------------------------------------------
+                     f"{dq.REPAIRED} {actions.count(dq.REPAIRED)} 檔、{dq.NOTICE} {actions.count(dq.NOTICE)} 檔"):
 
-# UI 介面
+        st.dataframe(scanner.pd.DataFrame(quality).fillna(0), use_container_width=True)
 
-# -------------------------------------------------
 
-st.sidebar.header("股票來源")
 
-source = st.sidebar.radio("選擇", ["手動", "全市場"])
+def render_sectors(panel, results):
 
+    summary = scanner.sector_summary(panel, results)
 
+    if summary is None: return
 
-if source == "手動":
+    with st.expander(f"🏭 產業強弱 ({len(summary)} 個產業，站上均線比例 / 訊號數)"):
 
-    raw = st.sidebar.text_area("股票代碼", "2330.TW, 2317.TW, 2603.TW")
+        st.dataframe(summary, use_container_width=True)
 
-    tickers = [x.strip() for x in raw.split(",") if x.strip()]
 
-    full_map = st.session_state.get("stock_map", {})
 
-    if not full_map:
+def render_sizing(results, rs_pct):
 
-        with st.spinner("載入名稱庫..."):
+    hits = [r for k in results for r in results[k]]
 
-            st.session_state["stock_map"] = get_all_tw_tickers()
+    if not hits or not equity: return
 
-            full_map = st.session_state["stock_map"]
+    sizing = scanner.sizing
 
-    stock_map = {}
+    # RS 強的先分配風險額度
 
-    for t in tickers:
+    sizes = sizing.position_sizes(hits, equity, risk_pct, heat_pct, max_position_pct, priority=rs_pct, odd_lot=odd_lot,
 
-        stock_map[t] = full_map.get(t, t)
+                                   fx={"US": usd_twd} if usd_twd else None)
 
-else:
+    if sizes.empty: return
 
-    if st.sidebar.button("重抓上市上櫃清單"):
+    total = sizing.summary(sizes, equity)
 
-        with st.spinner("更新清單中..."):
+    with st.expander(f"💰 部位試算：{total['檔數']} 檔，投入 {total['總投入']:,.0f} 元 ({total['投入占比(%)']}%)，"
 
-            st.session_state["stock_map"] = get_all_tw_tickers()
+                     f"總風險 {total['總風險']:,.0f} 元 ({total['總風險(%)']}%)"):
 
-            st.rerun()
+        st.dataframe(sizes, use_container_width=True, hide_index=True)
 
-    stock_map = st.session_state.get("stock_map", {})
 
-    if not stock_map:
 
-        st.session_state["stock_map"] = get_all_tw_tickers()
+def render_downloads(exports, finished):
 
-        stock_map = st.session_state["stock_map"]
+    # Parquet 要等寫入結束 (檔尾) 才是完整檔案
 
-    st.sidebar.write(f"目前快取: {len(stock_map)} 檔")
+    formats = [("csv", "text/csv"), ("jsonl", "application/x-ndjson")] + ([("parquet", "application/octet-stream")] if finished else [])
 
-    limit = st.sidebar.slider("掃描數量", 50, 2000, 300)
+    cols = st.columns(len(formats))
 
-    tickers = list(stock_map.keys())[:limit]
+    for col, (fmt, mime) in zip(cols, formats):
 
+        path = exports.get(fmt)
 
+        if not path or not os.path.exists(path): continue
 
-st.sidebar.header("策略選擇")
+        with open(path, "rb") as f:
 
-selected = [k for k in STRATEGIES if st.sidebar.checkbox(k, True)]
+            col.download_button(f"⬇️ 下載 {fmt.upper()}", f.read(), file_name=os.path.basename(path), mime=mime, key=f"dl_{fmt}")
 
 
 
-st.sidebar.markdown("---")
+@st.fragment(run_every=1.0)
 
-backtest_period = st.sidebar.selectbox(
+def poll_scan(job_id):
 
-    "回測區間 (月)", 
+    job = scanner.get_worker().get(job_id)
 
-    [3, 6, 9, 12, 24], 
+    # 掃描結束後整頁重跑一次，停止輪詢
 
-    format_func=lambda x: f"過去 {x} 個月"
+    if job is None or not job.running: st.rerun()
 
-)
+    show_scan(job_id)
 
 
 
@@ -1012,162 +612,24 @@ if st.button("開始掃描", type="primary"):
 
     else:
 
-        result = {k: [] for k in selected}
-
-        progress_bar = st.progress(0)
-
-        status_text = st.empty()
-
-        
-
-        batch_size = 50 
-
-        total_tickers = len(tickers)
-
-        
-
-        for i in range(0, total_tickers, batch_size):
-
-            current_progress = min((i + batch_size) / total_tickers, 1.0)
-
-            progress_bar.progress(current_progress)
-
-            
-
-            batch_tickers = tickers[i : i + batch_size]
-
-            status_text.text(f"正在下載第 {i+1} ~ {min(i+batch_size, total_tickers)} 檔資料...")
-
-            
-
-            data_dict = download_batch_data(batch_tickers)
-
-            if not data_dict:
-
-                time.sleep(1)
-
-                continue
-
-
-
-            for t, df in data_dict.items():
-
-                name = stock_map.get(t, t)
-
-                for k in selected:
-
-                    try:
-
-                        r = STRATEGIES[k](t, name, df, backtest_period)
-
-                        if r:
-
-                            r["策略"] = k
-
-                            result[k].append(r)
-
-                    except Exception:
-
-                        continue
-
-            
-
-            time.sleep(0.5)
-
-
-
-        progress_bar.empty()
-
-        status_text.empty()
-
-        
-
-        has_data = False
-
-        for k in selected:
-
-            if result[k]:
-
-                has_data = True
-
-                st.subheader(f"📊 {k}")
-
-                df_res = pd.DataFrame(result[k])
-
-                
-
-                # 欄位顯示名稱更新
-
-                base_cols = ["代號", "名稱", "現價", "停損價(SL)", "停利價(TP)", "外資詳情"]
-
-                
-
-                if "布林中線" in df_res.columns or "布林中線(10MA)" in df_res.columns:
-
-                      if "布林下軌" in df_res.columns: 
-
-                          target_cols = ["代號", "名稱", "現價", "布林下軌", "布林中線(10MA)", "停損價(SL)", "停利價(TP)", "外資詳情"]
-
-                      else: 
-
-                          target_cols = ["代號", "名稱", "現價", "布林中線", "布林上軌", "停損價(SL)", "停利價(TP)", "外資詳情"]
-
-                elif "爆量倍數" in df_res.columns:
-
-                    target_cols = ["代號", "名稱", "現價", "本週量(張)", "爆量倍數", "停損價(SL)", "停利價(TP)", "外資詳情"]
-
-                elif "上週量(張)" in df_res.columns:
-
-                    # 優先顯示乖離率
-
-                    target_cols = ["代號", "名稱", "現價", "5週乖離率", "本週量(張)", "上週量(張)", "停損價(SL)", "停利價(TP)", "外資詳情"]
-
-                elif "5日乖離率" in df_res.columns:
-
-                    # === 修改重點：加入 5日乖離率 到優先顯示欄位 ===
-
-                    target_cols = ["代號", "名稱", "現價", "5日乖離率", "停損價(SL)", "停利價(TP)", "外資詳情"]
-
-                else:
-
-                    target_cols = base_cols
-
-                
-
-                # 確保欄位存在才選取
-
-                final_cols = [c for c in target_cols if c in df_res.columns]
-
-                
-
-                if "回測勝率" in df_res.columns:
-
-                    final_cols += ["回測勝率", "平均獲利", "總交易"]
-
-                
-
-                other_cols = [c for c in df_res.columns if c not in final_cols and c not in target_cols]
-
-                
+        scan_id = scanner.checkpoint.make_scan_id(tickers, selected, backtest_period, extra=["diff"] if diff_mode else [])
 
-                st.dataframe(
+        signals = scanner.get_signal_store() if diff_mode else None
 
-                    df_res[final_cols + other_cols], 
+        scanner.get_worker().submit(scan_id, selected, scanner.scan_runner(), scan_id, tickers, dict(stock_map) if stock_map is not None else None,
 
-                    use_container_width=True,
+                                    selected, backtest_period, signals, scanner.get_alerts())
 
-                    column_config={
+        st.session_state["scan_job_id"] = scan_id
 
-                        "外資詳情": st.column_config.LinkColumn(
 
-                            "外資詳情", display_text="查看數據"
 
-                        )
+job_id = st.session_state.get("scan_job_id")
 
-                    }
+current_job = scanner.get_worker().get(job_id) if job_id else None
 
-                )
+if current_job is not None:
 
-        if not has_data:
+    if current_job.running: poll_scan(job_id)
 
-            st.info("掃描完成，但沒有符合條件的股票。")
+    else: show_scan(job_id)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------
+# 回測交易清單快取：以K棒內容當鍵，不必知道是哪一檔
+# - 回測只看最後一根之前的K棒 (最後一根盤中會變)，鍵只取回測區間 + 指標暖機那一段
+# - 開盤前預熱先算好「明天多一根K棒」時的交易清單，盤中掃描直接拿來用
+# - 每個 (回測策略, 月數) 一個 JSON 檔，跨行程共用；超過 KEEP_DAYS 沒更新的自動清掉
+# -------------------------------------------------
+BACKTEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "backtests")
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+KEEP_DAYS = 3
+
+
+def window_key(df, lookback, warmup):
+    # 資料比 回測區間 + 暖機 長時只取尾段 (前面的K棒不影響結果)；不夠長就整段 (長度本身會影響回測起點)
+    window = df.iloc[max(len(df) - lookback - warmup - 1, 0):-1]
+    h = hashlib.sha1(window.index.asi8.tobytes())
+    h.update(np.ascontiguousarray(window[COLUMNS].to_numpy(dtype="float64")).tobytes())
+    return h.hexdigest()[:20]
+
+
+class BacktestCache:
+    def __init__(self, root=BACKTEST_DIR):
+        self.root = root
+        self._tables = {}       # (策略, 月數) -> {鍵: [算出的日期, 交易清單]}
+        self._loaded = {}       # (策略, 月數) -> 讀檔時的 mtime
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, strategy, months):
+        return os.path.join(self.root, f"{strategy}_{months}m.json")
+
+    def _read(self, strategy, months):
+        try:
+            with open(self._path(strategy, months), encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _mtime(self, strategy, months):
+        try:
+            return os.path.getmtime(self._path(strategy, months))
+        except OSError:
+            return None
+
+    def _table(self, strategy, months):
+        # 檔案被別的行程 (例：開盤前預熱) 更新過就重讀，併進記憶體中的表
+        key = (strategy, months)
+        mtime = self._mtime(strategy, months)
+        if key not in self._tables or self._loaded.get(key) != mtime:
+            self._tables[key] = {**self._read(strategy, months), **self._tables.get(key, {})}
+            self._loaded[key] = mtime
+        return self._tables[key]
+
+    def get(self, strategy, months, key):
+        # 回傳 (有沒有快取, 交易清單)；交易清單 None = 資料不足無法回測
+        with self._lock:
+            entry = self._table(strategy, months).get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, strategy, months, key, trades):
+        with self._lock:
+            self._table(strategy, months)[key] = [pd.Timestamp.today().strftime('%Y-%m-%d'), trades]
+            self._dirty.add((strategy, months))
+
+    def flush(self):
+        # 其他行程 (預熱 / 另一個 UI) 可能也寫過同一個檔：先合併再寫回
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            cutoff = (pd.Timestamp.today() - pd.Timedelta(days=KEEP_DAYS)).strftime('%Y-%m-%d')
+            for strategy, months in dirty:
+                table = {**self._read(strategy, months), **self._tables[(strategy, months)]}
+                table = {k: v for k, v in table.items() if v[0] >= cutoff}
+                self._tables[(strategy, months)] = table
+                os.makedirs(self.root, exist_ok=True)
+                tmp = f"{self._path(strategy, months)}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(table, f)
+                os.replace(tmp, self._path(strategy, months))
+                self._loaded[(strategy, months)] = self._mtime(strategy, months)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": sum(len(t) for t in self._tables.values()), "hits": self.hits, "misses": self.misses}
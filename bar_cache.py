@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import pandas as pd
+
+import market_calendar
+
+# -------------------------------------------------
+# 跨 session 共用的 K 棒快取 (由 st.cache_resource 持有)
+# - 到期時間依交易日曆：盤中 / 未定案短 TTL，已定案保留到下次開盤
+# - 超過記憶體預算時依 LRU 淘汰
+# - 同一檔正在下載時，其他請求等同一個下載結果 (request coalescing)
+# -------------------------------------------------
+
+
+class BarCache:
+    def __init__(self, max_bytes=512 * 1024 * 1024, expiry_fn=market_calendar.cache_expiry, wait_timeout=120):
+        self.max_bytes = max_bytes
+        self.expiry_fn = expiry_fn
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()   # ticker -> (df, since, expires_at, nbytes)
+        self._inflight = {}             # ticker -> Future[(df, since)]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _valid(self, entry, start):
+        df, since, expires_at, _ = entry
+        return expires_at > time.time() and since <= start
+
+    def _put(self, ticker, df, since):
+        self._drop(ticker)
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        self._entries[ticker] = (df, since, self.expiry_fn(ticker, df), nbytes)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, ticker):
+        entry = self._entries.pop(ticker, None)
+        if entry is not None: self._bytes -= entry[3]
+
+    def get_many(self, tickers, start, loader):
+        # loader(tickers, start) -> {ticker: df}，只會拿到真正需要下載的代號
+        start = pd.Timestamp(start)
+        result, mine, waiting = {}, [], {}
+        with self._lock:
+            for t in tickers:
+                entry = self._entries.get(t)
+                if entry is not None and self._valid(entry, start):
+                    self._entries.move_to_end(t)
+                    result[t] = entry[0]
+                    self.hits += 1
+                elif t in self._inflight:
+                    waiting[t] = self._inflight[t]
+                else:
+                    self._inflight[t] = Future()
+                    mine.append(t)
+                    self.misses += 1
+
+        if mine:
+            try:
+                loaded = loader(mine, start)
+            except Exception:
+                loaded = {}
+            with self._lock:
+                for t in mine:
+                    df = loaded.get(t)
+                    if df is not None: self._put(t, df, start)
+                    self._inflight.pop(t).set_result((df, start))
+            for t in mine:
+                if loaded.get(t) is not None: result[t] = loaded[t]
+
+        # 別人正在抓的：等同一個結果，區間不夠長才自己補抓
+        short = []
+        for t, fut in waiting.items():
+            try:
+                df, since = fut.result(timeout=self.wait_timeout)
+            except Exception:
+                df, since = None, start
+            if df is None: continue
+            if since <= start: result[t] = df
+            else: short.append(t)
+        if short:
+            result.update(self.get_many(short, start, loader))
+
+        return {t: df[df.index >= start] for t, df in result.items()}
+
+    def invalidate(self, tickers=None):
+        with self._lock:
+            for t in list(self._entries) if tickers is None else tickers:
+                self._drop(t)
+
+    def stats(self):
+        with self._lock:
+            return {"tickers": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+
+import market_calendar
+
+# -------------------------------------------------
+# 本地 K 棒倉庫：每檔一個 parquet，記錄已涵蓋的起始日
+# 存的是未還原的原始K棒，除權息因子見 adjustments
+# -------------------------------------------------
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "bars")
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+OVERLAP_BARS = 5     # 補尾段時多抓幾根舊K棒，用來比對除權息 / 分割
+
+
+def _path(ticker):
+    return os.path.join(STORE_DIR, f"{ticker}.parquet")
+
+
+def load_bars(ticker):
+    try:
+        df = pd.read_parquet(_path(ticker))
+    except Exception:
+        return None
+    # 舊版倉庫存的是還原後價格，不能和原始K棒混用，當作沒有資料重抓
+    return df if df.attrs.get("prices") == "raw" else None
+
+
+def save_bars(ticker, df, since):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    df = df[[c for c in COLUMNS if c in df]]
+    df.attrs["prices"] = "raw"
+    # since = 已經向資料源要過的最早日期 (新上市股票的第一根K棒可能比 since 晚)
+    # fetched_at = 抓取時間，用來判斷最後一根是不是收盤後才抓的定案資料
+    df.attrs["since"] = pd.Timestamp(since).strftime('%Y-%m-%d')
+    df.attrs["fetched_at"] = pd.Timestamp.now(tz="UTC").isoformat()
+    tmp = f"{_path(ticker)}.{os.getpid()}.tmp"
+    df.to_parquet(tmp)
+    os.replace(tmp, _path(ticker))
+    return df
+
+
+def covered_since(df):
+    if df is None or df.empty or "since" not in df.attrs: return None
+    return pd.Timestamp(df.attrs["since"])
+
+
+def fetch_start(ticker, df, start):
+    # 回傳這檔需要從哪一天開始下載；None = 倉庫資料已定案，不用下載
+    since = covered_since(df)
+    if since is None or since > start: return start
+    if market_calendar.bar_status(ticker, df) == market_calendar.FINAL: return None
+    # 已涵蓋起始日：只補最後幾根(盤中 / 缺最新交易日)之後的區間
+    return df.index[max(len(df) - OVERLAP_BARS, 0)]
+
+
+def merge_bars(old, new):
+    if old is None or old.empty: return new
+    if new is None or new.empty: return old
+    df = pd.concat([old, new])
+    return df[~df.index.duplicated(keep="last")].sort_index()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# -------------------------------------------------
+# 啟動時間量測：
+# - 冷啟動 import scanner (獨立子行程，每次都是乾淨的 sys.modules)
+# - Streamlit 第一次執行 app.py 與之後每次重跑 (AppTest，不開瀏覽器)
+# 用法：python bench_startup.py [--runs 5] [--max-import-ms 100] [--max-rerun-ms 200]
+# -------------------------------------------------
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); import scanner; "
+    "print((time.perf_counter() - t) * 1000, int(any(m in sys.modules for m in ('pandas', 'yfinance', 'ta'))))"
+)
+
+
+def bench_import(runs):
+    times = []
+    heavy = False
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=HERE, capture_output=True, text=True, check=True)
+        ms, loaded = out.stdout.split()
+        times.append(float(ms))
+        heavy = heavy or loaded == "1"
+    return times, heavy
+
+
+def bench_app(runs):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=30)
+    t = time.perf_counter()
+    at.run()
+    first = (time.perf_counter() - t) * 1000
+    reruns = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        at.run()
+        reruns.append((time.perf_counter() - t) * 1000)
+    if at.exception: raise RuntimeError(at.exception[0].value)
+    return first, reruns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測 scanner 冷啟動與 app.py 重跑時間")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-rerun-ms", type=float, default=None)
+    parser.add_argument("--skip-app", action="store_true", help="只量 import (沒裝 Streamlit 時)")
+    args = parser.parse_args(argv)
+
+    import_times, heavy = bench_import(args.runs)
+    import_ms = statistics.median(import_times)
+    print(f"import scanner (冷啟動)  中位數 {import_ms:7.1f} ms  最大 {max(import_times):7.1f} ms")
+    if heavy: print("  ⚠️ import scanner 時已載入 pandas / yfinance / ta")
+
+    failed = heavy
+    if args.max_import_ms is not None and import_ms > args.max_import_ms: failed = True
+
+    if not args.skip_app:
+        first, reruns = bench_app(args.runs)
+        rerun_ms = statistics.median(reruns)
+        print(f"app.py 第一次執行        {first:7.1f} ms")
+        print(f"app.py 重跑              中位數 {rerun_ms:7.1f} ms  最大 {max(reruns):7.1f} ms")
+        if args.max_rerun_ms is not None and rerun_ms > args.max_rerun_ms: failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
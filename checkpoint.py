@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+# -------------------------------------------------
+# 掃描斷點：每批完成就寫入磁碟，中斷後同參數重掃會從斷點續跑
+# -------------------------------------------------
+SCAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "scans")
+
+
+def make_scan_id(tickers, selected, backtest_months, day=None, extra=()):
+    # 同一天、同清單、同策略、同回測區間 (+ 其他掃描選項) = 同一次掃描
+    day = day or pd.Timestamp.today().strftime('%Y-%m-%d')
+    key = json.dumps([day, list(tickers), list(selected), backtest_months, list(extra)], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def prune_scans(root=SCAN_DIR, max_age_days=3):
+    # 清掉幾天前留下的斷點
+    if not os.path.isdir(root): return
+    cutoff = time.time() - max_age_days * 86400
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.getmtime(path) < cutoff: shutil.rmtree(path, ignore_errors=True)
+
+
+class ScanCheckpoint:
+    def __init__(self, scan_id, root=SCAN_DIR):
+        self.scan_id = scan_id
+        self.dir = os.path.join(root, scan_id)
+        self.state = self._load_state()
+        # 已經跑完的掃描不續跑，重新開始
+        if self.state["complete"]: self.reset()
+
+    @property
+    def _state_path(self):
+        return os.path.join(self.dir, "state.json")
+
+    @property
+    def _hits_path(self):
+        return os.path.join(self.dir, "hits.jsonl")
+
+    @property
+    def _panel_path(self):
+        return os.path.join(self.dir, "panel.jsonl")
+
+    @property
+    def _quality_path(self):
+        return os.path.join(self.dir, "quality.jsonl")
+
+    def _load_state(self):
+        try:
+            with open(self._state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {"done": [], "failed": [], "complete": False}
+
+    def _save_state(self):
+        os.makedirs(self.dir, exist_ok=True)
+        tmp = self._state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self._state_path)
+
+    def reset(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.state = {"done": [], "failed": [], "complete": False}
+
+    @property
+    def resumed(self):
+        return bool(self.state["done"])
+
+    @property
+    def failed(self):
+        return list(self.state["failed"])
+
+    def is_done(self, batch_no):
+        return batch_no in self.state["done"]
+
+    @staticmethod
+    def _read_jsonl(path):
+        rows = []
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip(): rows.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return rows
+
+    @staticmethod
+    def _append_jsonl(path, rows):
+        with open(path, "a", encoding="utf-8") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False, default=str) + "\n")
+
+    def load_hits(self):
+        return self._read_jsonl(self._hits_path)
+
+    def load_panel(self):
+        # 重試批次會再寫一次同一檔，以最後一次為準
+        rows = {r["代號"]: r for r in self._read_jsonl(self._panel_path)}
+        return list(rows.values())
+
+    def load_quality(self):
+        rows = {r["代號"]: r for r in self._read_jsonl(self._quality_path)}
+        return list(rows.values())
+
+    def record_batch(self, batch_no, tickers, hits, failed, panel=(), quality=()):
+        # 先寫結果再寫狀態：狀態檔只會指向已經落地的結果
+        os.makedirs(self.dir, exist_ok=True)
+        self._append_jsonl(self._hits_path, hits)
+        if panel: self._append_jsonl(self._panel_path, panel)
+        if quality: self._append_jsonl(self._quality_path, quality)
+        failed_now = (set(self.state["failed"]) - set(tickers)) | set(failed)
+        self.state["failed"] = sorted(failed_now)
+        if batch_no is not None and batch_no not in self.state["done"]:
+            self.state["done"].append(batch_no)
+        self._save_state()
+
+    def finish(self):
+        self.state["complete"] = True
+        self._save_state()
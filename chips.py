@@ -0,0 +1,221 @@
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+
+import pandas as pd
+
+import market_calendar
+
+# -------------------------------------------------
+# 籌碼 (三大法人買賣超)：整個市場一天抓一次，存成每日一個 parquet
+# - 上市 + 上櫃合在同一張表：代號、外資、投信、自營商、三大法人 (買賣超股數)
+# - 也可匯入手動下載的 CSV / JSON (證交所、櫃買中心格式)
+# - 讀取時轉成 日期 × 代號 的面板，和價格面板對齊後整批算統計
+# - 掃描時自動補抓有節流：當天的資料公布時間 (PUBLISH_TIME) 之後才抓，同一天抓不到 RETRY_MINUTES 內不重抓
+# 用法：python chips.py update            (補抓最近 20 個交易日)
+#       python chips.py import T86.csv --date 2026-10-16 [--market TWO]
+# -------------------------------------------------
+CHIP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "chips")
+MARKETS = {"TW": ".TW", "TWO": ".TWO"}
+FLOWS = ["外資", "投信", "自營商", "三大法人"]
+CHIP_DAYS = 20          # 保留 / 讀取最近 20 個交易日
+PUBLISH_TIME = pd.Timedelta("16:00:00")    # 證交所 / 櫃買中心約 15:00 ~ 16:00 公布當天資料
+RETRY_MINUTES = 60
+ATTEMPTS_FILE = "attempts.json"         # {日期: 上次嘗試時間}
+CHIP_COLUMNS = ["外資5日(張)", "投信5日(張)", "法人5日(張)", "法人連買(日)", "法人5日占量(%)"]
+
+# 欄位名稱兩個市場寫法不同，用規則比對 (外資不含外資自營商；自營商取合計，不取自行買賣 / 避險)
+RULES = {
+    "外資": lambda f: f.startswith(("外陸資", "外資及陸資")) and "買賣超" in f,
+    "投信": lambda f: f.startswith("投信") and "買賣超" in f,
+    "自營商": lambda f: f.startswith("自營商") and "買賣超" in f and "自行" not in f and "避險" not in f,
+    "三大法人": lambda f: f.startswith("三大法人"),
+}
+
+
+def parse_insti(payload, market):
+    # 證交所：{"fields", "data"}；櫃買中心：{"tables": [{"fields", "data"}]}
+    for table in payload.get("tables") or [payload]:
+        fields = [str(f).strip() for f in table.get("fields") or []]
+        rows = [r for r in table.get("data") or [] if len(r) >= len(fields)]
+        if not fields or not rows: continue
+        code = next((i for i, f in enumerate(fields) if "代號" in f), None)
+        cols = {name: next((i for i, f in enumerate(fields) if rule(f)), None) for name, rule in RULES.items()}
+        if code is None or None in cols.values(): continue
+        df = pd.DataFrame(rows)
+        out = pd.DataFrame({"代號": df[code].astype(str).str.strip() + MARKETS[market]})
+        for name, i in cols.items():
+            out[name] = pd.to_numeric(df[i].astype(str).str.replace(",", "").str.strip(), errors="coerce").fillna(0).astype("int64")
+        return out
+    return None
+
+
+def _path(day, root):
+    return os.path.join(root, f"{pd.Timestamp(day):%Y-%m-%d}.parquet")
+
+
+def save_day(day, df, root=CHIP_DIR):
+    os.makedirs(root, exist_ok=True)
+    tmp = f"{_path(day, root)}.{os.getpid()}.tmp"
+    df.drop_duplicates("代號", keep="last").reset_index(drop=True).to_parquet(tmp)
+    os.replace(tmp, _path(day, root))
+
+
+def recent_days(n=CHIP_DAYS, now=None):
+    # 最近 n 個交易日 (含今天；今天的資料收盤後才公布，沒抓到就下次再補)
+    cal = market_calendar.TW
+    latest = cal.session_date(now)
+    return list(cal.trading_days(latest - pd.Timedelta(days=n * 2 + 14), latest)[-n:])
+
+
+def _read_attempts(root):
+    try:
+        with open(os.path.join(root, ATTEMPTS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _write_attempts(attempts, root):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, ATTEMPTS_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(attempts, f)
+    os.replace(tmp, path)
+
+
+def due_days(days, root=CHIP_DIR, now=None):
+    # 倉庫沒有、已經公布、最近沒試過的日期
+    now = market_calendar.TW._local(now if now is not None else market_calendar.TW.now()).tz_localize(None)
+    attempts = _read_attempts(root)
+    retry_after = (now - pd.Timedelta(minutes=RETRY_MINUTES)).isoformat()
+    return [d for d in days
+            if not os.path.exists(_path(d, root))
+            and pd.Timestamp(d).normalize() + PUBLISH_TIME <= now
+            and attempts.get(f"{pd.Timestamp(d):%Y-%m-%d}", "") < retry_after]
+
+
+def update(days, fetcher, root=CHIP_DIR, throttle=True, now=None):
+    # 只抓倉庫裡沒有的日期；至少一個市場有資料才存 (假日 / 尚未公布的不存，之後會重抓)
+    # throttle：掃描時自動補抓用 (見 due_days)；命令列手動更新不節流
+    missing = due_days(days, root, now) if throttle else [d for d in days if not os.path.exists(_path(d, root))]
+    if not missing: return []
+    if throttle:
+        stamp = market_calendar.TW._local(now if now is not None else market_calendar.TW.now()).tz_localize(None).isoformat()
+        attempts = _read_attempts(root)
+        cutoff = f"{pd.Timestamp(min(days)):%Y-%m-%d}"
+        attempts = {d: t for d, t in attempts.items() if d >= cutoff}
+        _write_attempts({**attempts, **{f"{pd.Timestamp(d):%Y-%m-%d}": stamp for d in missing}}, root)
+    payloads = fetcher.fetch_insti(missing, list(MARKETS))
+    saved = []
+    for day in missing:
+        parts = [parse_insti(payloads[(m, day)], m) for m in MARKETS if (m, day) in payloads]
+        parts = [p for p in parts if p is not None]
+        if not parts: continue
+        save_day(day, pd.concat(parts), root)
+        saved.append(day)
+    return saved
+
+
+def import_file(path, day, market="TW", root=CHIP_DIR):
+    # 手動下載的檔案：JSON (與 API 相同) 或 CSV (前面有標題列，找含「代號」的那列當表頭)
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+    else:
+        for encoding in ("utf-8-sig", "cp950"):
+            try:
+                with open(path, encoding=encoding, newline="") as f:
+                    rows = [[c.strip().lstrip("=").strip('"') for c in r] for r in csv.reader(f)]
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            return None
+        header = next((i for i, r in enumerate(rows) if any("代號" in c for c in r)), None)
+        if header is None: return None
+        payload = {"fields": rows[header], "data": rows[header + 1:]}
+    df = parse_insti(payload, market)
+    if df is None: return None
+    # 同一天另一個市場已經匯入過就合併
+    old = load_day(day, root)
+    if old is not None: df = pd.concat([old[~old["代號"].str.endswith(MARKETS[market])], df])
+    save_day(day, df, root)
+    return df
+
+
+def load_day(day, root=CHIP_DIR):
+    try:
+        return pd.read_parquet(_path(day, root))
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=4)
+def _load_panel(key, root):
+    frames = {day: load_day(day, root) for day, _ in key}
+    frames = {day: df.set_index("代號")[FLOWS] for day, df in frames.items() if df is not None}
+    if not frames: return None
+    long = pd.concat(frames, names=["Date", "代號"])
+    return {c: long[c].unstack("代號").sort_index() for c in FLOWS}
+
+
+def load_panel(days, root=CHIP_DIR):
+    # {欄位: DataFrame(日期 × 代號)}；檔案更新過 (mtime) 才重讀
+    key = tuple((pd.Timestamp(d), os.path.getmtime(_path(d, root))) for d in days if os.path.exists(_path(d, root)))
+    return _load_panel(key, root) if key else None
+
+
+def chip_stats(panel, volume, tickers):
+    # panel = load_panel 的結果；volume = 價格面板的成交量 (日期 × 代號，股)
+    # 回傳 DataFrame (代號 × CHIP_COLUMNS)，沒有籌碼資料的股票為 NaN
+    flows = {c: f.reindex(columns=tickers) for c, f in panel.items()}
+    last5 = {c: f.tail(5).sum(min_count=1) for c, f in flows.items()}
+    total = flows["三大法人"]
+    # 連買天數：從最新一天往回數，第一次沒買超就停
+    streak = (total > 0).iloc[::-1].astype(int).cummin().sum().where(total.notna().any())
+    vol5 = volume.reindex(index=total.index, columns=tickers).tail(5).sum(min_count=1)
+    return pd.DataFrame({
+        "外資5日(張)": (last5["外資"] / 1000).round(0),
+        "投信5日(張)": (last5["投信"] / 1000).round(0),
+        "法人5日(張)": (last5["三大法人"] / 1000).round(0),
+        "法人連買(日)": streak,
+        "法人5日占量(%)": (last5["三大法人"] / vol5 * 100).round(1) + 0.0,
+    }, index=pd.Index(tickers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="三大法人買賣超：抓取 / 匯入")
+    sub = parser.add_subparsers(dest="command", required=True)
+    up = sub.add_parser("update", help="補抓最近幾個交易日 (上市 + 上櫃)")
+    up.add_argument("--days", type=int, default=CHIP_DAYS)
+    imp = sub.add_parser("import", help="匯入手動下載的 CSV / JSON")
+    imp.add_argument("path")
+    imp.add_argument("--date", required=True)
+    imp.add_argument("--market", choices=list(MARKETS), default="TW")
+    args = parser.parse_args(argv)
+
+    if args.command == "update":
+        import fetcher
+        days = recent_days(args.days)
+        saved = update(days, fetcher.AsyncFetcher(), throttle=False)
+        have = sum(os.path.exists(_path(d, CHIP_DIR)) for d in days)
+        print(f"新增 {len(saved)} 天，最近 {len(days)} 個交易日已有 {have} 天")
+        return 0
+    try:
+        df = import_file(args.path, args.date, args.market)
+    except (OSError, ValueError):
+        df = None
+    if df is None:
+        print(f"無法解析 {args.path}")
+        return 1
+    print(f"{args.date} {args.market} 匯入 {len(df)} 檔")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
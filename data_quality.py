@@ -0,0 +1,153 @@
+import functools
+
+import pandas as pd
+
+import market_calendar
+
+# -------------------------------------------------
+# 資料品質檢查：整批K棒接成一張長表，一次做完所有檢查
+# - 可修正的 (重複日期、停牌零量K棒、重複K棒、壞價、高低價不合理) 直接修掉
+# - 修不了的 (資料過期、缺太多交易日、無法解釋的跳空) 整檔隔離，不跑策略
+# 每檔有問題的股票回傳一列報告
+# -------------------------------------------------
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+
+TW_LIMIT = 0.11          # 台股漲跌幅 10% + 還原 / 跳動單位誤差
+OTHER_LIMIT = 0.5
+IPO_FREE_BARS = 5        # 新上市前 5 日無漲跌幅限制
+VOLUME_SPIKE = 50        # 成交量 > 前 20 日中位數 50 倍只提醒，不處理
+MAX_STALE_DAYS = 5       # 最後一根落後最新交易日超過 5 個交易日 → 隔離
+MAX_GAP_RATIO = 0.2      # 缺漏交易日超過 2 成 → 隔離
+
+REPAIRED = "修正"
+QUARANTINED = "隔離"
+NOTICE = "提醒"
+NOTICE_ONLY = ["volume_spike", "gap_days", "lag_days"]
+
+# 報告欄位：檢查項目 -> 顯示名稱
+CHECKS = {
+    "duplicate": "重複日期",
+    "bad_price": "價格缺漏/非正",
+    "suspended": "停牌零量",
+    "stale_bar": "重複K棒",
+    "bad_print": "壞價(漲跌後立刻反轉)",
+    "hl_fixed": "高低價修正",
+    "jump": "超過漲跌幅",
+    "gap_days": "缺漏交易日",
+    "lag_days": "落後交易日",
+    "volume_spike": "量異常",
+}
+
+
+def _limits(tickers):
+    return pd.Series({t: TW_LIMIT if market_calendar.calendar_for(t) is market_calendar.TW else OTHER_LIMIT for t in tickers})
+
+
+@functools.lru_cache(maxsize=32)
+def _trading_days(cal, start, end):
+    return cal.trading_days(start, end)
+
+
+def _calendar_gaps(first, last, tickers, now=None):
+    # 以交易日曆計算每檔 [第一根, 最後一根] 之間應有幾根，以及最後一根落後幾個交易日
+    expected = pd.Series(0, index=tickers)
+    lag = pd.Series(0, index=tickers)
+    by_cal = {}
+    for t in tickers: by_cal.setdefault(market_calendar.calendar_for(t), []).append(t)
+    for cal, ts in by_cal.items():
+        latest = cal.session_date(now)
+        days = _trading_days(cal, first[ts].min(), max(last[ts].max(), latest))
+        lo = days.searchsorted(first[ts].values, side="left")
+        hi = days.searchsorted(last[ts].values, side="right")
+        expected[ts] = hi - lo
+        lag[ts] = days.searchsorted(latest, side="right") - hi
+    return expected, lag
+
+
+def validate_batch(data_dict, now=None):
+    # 回傳 (修正後可用的 {代號: df}, 報告列)
+    if not data_dict: return {}, []
+    attrs = {t: dict(df.attrs) for t, df in data_dict.items()}
+    long = pd.concat({t: df if list(df.columns) == COLUMNS else df[COLUMNS] for t, df in data_dict.items()}, names=["代號", "Date"])
+    tickers = list(data_dict)
+    counts = pd.DataFrame(0, index=tickers, columns=list(CHECKS))
+
+    def tally(mask, check):
+        hit = mask[mask]
+        if len(hit): counts[check] = counts[check].add(hit.groupby(level=0).size(), fill_value=0)
+
+    # 1. 同一天出現兩次：保留最後一筆
+    dup = pd.Series(long.index.duplicated(keep="last"), index=long.index)
+    tally(dup, "duplicate")
+    long = long[~dup.values]
+
+    # 2. 價格缺漏 / <= 0、停牌 (零量且高低價相同)、與前一根完全相同的K棒
+    price = long[PRICE_COLUMNS]
+    bad_price = price.isna().any(axis=1) | (price <= 0).any(axis=1)
+    suspended = ~bad_price & (long["Volume"].fillna(0) <= 0) & (long["High"] == long["Low"])
+    stale_bar = ~bad_price & ~suspended & (long == long.groupby(level=0).shift(1)).all(axis=1)
+    for mask, check in ((bad_price, "bad_price"), (suspended, "suspended"), (stale_bar, "stale_bar")): tally(mask, check)
+    long = long[~(bad_price | suspended | stale_bar)].copy()
+
+    # 3. 漲跌超過限制：隔天立刻反轉的是壞價 (刪掉)，刪完還超過的無法解釋 (跳空異常)
+    limits = _limits(tickers)
+
+    def over_limit(frame):
+        groups = frame.groupby(level=0)
+        ret = groups["Close"].pct_change()
+        # 同一批通常都是台股：單一門檻就不必逐列對應
+        limit = limits.iloc[0] if limits.nunique() == 1 else frame.index.get_level_values(0).map(limits).to_numpy()
+        return ret, limit, (ret.abs() > limit) & (groups.cumcount() >= IPO_FREE_BARS)
+
+    ret, limit, over = over_limit(long)
+    next_ret = ret.groupby(level=0).shift(-1)
+    bad_print = over & (next_ret.abs() > limit * 0.5) & (ret * next_ret < 0)
+    tally(bad_print, "bad_print")
+    long = long[~bad_print]
+    tally(over_limit(long)[2], "jump")
+
+    # 4. 高低價要包住開盤與收盤
+    high = long[["High", "Open", "Close"]].max(axis=1)
+    low = long[["Low", "Open", "Close"]].min(axis=1)
+    tally((high != long["High"]) | (low != long["Low"]), "hl_fixed")
+    long["High"] = high
+    long["Low"] = low
+
+    # 5. 成交量暴增只提醒
+    groups = long.groupby(level=0)
+    vol_median = groups["Volume"].rolling(20, min_periods=5).median().droplevel(0)
+    vol_median = vol_median.groupby(level=0).shift(1).reindex(long.index)
+    tally(long["Volume"] > vol_median * VOLUME_SPIKE, "volume_spike")
+
+    # 6. 交易日曆：缺漏 / 過期
+    present = long.index.get_level_values(0).value_counts().reindex(tickers, fill_value=0)
+    dates = long.index.get_level_values(1)
+    first = pd.Series(dates, index=long.index).groupby(level=0).min().reindex(tickers)
+    last = pd.Series(dates, index=long.index).groupby(level=0).max().reindex(tickers)
+    alive = present[present > 0].index
+    if len(alive):
+        expected, lag = _calendar_gaps(first[alive], last[alive], list(alive), now)
+        counts.loc[alive, "gap_days"] = (expected - present[alive]).clip(lower=0)
+        counts.loc[alive, "lag_days"] = lag
+
+    quarantine = (present == 0) | (counts["lag_days"] > MAX_STALE_DAYS) | (counts["jump"] > 0)
+    quarantine |= counts["gap_days"] > (counts["gap_days"] + present) * MAX_GAP_RATIO
+
+    # 沒被修正的股票直接用原本的 DataFrame，只有修正過的才從長表切回來
+    repaired = (counts.drop(columns=NOTICE_ONLY) > 0).any(axis=1)
+    cleaned = {}
+    for t, df in data_dict.items():
+        if quarantine[t]: continue
+        if repaired[t]:
+            df = long.xs(t, level=0)
+            df.attrs.update(attrs[t])
+        cleaned[t] = df
+
+    report = []
+    # 缺漏 / 落後交易日只是附註 (假日表不含更早年份)，有其他問題或被隔離才列出
+    flagged = counts[repaired | (counts["volume_spike"] > 0) | quarantine]
+    for t, row in flagged.iterrows():
+        action = QUARANTINED if quarantine[t] else REPAIRED if repaired[t] else NOTICE
+        report.append({"代號": t, "處理": action, **{CHECKS[c]: int(v) for c, v in row.items() if v}})
+    return cleaned, report
@@ -0,0 +1,81 @@
+import csv
+import json
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# -------------------------------------------------
+# 掃描結果串流輸出：每批命中立刻寫入 CSV / JSONL / Parquet
+# 各策略欄位不同，固定欄位之外的都放進「其他」(JSON 字串)
+# -------------------------------------------------
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "exports")
+
+FLOAT_COLUMNS = ["現價", "停損價(SL)", "停利價(TP)", "R倍數", "RS20", "RS60", "外資5日(張)", "投信5日(張)", "法人5日(張)", "法人連買(日)", "法人5日占量(%)"]
+TEXT_COLUMNS = ["策略", "代號", "名稱", "產業別", "訊號日期", "潛在獲利", "回測勝率", "平均獲利", "總交易", "狀態", "訊號變化", "外資詳情"]
+EXTRA_COLUMN = "其他"
+COLUMNS = TEXT_COLUMNS[:4] + FLOAT_COLUMNS + TEXT_COLUMNS[4:] + [EXTRA_COLUMN]
+
+SCHEMA = pa.schema(
+    [(c, pa.float64()) if c in FLOAT_COLUMNS else (c, pa.string()) for c in COLUMNS]
+)
+
+
+def prune_exports(root=EXPORT_DIR, max_age_days=3):
+    if not os.path.isdir(root): return
+    cutoff = time.time() - max_age_days * 86400
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.getmtime(path) < cutoff: os.remove(path)
+
+
+def flatten(hit):
+    row = {}
+    for c in FLOAT_COLUMNS:
+        v = hit.get(c)
+        row[c] = None if v is None else float(v)
+    for c in TEXT_COLUMNS:
+        v = hit.get(c)
+        row[c] = None if v is None else str(v)
+    extra = {k: v for k, v in hit.items() if k not in row}
+    row[EXTRA_COLUMN] = json.dumps(extra, ensure_ascii=False, default=str) if extra else None
+    return row
+
+
+class ResultWriter:
+    def __init__(self, name, formats=("csv", "jsonl", "parquet"), root=EXPORT_DIR):
+        os.makedirs(root, exist_ok=True)
+        self.paths = {fmt: os.path.join(root, f"{name}.{fmt}") for fmt in formats}
+        self.rows = 0
+        self._csv = self._csv_writer = self._jsonl = self._parquet = None
+        if "csv" in self.paths:
+            # utf-8-sig：Excel 直接開不會亂碼
+            self._csv = open(self.paths["csv"], "w", encoding="utf-8-sig", newline="")
+            self._csv_writer = csv.DictWriter(self._csv, fieldnames=COLUMNS)
+            self._csv_writer.writeheader()
+        if "jsonl" in self.paths:
+            self._jsonl = open(self.paths["jsonl"], "w", encoding="utf-8")
+        if "parquet" in self.paths:
+            self._parquet = pq.ParquetWriter(self.paths["parquet"], SCHEMA)
+
+    def write(self, hits):
+        if not hits: return
+        rows = [flatten(h) for h in hits]
+        if self._csv_writer:
+            self._csv_writer.writerows(rows)
+            self._csv.flush()
+        if self._jsonl:
+            for h in hits:
+                self._jsonl.write(json.dumps(h, ensure_ascii=False, default=str) + "\n")
+            self._jsonl.flush()
+        if self._parquet:
+            # 每批一個 row group
+            self._parquet.write_table(pa.Table.from_pylist(rows, schema=SCHEMA))
+        self.rows += len(rows)
+
+    def close(self):
+        for f in (self._csv, self._jsonl):
+            if f: f.close()
+        if self._parquet: self._parquet.close()
+        self._csv = self._csv_writer = self._jsonl = self._parquet = None
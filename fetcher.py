@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# -------------------------------------------------
+# 非同步抓取層：共用連線池 + 併發上限 + 逾時 + 重試
+# 網址樣板可替換 (參數或環境變數)，測試時指向本機假伺服器即可
+# -------------------------------------------------
+ISIN_URL = os.environ.get("TW_SCAN_ISIN_URL", "https://isin.twse.com.tw/isin/C_public.jsp?strMode={mode}")
+CHART_URL = os.environ.get("TW_SCAN_CHART_URL", "https://query1.finance.yahoo.com/v8/finance/chart/{ticker}")
+# 三大法人買賣超：上市 (證交所 T86) / 上櫃 (櫃買中心)，整個市場一天一個請求
+INSTI_URLS = {
+    "TW": os.environ.get("TW_SCAN_T86_URL", "https://www.twse.com.tw/rwd/zh/fund/T86?date={date:%Y%m%d}&selectType=ALLBUT0999&response=json"),
+    "TWO": os.environ.get("TW_SCAN_TPEX_INSTI_URL", "https://www.tpex.org.tw/www/zh-tw/insti/dailyTrade?type=Daily&sect=EW&date={date:%Y/%m/%d}&response=json"),
+}
+# 證交所短時間大量請求會被暫時封鎖，三大法人另外限制併發
+INSTI_CONCURRENCY = 2
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+DAILY_INTERVALS = {"1d", "5d", "1wk", "1mo", "3mo"}
+
+
+class AsyncFetcher:
+    def __init__(self, isin_url=ISIN_URL, chart_url=CHART_URL, insti_urls=INSTI_URLS, concurrency=8, timeout=10, retries=3, backoff=0.5):
+        self.isin_url = isin_url
+        self.chart_url = chart_url
+        self.insti_urls = dict(insti_urls)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        # requests.Session 本身會保持 keep-alive，連線池大小對齊併發數
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    async def _get(self, semaphore, url, params=None, verify=True):
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    r = await asyncio.to_thread(self.session.get, url, params=params, timeout=self.timeout, verify=verify)
+                    if r.status_code not in RETRY_STATUS:
+                        r.raise_for_status()
+                        return r
+                except requests.HTTPError:
+                    return None
+                except requests.RequestException:
+                    pass
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff * (2 ** attempt))
+            return None
+
+    async def _gather(self, jobs, verify=True, concurrency=None):
+        # jobs: {key: (url, params)}，同一次呼叫共用一個併發上限
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+        keys = list(jobs)
+        responses = await asyncio.gather(*(self._get(semaphore, *jobs[k], verify=verify) for k in keys))
+        return dict(zip(keys, responses))
+
+    def fetch_all(self, jobs, verify=True, concurrency=None):
+        return asyncio.run(self._gather(jobs, verify=verify, concurrency=concurrency))
+
+    # --- 上市 / 上櫃清單頁面 ---
+    def fetch_isin_pages(self, modes=("2", "4")):
+        jobs = {mode: (self.isin_url.format(mode=mode), None) for mode in modes}
+        # ISIN 網站憑證鏈不完整，沿用原本的 verify=False
+        pages = self.fetch_all(jobs, verify=False)
+        return {mode: r.text for mode, r in pages.items() if r is not None}
+
+    # --- 三大法人買賣超 ---
+    def fetch_insti(self, days, markets=("TW", "TWO")):
+        # 回傳 {(市場, 日期): JSON}；假日 / 尚未公布的日期由呼叫端判斷 (內容沒有資料)
+        jobs = {(m, day): (self.insti_urls[m].format(date=pd.Timestamp(day)), None) for m in markets for day in days}
+        result_dict = {}
+        for key, r in self.fetch_all(jobs, concurrency=INSTI_CONCURRENCY).items():
+            if r is None: continue
+            try:
+                result_dict[key] = r.json()
+            except ValueError:
+                continue
+        return result_dict
+
+    # --- 日K / 分K 資料 ---
+    def fetch_charts(self, tickers, start, interval="1d"):
+        params = {
+            "period1": int(pd.Timestamp(start).timestamp()),
+            "period2": int(time.time()),
+            "interval": interval,
+            "events": "div,split",
+        }
+        jobs = {t: (self.chart_url.format(ticker=t), params) for t in tickers}
+        result_dict = {}
+        for t, r in self.fetch_all(jobs).items():
+            if r is None: continue
+            try:
+                df = parse_chart(r.json(), intraday=interval not in DAILY_INTERVALS)
+            except Exception:
+                continue
+            if df is not None and not df.empty: result_dict[t] = df
+        return result_dict
+
+
+def parse_chart(payload, intraday=False):
+    result = payload["chart"]["result"][0]
+    if not result.get("timestamp"): return None
+    quote = result["indicators"]["quote"][0]
+    tz = result.get("meta", {}).get("exchangeTimezoneName", "Asia/Taipei")
+    index = pd.to_datetime(result["timestamp"], unit="s", utc=True).tz_convert(tz).tz_localize(None)
+    # 日K 只留日期；分K 保留當地時間 (K棒開始時間)
+    if not intraday: index = index.normalize()
+    df = pd.DataFrame({
+        "Open": quote["open"], "High": quote["high"], "Low": quote["low"],
+        "Close": quote["close"], "Volume": quote["volume"],
+    }, index=index, dtype="float64")
+    # 回傳原始K棒；還原比例另放 AdjRatio 欄，由 adjustments 轉成因子表
+    adjclose = result["indicators"].get("adjclose")
+    if adjclose:
+        df["AdjRatio"] = pd.Series(adjclose[0]["adjclose"], index=index, dtype="float64") / df["Close"]
+    df.index.name = "Date"
+    df = df.dropna(how='all')
+    return df[~df.index.duplicated(keep="last")]
@@ -0,0 +1,113 @@
+import threading
+
+import pandas as pd
+
+import market_calendar
+
+# -------------------------------------------------
+# 盤中多週期K棒：只抓一種最細的分K (5 分K)，其他週期由這裡聚合
+# - 每天從開盤時間起算切段，不跨日 (台股 60 分K 最後一根是 13:00~13:30)
+# - 新資料進來只重算受影響的最後幾根
+# -------------------------------------------------
+AGG = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+BASE_INTERVAL = "5m"
+TIMEFRAME_MINUTES = {"1m": 1, "5m": 5, "15m": 15, "30m": 30, "60m": 60}
+KEEP_DAYS = 10      # 只保留最近 10 個日曆天的分K
+
+
+def bucket_start(index, calendar, minutes):
+    # 每根分K的開始時間 → 所屬 N 分K 的開始時間
+    open_t = index.normalize() + calendar.open_delta
+    step = pd.Timedelta(minutes=minutes)
+    slot = ((index - open_t) // step).to_numpy().clip(min=0)
+    return open_t + slot * step
+
+
+def aggregate(df, calendar, minutes):
+    if df.empty: return df[list(AGG)]
+    out = df[list(AGG)].groupby(bucket_start(df.index, calendar, minutes)).agg(AGG)
+    out.index.name = df.index.name
+    return out
+
+
+class IntradayBars:
+    def __init__(self, ticker, base_minutes=TIMEFRAME_MINUTES[BASE_INTERVAL]):
+        self.ticker = ticker
+        self.calendar = market_calendar.calendar_for(ticker)
+        self.base_minutes = base_minutes
+        self.base = None             # 最細的分K (時間為交易所當地時間)
+        self.frames = {}             # 分鐘數 -> 聚合後的K棒
+        self.lock = threading.Lock()
+
+    @property
+    def last_bar(self):
+        return None if self.base is None or self.base.empty else self.base.index[-1]
+
+    def update(self, df):
+        # df 可以是整段或只有最新幾根；重疊的時間以新資料為準 (最後一根常是盤中未完成)
+        if df is None or df.empty: return self
+        df = df[list(AGG)].dropna(subset=['Close'])
+        if df.empty: return self
+        first = df.index[0]
+        if self.base is None or first <= self.base.index[0]:
+            self.base = df
+            self.frames = {}
+        else:
+            self.base = pd.concat([self.base[self.base.index < first], df])
+            for minutes, frame in self.frames.items():
+                cut = bucket_start(pd.DatetimeIndex([first]), self.calendar, minutes)[0]
+                tail = aggregate(self.base[self.base.index >= cut], self.calendar, minutes)
+                self.frames[minutes] = pd.concat([frame[frame.index < cut], tail])
+        keep_from = self.base.index[-1].normalize() - pd.Timedelta(days=KEEP_DAYS)
+        if self.base.index[0] < keep_from:
+            self.base = self.base[self.base.index >= keep_from]
+            self.frames = {m: f[f.index >= keep_from] for m, f in self.frames.items()}
+        return self
+
+    def bucket_end(self, start, minutes):
+        close_t = start.normalize() + self.calendar.close_delta
+        return min(start + pd.Timedelta(minutes=minutes), close_t)
+
+    def is_complete(self, start, minutes, now=None):
+        # 該段最後一根分K已收完，或整個交易時段已結束
+        cal = self.calendar
+        now = cal._local(now if now is not None else cal.now()).tz_localize(None)
+        end = self.bucket_end(start, minutes)
+        return now >= end
+
+    def frame(self, timeframe, now=None):
+        minutes = TIMEFRAME_MINUTES[timeframe]
+        if self.base is None: return None
+        if minutes == self.base_minutes:
+            df = self.base
+        else:
+            if minutes not in self.frames: self.frames[minutes] = aggregate(self.base, self.calendar, minutes)
+            df = self.frames[minutes]
+        df = df.copy()
+        df.attrs["timeframe"] = timeframe
+        df.attrs["partial"] = bool(len(df)) and not self.is_complete(df.index[-1], minutes, now)
+        return df
+
+
+# 跨掃描共用：同一檔再次掃描只需要補最新的分K
+_builders = {}
+_lock = threading.Lock()
+
+
+def builder(ticker):
+    with _lock:
+        b = _builders.get(ticker)
+        if b is None: b = _builders[ticker] = IntradayBars(ticker)
+        return b
+
+
+def update(ticker, df):
+    b = builder(ticker)
+    with b.lock:
+        b.update(df)
+
+
+def intraday_frame(ticker, timeframe):
+    b = builder(ticker)
+    with b.lock:
+        return b.frame(timeframe)
@@ -0,0 +1,121 @@
+import pandas as pd
+
+# -------------------------------------------------
+# 交易日曆：判斷 K 棒是「已收盤定案」、「盤中未完成」還是「過期」
+# 假日清單依證交所 / NYSE 每年公告更新
+# -------------------------------------------------
+TW_HOLIDAYS = [
+    # 2025
+    "2025-01-01", "2025-01-23", "2025-01-24", "2025-01-27", "2025-01-28", "2025-01-29", "2025-01-30", "2025-01-31",
+    "2025-02-28", "2025-04-03", "2025-04-04", "2025-05-01", "2025-05-30", "2025-09-29", "2025-10-06", "2025-10-10",
+    "2025-10-24", "2025-12-25",
+    # 2026
+    "2026-01-01", "2026-02-16", "2026-02-17", "2026-02-18", "2026-02-19", "2026-02-20", "2026-02-27", "2026-04-03",
+    "2026-04-06", "2026-05-01", "2026-06-19", "2026-09-25", "2026-09-28", "2026-10-09", "2026-10-26", "2026-12-25",
+]
+
+US_HOLIDAYS = [
+    # 2025
+    "2025-01-01", "2025-01-09", "2025-01-20", "2025-02-17", "2025-04-18", "2025-05-26", "2025-06-19", "2025-07-04",
+    "2025-09-01", "2025-11-27", "2025-12-25",
+    # 2026
+    "2026-01-01", "2026-01-19", "2026-02-16", "2026-04-03", "2026-05-25", "2026-06-19", "2026-07-03", "2026-09-07",
+    "2026-11-26", "2026-12-25",
+]
+
+FINAL = "final"        # 最後一根是已定案的最新交易日，不需要重抓
+PARTIAL = "partial"    # 最後一根是盤中抓的，收盤定案前要重抓
+STALE = "stale"        # 少了最新的交易日
+
+
+class MarketCalendar:
+    def __init__(self, name, tz, open_time, close_time, holidays, settle_minutes=60):
+        self.name = name
+        self.tz = tz
+        self.open_delta = pd.Timedelta(open_time + ":00")
+        self.close_delta = pd.Timedelta(close_time + ":00")
+        # 收盤後資料源 (Yahoo) 更新完成的緩衝
+        self.settle_delta = self.close_delta + pd.Timedelta(minutes=settle_minutes)
+        self.holidays = {pd.Timestamp(d) for d in holidays}
+
+    def now(self):
+        return pd.Timestamp.now(tz=self.tz)
+
+    def _local(self, ts):
+        ts = pd.Timestamp(ts)
+        return ts.tz_localize(self.tz) if ts.tzinfo is None else ts.tz_convert(self.tz)
+
+    def is_trading_day(self, day):
+        day = pd.Timestamp(day).tz_localize(None).normalize()
+        return day.weekday() < 5 and day not in self.holidays
+
+    def trading_days(self, start, end):
+        days = pd.bdate_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())
+        return days[~days.isin(list(self.holidays))]
+
+    def previous_trading_day(self, day):
+        day = pd.Timestamp(day).tz_localize(None).normalize() - pd.Timedelta(days=1)
+        while not self.is_trading_day(day): day -= pd.Timedelta(days=1)
+        return day
+
+    def next_trading_day(self, day):
+        day = pd.Timestamp(day).tz_localize(None).normalize() + pd.Timedelta(days=1)
+        while not self.is_trading_day(day): day += pd.Timedelta(days=1)
+        return day
+
+    def session_open(self, day):
+        return (pd.Timestamp(day).normalize() + self.open_delta).tz_localize(self.tz)
+
+    def session_settle(self, day):
+        return (pd.Timestamp(day).normalize() + self.settle_delta).tz_localize(self.tz)
+
+    def is_open(self, now=None):
+        now = self._local(now if now is not None else self.now())
+        day = now.tz_localize(None).normalize()
+        if not self.is_trading_day(day): return False
+        return day + self.open_delta <= now.tz_localize(None) < day + self.close_delta
+
+    def session_date(self, now=None):
+        # 目前「最新的」交易日：今天已開盤就是今天，否則是上一個交易日
+        now = self._local(now if now is not None else self.now())
+        day = now.tz_localize(None).normalize()
+        if self.is_trading_day(day) and now >= self.session_open(day): return day
+        return self.previous_trading_day(day)
+
+    def next_open(self, now=None):
+        now = self._local(now if now is not None else self.now())
+        day = now.tz_localize(None).normalize()
+        if self.is_trading_day(day) and now < self.session_open(day): return self.session_open(day)
+        return self.session_open(self.next_trading_day(day))
+
+    def bar_status(self, last_bar_date, fetched_at, now=None):
+        now = self._local(now if now is not None else self.now())
+        last_bar_date = pd.Timestamp(last_bar_date).tz_localize(None).normalize()
+        if last_bar_date < self.session_date(now): return STALE
+        if fetched_at is None or self._local(fetched_at) < self.session_settle(last_bar_date): return PARTIAL
+        return FINAL
+
+
+TW = MarketCalendar("TW", "Asia/Taipei", "09:00", "13:30", TW_HOLIDAYS)
+US = MarketCalendar("US", "America/New_York", "09:30", "16:00", US_HOLIDAYS)
+
+
+def calendar_for(ticker):
+    return TW if ticker.upper().endswith((".TW", ".TWO")) else US
+
+
+def bar_status(ticker, df, now=None):
+    if df is None or df.empty: return STALE
+    return calendar_for(ticker).bar_status(df.index[-1], df.attrs.get("fetched_at"), now)
+
+
+def cache_expiry(ticker, df, partial_ttl=300, now=None):
+    # 已定案 → 留到下次開盤；盤中 / 過期 → 短 TTL，但不超過收盤定案時間
+    cal = calendar_for(ticker)
+    now = cal._local(now if now is not None else cal.now())
+    if bar_status(ticker, df, now) == FINAL: return cal.next_open(now).timestamp()
+    expires = now + pd.Timedelta(seconds=partial_ttl)
+    day = now.tz_localize(None).normalize()
+    if cal.is_trading_day(day) and now < cal.session_settle(day):
+        expires = min(expires, cal.session_settle(day))
+    return expires.timestamp()
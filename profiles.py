@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass, fields
+
+import scan_worker
+import scanner
+
+# -------------------------------------------------
+# 掃描設定檔：把常用的 來源 / 產業 / 數量 / 策略 / 回測區間 存成有名字的設定
+# - 存在本機 JSON 設定檔 (TW_SCAN_PROFILES 可改路徑)，UI 與排程 (命令列) 共用
+# - plan() 把設定檔解析成實際要掃的代號清單 + 資料需求 (歷史起始日、要不要分K / 籌碼)
+#   每天算一次存檔，開盤前的預熱與之後的掃描用同一份清單 (同一個 scan ID，斷點共用)
+# 用法：python profiles.py list
+#       python profiles.py plan 每日全市場
+#       python profiles.py run 每日全市場
+# -------------------------------------------------
+PROFILE_FILE = os.environ.get("TW_SCAN_PROFILES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scan_profiles.json"))
+PLAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "profiles")
+SOURCES = ["手動", "全市場"]
+BACKTEST_MONTHS = [3, 6, 9, 12, 24]
+TIME_RE = re.compile(r"(\d{1,2}):(\d{2})")
+
+
+@dataclass(frozen=True)
+class ScanProfile:
+    name: str
+    source: str = "手動"
+    tickers: tuple = ("2330.TW", "2317.TW", "2603.TW")   # 手動：代號或名稱
+    industries: tuple = ()        # 全市場：只掃這些產業 (空 = 全部)
+    limit: int = 300              # 全市場：掃描數量
+    strategies: tuple = None      # 策略名稱；None = 所有非盤中策略 (與 UI 預設相同)
+    backtest_months: int = 3
+    diff: bool = False            # 只回報訊號變化
+    schedule: tuple = ()          # 排程掃描時間 ("HH:MM"，交易所當地時間)，預熱依此提前準備
+
+    @classmethod
+    def from_dict(cls, name, d):
+        # 設定檔手動改過：不認得的欄位忽略，清單轉 tuple (frozen 需要可雜湊)
+        known = {f.name for f in fields(cls)} - {"name"}
+        d = {k: tuple(v) if isinstance(v, list) else v for k, v in d.items() if k in known}
+        return cls(name=name, **d)
+
+    def to_dict(self):
+        d = asdict(self)
+        del d["name"]
+        return {k: list(v) if isinstance(v, tuple) else v for k, v in d.items()}
+
+    def selected(self):
+        # 依註冊表順序；已經不存在的策略略過
+        if self.strategies is None: return [k for k in scanner.STRATEGIES if not scanner.is_intraday(k)]
+        return [k for k in scanner.STRATEGIES if k in self.strategies]
+
+    def fingerprint(self):
+        key = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_schedule(text):
+    # "08:30, 13:35" → (["08:30", "13:35"], [看不懂的輸入])
+    times, invalid = set(), []
+    for part in filter(None, (p.strip() for p in text.replace("，", ",").split(","))):
+        m = TIME_RE.fullmatch(part)
+        if m and int(m[1]) < 24 and int(m[2]) < 60: times.add(f"{int(m[1]):02d}:{m[2]}")
+        else: invalid.append(part)
+    return sorted(times), invalid
+
+
+def load_profiles(path=None):
+    # {名稱: ScanProfile}；檔案不存在或格式錯誤 = 沒有設定檔
+    try:
+        with open(path or PROFILE_FILE, encoding="utf-8") as f:
+            raw = json.load(f)
+        return {name: ScanProfile.from_dict(name, d) for name, d in raw.items()}
+    except Exception:
+        return {}
+
+
+def _write(profiles, path):
+    path = path or PROFILE_FILE
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({name: p.to_dict() for name, p in profiles.items()}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def save_profile(profile, path=None):
+    profiles = load_profiles(path)
+    profiles[profile.name] = profile
+    _write(profiles, path)
+
+
+def delete_profile(name, path=None):
+    profiles = load_profiles(path)
+    if profiles.pop(name, None) is None: return False
+    _write(profiles, path)
+    return True
+
+
+def resolve_tickers(profile, index):
+    # 回傳 (代號清單, 名稱對照)；名稱庫抓不到時手動清單照原樣、名稱為 None (背景掃描再查)
+    if profile.source == "手動":
+        queries = [q for raw in profile.tickers for q in scanner.ticker_index.parse_tickers(raw)]
+        if index is None: return queries, None
+        tickers, _ = index.validate(queries)
+    else:
+        if index is None: return [], {}
+        tickers = (index.tickers_in(profile.industries) if profile.industries else list(index.stock_map()))[:profile.limit]
+    return tickers, {t: index.name(t) for t in tickers}
+
+
+def data_requirements(selected, backtest_months):
+    # 預熱要準備的資料：日線從哪天開始、要不要分K / 籌碼
+    specs = [scanner.STRATEGIES[k] for k in selected]
+    return {
+        "start": f"{scanner.history_start(selected, backtest_months):%Y-%m-%d}",
+        "timeframes": sorted({s.timeframe for s in specs}),
+        "intraday": any(scanner.is_intraday(k) for k in selected),
+        "chips": scanner.needs_chips(selected),
+    }
+
+
+def _plan_path(name, root):
+    return os.path.join(root, hashlib.sha1(name.encode("utf-8")).hexdigest()[:16] + ".json")
+
+
+def plan(profile, refresh=False, root=PLAN_DIR):
+    # 同一天、設定檔沒改過就用存好的清單 (名稱庫盤中更新也不會讓清單變動)
+    # 以日曆日為準 (與 scan ID 相同)：開盤前預熱算的清單，開盤後的掃描也用同一份
+    day = scanner.pd.Timestamp.today().strftime('%Y-%m-%d')
+    path = _plan_path(profile.name, root)
+    if not refresh:
+        try:
+            with open(path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["day"] == day and cached["fingerprint"] == profile.fingerprint(): return cached
+        except Exception:
+            pass
+    tickers, stock_map = resolve_tickers(profile, scanner.get_ticker_index())
+    selected = profile.selected()
+    result = {
+        "profile": profile.name,
+        "fingerprint": profile.fingerprint(),
+        "day": day,
+        "tickers": tickers,
+        "stock_map": stock_map,
+        "selected": selected,
+        "backtest_months": profile.backtest_months,
+        "diff": profile.diff,
+        "scan_id": scanner.checkpoint.make_scan_id(tickers, selected, profile.backtest_months, extra=["diff"] if profile.diff else []),
+        **data_requirements(selected, profile.backtest_months),
+    }
+    # 名稱庫抓不到 (全市場清單是空的) 不存，下次重算
+    if tickers and stock_map is not None:
+        os.makedirs(root, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    return result
+
+
+def run(profile, worker=None, on_progress=None, poll=1.0):
+    # 不開 UI 直接掃描 (排程用)；與 UI 送出的是同一種工作，scan ID 相同時斷點共用
+    p = plan(profile)
+    if not p["tickers"]: return None
+    worker = worker or scan_worker.ScanWorker(max_workers=1)
+    signals = scanner.get_signal_store() if p["diff"] else None
+    job = worker.submit(p["scan_id"], p["selected"], scanner.scan_runner(), p["scan_id"], p["tickers"], p["stock_map"],
+                        p["selected"], p["backtest_months"], signals, scanner.get_alerts())
+    while job.running:
+        time.sleep(poll)
+        if on_progress: on_progress(job)
+    return job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="掃描設定檔：列出 / 解析 / 直接掃描")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="列出所有設定檔")
+    pl = sub.add_parser("plan", help="解析設定檔要掃的股票與資料需求")
+    pl.add_argument("name")
+    pl.add_argument("--refresh", action="store_true", help="重新解析，不用今天存好的清單")
+    rn = sub.add_parser("run", help="直接掃描 (不開 UI)")
+    rn.add_argument("name")
+    args = parser.parse_args(argv)
+
+    profiles = load_profiles()
+    if args.command == "list":
+        if not profiles: print(f"沒有設定檔 ({PROFILE_FILE})")
+        for name, p in profiles.items():
+            scope = ", ".join(p.tickers) if p.source == "手動" else f"{'、'.join(p.industries) or '全部產業'} 前 {p.limit} 檔"
+            schedule = f"  排程 {', '.join(p.schedule)}" if p.schedule else ""
+            print(f"{name}：{p.source} {scope}｜{len(p.selected())} 個策略｜回測 {p.backtest_months} 個月{schedule}")
+        return 0
+    profile = profiles.get(args.name)
+    if profile is None:
+        print(f"找不到設定檔「{args.name}」")
+        return 1
+
+    if args.command == "plan":
+        p = plan(profile, refresh=args.refresh)
+        print(f"{p['day']} 掃描 {len(p['tickers'])} 檔 (scan ID {p['scan_id']})")
+        print(f"策略：{'、'.join(p['selected'])}")
+        print(f"日線從 {p['start']} 起｜週期 {', '.join(p['timeframes'])}｜分K {'要' if p['intraday'] else '不用'}｜籌碼 {'要' if p['chips'] else '不用'}")
+        return 0 if p["tickers"] else 1
+
+    job = run(profile, on_progress=lambda j: print(f"\r{j.progress:6.1%} {j.message}", end="", flush=True))
+    if job is None:
+        print("沒有可掃描的股票 (名稱庫無法載入？)")
+        return 1
+    print()
+    snap = job.snapshot()
+    if snap["status"] != "done":
+        print(f"掃描未完成：{snap['error'] or snap['status']}")
+        return 1
+    for k, rows in snap["results"].items(): print(f"{k}：{len(rows)} 檔")
+    if snap["failed"]: print(f"無法取得資料：{len(snap['failed'])} 檔")
+    for fmt, path in snap["exports"].items(): print(f"{fmt.upper()}：{path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import intraday_bars
+import market_calendar
+import risk
+import scanner
+
+# -------------------------------------------------
+# 分K回放：把錄下來的 5 分K 依時間順序重播，走與盤中掃描相同的策略註冊表
+# - 模擬時鐘 = K棒收盤時間，結果與回放速度無關 (同一份錄檔每次結果相同)
+# - 指標 (均線 / 布林) 只看過去，整段先算一次，每一步只切前綴
+# - 預設各週期K棒收完才判斷；partial=True 時每根 5 分K 都拿未完成的大週期K棒判斷 (較慢)
+# 用法：python replay.py record 2330.TW 2317.TW
+#       python replay.py run [--speed 600] [--partial] [--strategy "⚡ 5分K 帶量過 20MA"]
+# -------------------------------------------------
+REPLAY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "replay")
+COLUMNS = list(intraday_bars.AGG)
+
+
+def _path(ticker, root):
+    return os.path.join(root, f"{ticker}.parquet")
+
+
+def save_recording(ticker, df, root=REPLAY_DIR):
+    # 同一檔多次錄製接在一起，重疊的時間以新的為準
+    os.makedirs(root, exist_ok=True)
+    old = load_recording(ticker, root)
+    if old is not None: df = pd.concat([old[old.index < df.index[0]], df])
+    tmp = _path(ticker, root) + ".tmp"
+    df[COLUMNS].to_parquet(tmp)
+    os.replace(tmp, _path(ticker, root))
+
+
+def load_recording(ticker, root=REPLAY_DIR):
+    try:
+        return pd.read_parquet(_path(ticker, root))
+    except Exception:
+        return None
+
+
+def load_recordings(tickers=None, root=REPLAY_DIR):
+    if tickers is None:
+        tickers = sorted(f[:-len(".parquet")] for f in os.listdir(root) if f.endswith(".parquet")) if os.path.isdir(root) else []
+    found = {t: load_recording(t, root) for t in tickers}
+    return {t: df for t, df in found.items() if df is not None and not df.empty}
+
+
+def record(tickers, days=scanner.INTRADAY_DAYS, root=REPLAY_DIR):
+    # 向資料源抓最近幾天的 5 分K 存起來，之後離線回放
+    start = pd.Timestamp.today().normalize() - pd.Timedelta(days=days + 2)
+    got = scanner.get_fetcher().fetch_charts(tickers, start, interval=intraday_bars.BASE_INTERVAL)
+    for t, df in got.items(): save_recording(t, df, root)
+    return sorted(got)
+
+
+class _TickerTape:
+    # 單一股票的回放資料：各週期完整K棒 + 指標先算好，第 i 根 5 分K 時要判斷哪些K棒
+    def __init__(self, ticker, base, by_timeframe, partial):
+        self.ticker = ticker
+        self.calendar = market_calendar.calendar_for(ticker)
+        self.base = base
+        self.by_timeframe = by_timeframe
+        self.frames = {}
+        self.ind = {}
+        self.slot = {}
+        self.running = {}
+        self.steps = [[] for _ in range(len(base))]
+        base_minutes = intraday_bars.TIMEFRAME_MINUTES[intraday_bars.BASE_INTERVAL]
+        bar_end = base.index + pd.Timedelta(minutes=base_minutes)
+        for tf, keys in by_timeframe.items():
+            minutes = intraday_bars.TIMEFRAME_MINUTES[tf]
+            starts = intraday_bars.bucket_start(base.index, self.calendar, minutes)
+            frame = base if minutes == base_minutes else intraday_bars.aggregate(base, self.calendar, minutes)
+            frame = frame.copy()
+            frame.attrs.update(timeframe=tf, partial=False)
+            names = set().union(*(scanner.STRATEGIES[k].required_indicators() for k in keys))
+            self.frames[tf] = frame
+            self.ind[tf] = scanner.compute_indicators(frame, names)
+            slot = frame.index.searchsorted(starts)
+            self.slot[tf] = slot
+            # K棒收完的時間點：最後一根 5 分K 收盤到了該段結束；少了K棒 (沒成交) 就等下一段第一根進來才判斷
+            ends = np.minimum(starts + pd.Timedelta(minutes=minutes), starts.normalize() + self.calendar.close_delta)
+            done = np.asarray(bar_end >= ends)
+            for i in range(len(base)):
+                if done[i]:
+                    self.steps[i].append((tf, slot[i]))
+                elif i + 1 < len(base) and slot[i + 1] != slot[i]:
+                    self.steps[i + 1].append((tf, slot[i]))
+            if partial and minutes != base_minutes:
+                groups = base.groupby(starts)
+                self.running[tf] = pd.DataFrame({
+                    "Open": groups["Open"].transform("first"), "High": groups["High"].cummax(),
+                    "Low": groups["Low"].cummin(), "Close": base["Close"], "Volume": groups["Volume"].cumsum(),
+                }, index=base.index)
+
+    def frames_at(self, i):
+        # 第 i 根 5 分K 進來之後要判斷的 (週期, 該週期K棒, 指標)
+        for tf, k in self.steps[i]:
+            frame = self.frames[tf].iloc[:k + 1]
+            yield tf, frame, {n: s.iloc[:k + 1] for n, s in self.ind[tf].items()}
+        for tf, running in self.running.items():
+            k = self.slot[tf][i]
+            if any(step == (tf, k) for step in self.steps[i]): continue
+            # 未收完的K棒：前面已完成的 + 到目前為止的累計
+            row = running.iloc[[i]].set_axis(self.frames[tf].index[[k]])
+            frame = pd.concat([self.frames[tf].iloc[:k], row])
+            frame.attrs.update(timeframe=tf, partial=True)
+            yield tf, frame, None
+
+
+class Replayer:
+    def __init__(self, recordings, selected=None, names=None, partial=False, backtest_months=3):
+        # 只回放盤中策略；日線 / 週線策略沒有分K可重播
+        selected = [k for k in (selected or scanner.STRATEGIES) if scanner.is_intraday(k)]
+        self.by_timeframe = scanner.group_by_timeframe(selected)
+        self.names = names or {}
+        self.backtest_months = backtest_months
+        self.tapes = {}
+        for t, df in sorted(recordings.items()):
+            base = df[COLUMNS].dropna(subset=["Close"])
+            base = base[~base.index.duplicated(keep="last")].sort_index()
+            if not base.empty: self.tapes[t] = _TickerTape(t, base, self.by_timeframe, partial)
+        # 事件順序：時間優先，同一時間依代號排序 → 每次回放順序相同
+        times = [tape.base.index.values for tape in self.tapes.values()]
+        owner = np.concatenate([np.full(len(x), n) for n, x in enumerate(times)]) if times else np.array([], dtype=int)
+        pos = np.concatenate([np.arange(len(x)) for x in times]) if times else np.array([], dtype=int)
+        stamps = np.concatenate(times) if times else np.array([], dtype="datetime64[ns]")
+        order = np.lexsort((owner, stamps))
+        tickers = list(self.tapes)
+        self.events = [(pd.Timestamp(stamps[j]), tickers[owner[j]], int(pos[j])) for j in order]
+
+    def step(self, ticker, i):
+        tape = self.tapes[ticker]
+        hits = []
+        for tf, frame, ind in tape.frames_at(i):
+            hits.extend(scanner.run_strategies(ticker, self.names.get(ticker, ticker), frame, self.by_timeframe[tf],
+                                               self.backtest_months, ind=ind).values())
+        return risk.apply(hits)
+
+    def run(self, speed=None, on_signal=None):
+        # speed = 模擬時間 / 實際時間 (例：600 = 10 分鐘K棒 1 秒播完)；None = 全速
+        # 收盤到隔天開盤不算時間，只播交易時段
+        base_minutes = pd.Timedelta(minutes=intraday_bars.TIMEFRAME_MINUTES[intraday_bars.BASE_INTERVAL])
+        signals = []
+        latencies = []
+        behind = []
+        wall0 = time.perf_counter()
+        elapsed = pd.Timedelta(0)
+        prev_ts = self.events[0][0] if self.events else None
+        for ts, ticker, i in self.events:
+            if ts != prev_ts:
+                elapsed += min(ts - prev_ts, base_minutes)
+                prev_ts = ts
+            if speed:
+                due = wall0 + elapsed.total_seconds() / speed
+                wait = due - time.perf_counter()
+                if wait > 0: time.sleep(wait)
+                else: behind.append(-wait * 1000)
+            t0 = time.perf_counter()
+            hits = self.step(ticker, i)
+            ms = (time.perf_counter() - t0) * 1000
+            latencies.append(ms)
+            for r in hits:
+                r["模擬時間"] = (ts + base_minutes).strftime('%Y-%m-%d %H:%M')
+                r["處理延遲(ms)"] = round(ms, 3)
+                signals.append(r)
+                if on_signal: on_signal(r)
+        wall = time.perf_counter() - wall0
+        return signals, {
+            "股票數": len(self.tapes),
+            "K棒數": len(self.events),
+            "訊號數": len(signals),
+            "耗時(秒)": round(wall, 3),
+            "K棒/秒": round(len(self.events) / wall, 1) if wall > 0 else None,
+            "延遲中位數(ms)": round(statistics.median(latencies), 3) if latencies else None,
+            "延遲P99(ms)": round(float(np.percentile(latencies, 99)), 3) if latencies else None,
+            "延遲最大(ms)": round(max(latencies), 3) if latencies else None,
+            "落後排程最大(ms)": round(max(behind), 1) if behind else 0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="錄製 / 離線回放盤中分K策略")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="抓最近幾天的 5 分K 存檔")
+    rec.add_argument("tickers", nargs="+")
+    rec.add_argument("--days", type=int, default=scanner.INTRADAY_DAYS)
+    rec.add_argument("--root", default=REPLAY_DIR)
+    run = sub.add_parser("run", help="回放錄檔並統計訊號延遲 / 吞吐量")
+    run.add_argument("tickers", nargs="*", help="不指定 = 全部錄檔")
+    run.add_argument("--root", default=REPLAY_DIR)
+    run.add_argument("--speed", type=float, default=None, help="模擬時間倍速，不指定 = 全速")
+    run.add_argument("--partial", action="store_true", help="未收完的大週期K棒也判斷")
+    run.add_argument("--strategy", action="append", help="只回放指定策略 (可重複)")
+    run.add_argument("--signals", action="store_true", help="逐筆列出訊號")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        saved = record(args.tickers, args.days, args.root)
+        print(f"已錄製 {len(saved)} / {len(args.tickers)} 檔：{' '.join(saved)}")
+        return 0 if saved else 1
+
+    recordings = load_recordings(args.tickers or None, args.root)
+    if not recordings:
+        print(f"找不到錄檔 ({args.root})")
+        return 1
+    unknown = [k for k in args.strategy or [] if k not in scanner.STRATEGIES]
+    if unknown: parser.error(f"未知的策略：{', '.join(unknown)}")
+    replayer = Replayer(recordings, args.strategy, partial=args.partial)
+    show = (lambda r: print(f"{r['模擬時間']}  {r['代號']}  {r['策略']}  {r['現價']}")) if args.signals else None
+    _, stats = replayer.run(args.speed, show)
+    for k, v in stats.items(): print(f"{k:<12}{v}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
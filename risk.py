@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------
+# 風控批次計算：策略只交出 (進場價, 停損價, 訊號日期, 目標價)，整批命中一次算完
+# - 停利預設 = 進場價 + 1.5 倍風險；策略有自己的目標價就用目標價
+# - 風險 <= 0 (停損不在進場價之下) 以進場價 1% 計
+# - ATR 停損：進場價 - N 倍 ATR14 (策略註冊表 atr_stop 指定，指標與策略共用)
+# -------------------------------------------------
+REWARD_RATIO = 1.5
+MIN_RISK = 0.01
+FIELDS = ["訊號日期", "停損價(SL)", "停利價(TP)", "潛在獲利", "R倍數"]
+PENDING = "_risk"       # 策略交出的 (進場價, 停損價, 訊號日期, 目標價)
+ATR = "_atr"            # run_strategies 附上的 (ATR 值, 倍數)
+
+
+def defer(entry, stop, date, target=None):
+    # 先佔好欄位位置 (結果表格的欄位順序不變)，apply 時再一起填值
+    # date = None 表示策略自己填了訊號日期 (例：分K帶時間)
+    return {**dict.fromkeys(FIELDS), PENDING: (entry, stop, date, target)}
+
+
+def risk_reward(entry, stop, target=None, atr=None, atr_mult=None, reward_ratio=REWARD_RATIO):
+    # 全部都是陣列；target / stop 為 NaN 表示沒有指定
+    entry = np.asarray(entry, dtype="float64")
+    stop = np.asarray(stop, dtype="float64")
+    if atr is not None:
+        atr_stop = entry - np.asarray(atr_mult, dtype="float64") * np.asarray(atr, dtype="float64")
+        stop = np.where(np.isnan(atr_stop), stop, atr_stop)
+    stop = np.round(stop, 2)
+    risk = entry - stop
+    no_risk = ~(risk > 0)
+    risk = np.where(no_risk, entry * MIN_RISK, risk)
+    # 完全沒有停損 (ATR 也還沒有值) 才用 1% 風險反推
+    stop = np.where(np.isnan(stop), np.round(entry - risk, 2), stop)
+    target = np.full(entry.shape, np.nan) if target is None else np.asarray(target, dtype="float64")
+    custom = ~np.isnan(target)
+    tp = np.round(np.where(custom, target, entry + risk * reward_ratio), 2)
+    profit = np.where(custom, (tp - entry) / entry, risk * reward_ratio / entry)
+    return {
+        "停損價(SL)": stop,
+        "停利價(TP)": tp,
+        "潛在獲利": profit,
+        "R倍數": np.round((tp - entry) / risk, 2),
+    }
+
+
+def apply(hits):
+    # 把整批命中的風控欄位一次填好 (就地修改，回傳同一個 list)
+    pending = [r for r in hits if PENDING in r]
+    if not pending: return hits
+    entry, stop, dates, target = zip(*(r.pop(PENDING) for r in pending))
+    atr, mult = zip(*(r.pop(ATR, (np.nan, np.nan)) for r in pending))
+    none_to_nan = lambda xs: [np.nan if x is None else x for x in xs]
+    out = risk_reward(entry, none_to_nan(stop), none_to_nan(target), none_to_nan(atr), none_to_nan(mult))
+    out["潛在獲利"] = np.char.add(np.round(out["潛在獲利"] * 100, 1).astype(str), "%")
+    # 同一批的訊號日期幾乎都一樣，每個日期只格式化一次
+    # date = None：策略自己填了訊號日期
+    unique = {d for d in dates if d is not None}
+    labels = dict(zip(unique, pd.DatetimeIndex(list(unique)).strftime('%Y-%m-%d')))
+    columns = list(out)
+    for r, d, *values in zip(pending, dates, *(out[c].tolist() for c in columns)):
+        if d is not None: r["訊號日期"] = labels[d]
+        r.update(zip(columns, values))
+    return hits
@@ -0,0 +1,119 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# -------------------------------------------------
+# 背景掃描：掃描在獨立執行緒跑，Streamlit 重跑腳本不會中斷
+# UI 只負責輪詢 ScanJob.snapshot() 把已出現的結果畫出來
+# -------------------------------------------------
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+class ScanJob:
+    def __init__(self, job_id, selected):
+        self.job_id = job_id
+        self.selected = list(selected)
+        self.status = "queued"          # queued / running / done / error / cancelled
+        self.progress = 0.0
+        self.message = "排隊中..."
+        self.results = {k: [] for k in selected}
+        self.failed = []
+        self.resumed_batches = 0
+        self.exports = {}               # 格式 -> 串流輸出檔路徑
+        self.panel = []                 # 每檔一列的橫斷面統計 (產業別、站上均線...)
+        self.quality = []               # 資料品質報告 (被修正 / 隔離的股票)
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.status in ("queued", "running")
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set(): raise ScanCancelled()
+
+    def update(self, progress=None, message=None):
+        with self._lock:
+            if progress is not None: self.progress = min(max(progress, 0.0), 1.0)
+            if message is not None: self.message = message
+
+    def add_hits(self, hits):
+        with self._lock:
+            for r in hits:
+                self.results.setdefault(r["策略"], []).append(r)
+
+    def add_panel(self, rows):
+        with self._lock:
+            self.panel.extend(rows)
+
+    def add_quality(self, rows):
+        with self._lock:
+            self.quality.extend(rows)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "results": {k: list(v) for k, v in self.results.items()},
+                "failed": list(self.failed),
+                "resumed_batches": self.resumed_batches,
+                "exports": dict(self.exports),
+                "panel": list(self.panel),
+                "quality": list(self.quality),
+                "error": self.error,
+            }
+
+
+class ScanWorker:
+    def __init__(self, max_workers=2, keep_jobs=50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-worker")
+        self.keep_jobs = keep_jobs
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, selected, fn, *args):
+        # 同一個掃描 (同 scan ID) 還在跑就直接接回去，不重複開工
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.running: return job
+            job = ScanJob(job_id, selected)
+            self.jobs[job_id] = job
+            self._prune()
+        self.executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        try:
+            fn(job, *args)
+            job.status = "done"
+            job.update(progress=1.0, message="掃描完成")
+        except ScanCancelled:
+            job.status = "cancelled"
+            job.update(message="掃描已取消")
+        except Exception as e:
+            job.error = repr(e)
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = sorted((j for j in self.jobs.values() if not j.running), key=lambda j: j.submitted_at)
+        for j in finished[:max(0, len(self.jobs) - self.keep_jobs)]:
+            del self.jobs[j.job_id]
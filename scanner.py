@@ -0,0 +1,946 @@
+import functools
+import importlib
+import io
+import threading
+import time
+import warnings
+from dataclasses import dataclass
+
+import scan_worker
+
+# -------------------------------------------------
+# 掃描引擎：不依賴 Streamlit，app.py 與命令列都能直接 import
+# - pandas / yfinance / ta 等重量級套件第一次用到才載入
+# - 共用資源 (下載器、快取、背景工作) 整個行程只建一次
+# -------------------------------------------------
+warnings.filterwarnings("ignore")
+
+
+class _LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None: self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+pd = _LazyModule("pandas")
+ta = _LazyModule("ta")
+yf = _LazyModule("yfinance")
+adjustments = _LazyModule("adjustments")
+alerts = _LazyModule("alerts")
+data_quality = _LazyModule("data_quality")
+backtest_cache = _LazyModule("backtest_cache")
+bar_cache = _LazyModule("bar_cache")
+bar_store = _LazyModule("bar_store")
+chips = _LazyModule("chips")
+checkpoint = _LazyModule("checkpoint")
+export = _LazyModule("export")
+fetcher = _LazyModule("fetcher")
+intraday_bars = _LazyModule("intraday_bars")
+market_calendar = _LazyModule("market_calendar")
+risk = _LazyModule("risk")
+shard = _LazyModule("shard")
+signal_store = _LazyModule("signal_store")
+sizing = _LazyModule("sizing")
+ticker_index = _LazyModule("ticker_index")
+weekly_bars = _LazyModule("weekly_bars")
+
+_resources = {}
+_resources_lock = threading.Lock()
+
+
+def resource(func):
+    # 行程內單例，取代 st.cache_resource：Streamlit 重跑與背景執行緒拿到同一個物件
+    @functools.wraps(func)
+    def getter():
+        with _resources_lock:
+            if func.__name__ not in _resources: _resources[func.__name__] = func()
+            return _resources[func.__name__]
+    return getter
+
+# -------------------------------------------------
+# 輔助：產生外資連結
+# -------------------------------------------------
+def get_chip_link(ticker):
+    code = ticker.split('.')[0]
+    return f"https://tw.stock.yahoo.com/quote/{code}/institutional-trading"
+
+# -------------------------------------------------
+# 股票清單
+# -------------------------------------------------
+@resource
+def get_fetcher():
+    return fetcher.AsyncFetcher()
+
+def fetch_tw_tickers():
+    # {代號: {"名稱", "市場別", "產業別"}}，產業別供分組掃描與產業寬度統計
+    universe = {}
+    # 上市(2) / 上櫃(4) 兩頁同時抓
+    pages = get_fetcher().fetch_isin_pages(["2", "4"])
+    for mode in ["2", "4"]:
+        try:
+            df = pd.read_html(io.StringIO(pages[mode]))[0].iloc[1:]
+            for _, row in df.iterrows():
+                data = str(row[0]).split()
+                if len(data) >= 2:
+                    code = data[0]
+                    name = data[1]
+                    if code.isdigit() and len(code) == 4:
+                        suffix = ".TWO" if mode == "4" else ".TW"
+                        universe[f"{code}{suffix}"] = {"名稱": name, "市場別": _cell(row, 3), "產業別": _cell(row, 4)}
+        except Exception: pass
+    return universe
+
+def _cell(row, col):
+    v = row.get(col)
+    return None if pd.isna(v) else str(v).strip() or None
+
+# 清單以交易日為快取鍵：每個交易日最多重抓一次，抓失敗 (空清單) 不快取
+# 失敗後一分鐘內不重抓，避免離線時每次重跑都卡在連線逾時
+# 上一個交易日收盤後存過檔 (例：開盤前預熱) 就直接讀檔
+_ticker_indexes = {}
+_ticker_lock = threading.Lock()
+_ticker_failed_at = 0.0
+
+def get_ticker_index(refresh=False, retry_after=60):
+    global _ticker_failed_at
+    cal = market_calendar.TW
+    day = cal.session_date()
+    with _ticker_lock:
+        if refresh or day not in _ticker_indexes:
+            stock_map = None if refresh else ticker_index.load_universe(cal.session_settle(cal.previous_trading_day(day)).timestamp())
+            if not stock_map:
+                if not refresh and time.time() - _ticker_failed_at < retry_after: return None
+                stock_map = fetch_tw_tickers()
+                if not stock_map:
+                    _ticker_failed_at = time.time()
+                    return None
+                try: ticker_index.save_universe(stock_map)
+                except OSError: pass
+            _ticker_indexes.clear()
+            _ticker_indexes[day] = ticker_index.TickerIndex(stock_map)
+        return _ticker_indexes[day]
+
+def get_all_tw_tickers(refresh=False):
+    index = get_ticker_index(refresh)
+    return index.stock_map() if index else {}
+
+# -------------------------------------------------
+# 核心：批量下載函式
+# -------------------------------------------------
+def _yf_download(tickers_batch, start):
+    # 與圖表 API 相同格式：原始 OHLCV + AdjRatio (還原收盤 / 收盤)
+    data = yf.download(tickers_batch, start=start.strftime('%Y-%m-%d'), interval="1d", group_by='ticker', progress=False, threads=True, auto_adjust=False)
+    result_dict = {}
+    if data is None or data.empty: return result_dict
+    for t in tickers_batch:
+        try:
+            df = data[t].copy() if isinstance(data.columns, pd.MultiIndex) else data.copy()
+            if df['Close'].isnull().all(): continue
+            df["AdjRatio"] = df.pop("Adj Close") / df["Close"]
+            df = df.dropna(how='all')
+            if not df.empty: result_dict[t] = df
+        except KeyError: continue
+    return result_dict
+
+def download_batch_data(tickers_batch, start):
+    # start = 策略暖機 + 回測需要的最早日期，本地倉庫已定案的區間不重抓
+    result_dict = {}
+    stored = {}
+    groups = {}
+    for t in tickers_batch:
+        stored[t] = bar_store.load_bars(t)
+        fetch_from = bar_store.fetch_start(t, stored[t], start)
+        if fetch_from is not None: groups.setdefault(fetch_from, []).append(t)
+
+    fresh = {}
+    for fetch_from, group in groups.items():
+        try:
+            got = get_fetcher().fetch_charts(group, fetch_from)
+            # 圖表 API 整批失敗 (被擋 / 改版) 時退回 yfinance
+            if not got: got = _yf_download(group, fetch_from)
+            fresh.update(got)
+        except Exception: continue
+
+    for t in tickers_batch:
+        df = stored[t]
+        if t in fresh:
+            # 新的除權息只更新因子表，倉庫裡的原始K棒不用改
+            try: events = adjustments.update_events(t, stored[t], fresh[t])
+            except Exception: events = adjustments.load_events(t)
+            df = bar_store.merge_bars(df, fresh[t].drop(columns=[adjustments.RATIO_COLUMN], errors="ignore"))
+            since = min(start, bar_store.covered_since(stored[t]) or start)
+            try: df = bar_store.save_bars(t, df, since)
+            except Exception: pass
+        else:
+            events = adjustments.load_events(t)
+        if df is None or df.empty: continue
+        attrs = dict(df.attrs)
+        df = df[df.index >= start]
+        df.attrs.update(attrs)
+        # 讀取時才還原
+        if not df.empty: result_dict[t] = adjustments.apply(df, events)
+    return result_dict
+
+# -------------------------------------------------
+# 策略註冊表：每個策略宣告自己需要的資料
+# -------------------------------------------------
+@dataclass(frozen=True)
+class StrategySpec:
+    func: object
+    timeframe: str = "D"          # "D" 日線 / "W" 週線 / "5m" 等盤中分K (見 TIMEFRAMES)
+    min_bars: int = 0             # 該週期最少需要的 K 棒數
+    indicators: tuple = ()        # 需要的指標名稱 (見 INDICATORS)
+    volume_gate: tuple = None     # (第幾根K棒, 最低成交量)，不符合就不跑策略
+    rs_gate: tuple = None         # (RS 欄位, 最低值)，例：("RS60", 0) 近 60 日強於 0050 才跑策略
+    chip_gate: tuple = None       # (籌碼欄位, 最低值)，例：("投信5日(張)", 0) 投信近 5 日買超才跑策略
+    atr_stop: float = None        # 停損改用 進場價 - N 倍 ATR14 (見 risk)
+    backtest: str = None          # run_backtest 的策略代號
+
+    def required_indicators(self):
+        names = set(self.indicators) | set(BACKTEST_INDICATORS.get(self.backtest, ()))
+        return names | {"atr14"} if self.atr_stop else names
+
+
+STRATEGIES = {}
+
+
+def register_strategy(label, **spec):
+    def decorator(func):
+        STRATEGIES[label] = StrategySpec(func=func, **spec)
+        return func
+    return decorator
+
+
+# 週線由 weekly_bars 增量維護：本週與已完成週分開，另提供推估週量 ProjVolume
+# 盤中分K只抓一次 5 分K (load_intraday)，15 / 30 / 60 分K 由 intraday_bars 依開盤時間聚合
+INTRADAY_TIMEFRAMES = ("5m", "15m", "30m", "60m")
+TIMEFRAMES = {
+    "D": lambda ticker, df: df,
+    "W": lambda ticker, df: weekly_bars.weekly_frame(ticker, df),
+    **{tf: (lambda ticker, df, tf=tf: intraday_bars.intraday_frame(ticker, tf)) for tf in INTRADAY_TIMEFRAMES},
+}
+
+
+def is_intraday(label):
+    return STRATEGIES[label].timeframe in INTRADAY_TIMEFRAMES
+
+# 指標只算一次，所有策略與回測共用 (布林中線 = 20MA)
+INDICATORS = {
+    "ma5": lambda df: ta.trend.sma_indicator(df["Close"], 5),
+    "ma10": lambda df: ta.trend.sma_indicator(df["Close"], 10),
+    "ma20": lambda df: ta.trend.sma_indicator(df["Close"], 20),
+    "ma60": lambda df: ta.trend.sma_indicator(df["Close"], 60),
+    "ma120": lambda df: ta.trend.sma_indicator(df["Close"], 120),
+    "bb20_hband": lambda df: ta.volatility.bollinger_hband(df["Close"], window=20, window_dev=2),
+    "vol_ma5": lambda df: df["Volume"].rolling(5).mean(),
+    # ta 的 ATR 在暖機期間填 0，當作沒有值
+    "atr14": lambda df: ta.volatility.average_true_range(df["High"], df["Low"], df["Close"], 14).replace(0, float("nan")),
+}
+
+BACKTEST_INDICATORS = {
+    "bollinger_mid": ("ma20", "ma120", "bb20_hband"),
+    "washout": ("ma5", "ma20", "ma60"),
+    "consolidation": ("ma5", "ma20", "ma60"),
+    "weekly_pullback": ("ma5", "ma20"),
+}
+
+
+def compute_indicators(df, names):
+    return {n: INDICATORS[n](df) for n in names}
+
+
+def strategy_ready(spec, df, rs=None):
+    # rs = 該檔的橫斷面數值 (RS / 籌碼欄位)，見 panel_stats
+    if len(df) < spec.min_bars: return False
+    for gate in (spec.rs_gate, spec.chip_gate):
+        if not gate: continue
+        col, min_value = gate
+        value = (rs or {}).get(col)
+        if value is None or value < min_value: return False
+    if spec.volume_gate:
+        pos, min_volume = spec.volume_gate
+        if float(df["Volume"].iloc[pos]) < min_volume: return False
+    return True
+
+
+# 每種週期一根K棒約等於幾根日K (分K另外抓，不需要日K歷史)
+DAILY_BARS_PER = {"D": 1, "W": 5, **{tf: 0 for tf in INTRADAY_TIMEFRAMES}}
+
+
+def backtest_lookback(timeframe, months):
+    return months * 4 if timeframe == "W" else months * 22
+
+
+def history_days_needed(selected, backtest_months):
+    bars = 0
+    for k in selected:
+        spec = STRATEGIES[k]
+        need = spec.min_bars
+        if spec.backtest: need += backtest_lookback(spec.timeframe, backtest_months)
+        # 週線多抓一週，避免本週未完成的K棒吃掉一根
+        need = (need + 1) * DAILY_BARS_PER[spec.timeframe]
+        bars = max(bars, need)
+    # 交易日換算日曆日 (週末 + 連假緩衝)
+    return int(bars * 7 / 5 * 1.1) + 7
+
+
+def history_start(selected, backtest_months):
+    return pd.Timestamp.today().normalize() - pd.Timedelta(days=history_days_needed(selected, backtest_months))
+
+
+INTRADAY_DAYS = 5       # 分K抓最近 5 個日曆天 (60 分K 20MA 需要約 4 個交易日)
+
+
+def load_intraday(tickers):
+    # 同一檔再次掃描只補最後一根之後的分K；最後一根可能未完成，從它開始重抓
+    # 分K時間是交易所當地時間 (無時區)，轉成帶時區再換 epoch，不然會被當成 UTC (台股晚 8 小時)
+    groups = {}
+    for t in tickers:
+        tz = market_calendar.calendar_for(t).tz
+        default = pd.Timestamp.now(tz=tz).normalize() - pd.Timedelta(days=INTRADAY_DAYS + 2)
+        last = intraday_bars.builder(t).last_bar
+        fetch_from = default if last is None else max(pd.Timestamp(last).tz_localize(tz), default)
+        groups.setdefault(fetch_from, []).append(t)
+    for fetch_from, group in groups.items():
+        try:
+            got = get_fetcher().fetch_charts(group, fetch_from, interval=intraday_bars.BASE_INTERVAL)
+        except Exception: continue
+        for t, df in got.items(): intraday_bars.update(t, df)
+
+# -------------------------------------------------
+# 核心：單一股票掃描 (每個週期只轉換/算指標一次)
+# -------------------------------------------------
+def group_by_timeframe(selected):
+    by_timeframe = {}
+    for k in selected:
+        by_timeframe.setdefault(STRATEGIES[k].timeframe, []).append(k)
+    return by_timeframe
+
+
+def run_strategies(ticker, name, df, keys, backtest_months, rs=None, ind=None):
+    # 同一週期的策略共用一份指標；ind 可由呼叫端預先算好 (例：回放時整段只算一次)
+    hits = {}
+    ready = [k for k in keys if strategy_ready(STRATEGIES[k], df, rs)]
+    if not ready: return hits
+    if ind is None:
+        names = set().union(*(STRATEGIES[k].required_indicators() for k in ready))
+        ind = compute_indicators(df, names)
+
+    for k in ready:
+        try:
+            r = STRATEGIES[k].func(ticker, name, df, backtest_months, ind)
+        except Exception: continue
+        if r:
+            r["策略"] = k
+            spec = STRATEGIES[k]
+            if spec.atr_stop and risk.PENDING in r: r[risk.ATR] = (float(ind["atr14"].iloc[-1]), spec.atr_stop)
+            hits[k] = r
+    return hits
+
+
+def scan_ticker(ticker, name, df_daily, selected, backtest_months, rs=None):
+    hits = {}
+    for tf, keys in group_by_timeframe(selected).items():
+        try:
+            df = TIMEFRAMES[tf](ticker, df_daily)
+        except Exception: continue
+        if df is None: continue
+        hits.update(run_strategies(ticker, name, df, keys, backtest_months, rs))
+    return hits
+
+# -------------------------------------------------
+# 核心：回測引擎 (修復日線策略邏輯)
+# -------------------------------------------------
+# 回測起點要往前看的K棒數：該回測用到最長的指標 + 前一根 (週線只用到 20MA，不能套日線的 120MA)
+# 暖機段比抓到的歷史短，快取鍵才只看尾段，與各次掃描的歷史起始日無關
+BACKTEST_WARMUP = {"bollinger_mid": 121, "washout": 61, "consolidation": 61, "weekly_pullback": 21}
+
+def run_backtest(df, strategy_type, months, ind=None):
+    # 交易清單依K棒內容快取 (見 backtest_cache)：開盤前預熱算過的，盤中掃描直接拿來用
+    lookback = backtest_lookback("W" if strategy_type == "weekly_pullback" else "D", months)
+    cache = get_backtest_cache()
+    key = backtest_cache.window_key(df, lookback, BACKTEST_WARMUP[strategy_type])
+    found, trades = cache.get(strategy_type, months, key)
+    if not found:
+        trades = backtest_trades(df, strategy_type, months, ind)
+        cache.put(strategy_type, months, key, trades)
+    if trades is None: return None
+    if not trades: return {"回測勝率": "無訊號", "平均獲利": "0%", "總交易": 0}
+    win_count = sum(1 for p in trades if p > 0)
+    return {
+        "回測勝率": f"{round((win_count/len(trades))*100, 1)}%",
+        "平均獲利": f"{round((sum(trades)/len(trades))*100, 2)}%",
+        "總交易": len(trades)
+    }
+
+def backtest_trades(df, strategy_type, months, ind=None):
+    # 回傳每筆交易的報酬率；None = 資料不足 / 計算失敗
+    try:
+        # 判斷是日線還是週線資料來決定回測長度
+        is_weekly = (strategy_type == "weekly_pullback")
+        lookback = backtest_lookback("W" if is_weekly else "D", months)
+
+        if len(df) < lookback + 20: return None
+
+        trades = []
+        in_position = False
+        entry_price = 0
+        target_price = 0
+        stop_loss_price = 0
+
+        start_idx = len(df) - lookback
+        if start_idx < 25: start_idx = 25 # 確保有足夠前面資料算MA
+
+        close = df["Close"]; open_p = df["Open"]; high = df["High"]; low = df["Low"]; volume = df["Volume"]
+
+        # 預先計算需要的指標 (掃描時由 scan_ticker 傳入共用指標)
+        ind = dict(ind or {})
+        missing = [n for n in BACKTEST_INDICATORS[strategy_type] if n not in ind]
+        ind.update(compute_indicators(df, missing))
+        ma5 = ind.get("ma5"); ma20 = ind.get("ma20"); ma60 = ind.get("ma60"); ma120 = ind.get("ma120")
+        bb_hband = ind.get("bb20_hband")
+
+        for i in range(start_idx, len(df) - 1):
+            c_curr = close.iloc[i]; h_curr = high.iloc[i]; l_curr = low.iloc[i]
+
+            # === 持倉檢查 ===
+            if in_position:
+                # 停利：碰到目標價
+                if h_curr >= target_price:
+                    trades.append((target_price - entry_price) / entry_price)
+                    in_position = False; continue
+
+                # 停損出場
+                exit_condition = False
+                if strategy_type == "weekly_pullback":
+                    if c_curr < stop_loss_price: exit_condition = True
+                else:
+                    if c_curr < stop_loss_price: exit_condition = True
+
+                if exit_condition:
+                    trades.append((c_curr - entry_price) / entry_price)
+                    in_position = False; continue
+
+                # 移動停利邏輯 (部分策略)
+                if strategy_type == "bollinger_mid":
+                    target_price = bb_hband.iloc[i]
+                continue
+
+            # === 進場訊號 ===
+            signal = False
+            curr_sl = 0
+            curr_tp = 0
+
+            # [日線策略通用過濾]
+            if not is_weekly and volume.iloc[i] < 500_000: continue
+
+            # 1. 策略：中線策略 (20MA)
+            if strategy_type == "bollinger_mid":
+                if c_curr > ma120.iloc[i]:
+                    mid = ma20.iloc[i]
+                    if abs(c_curr - mid) / mid <= 0.015 and mid > ma20.iloc[i-1]:
+                        if c_curr < open_p.iloc[i] and volume.iloc[i] < volume.iloc[i-1]:
+                            signal = True
+                            curr_sl = mid * 0.97
+                            curr_tp = bb_hband.iloc[i]
+
+            # 2. 策略：洗盤 (Washout) - [已修復邏輯]
+            elif strategy_type == "washout":
+                # 模擬條件：均線多頭排列 + 帶量站回 5MA
+                if c_curr > ma20.iloc[i] and c_curr > ma60.iloc[i]:
+                    # 昨日在5MA下，今日站上5MA (轉強)
+                    if close.iloc[i-1] < ma5.iloc[i-1] and c_curr > ma5.iloc[i]:
+                         # 帶量紅K
+                         if c_curr > open_p.iloc[i] and volume.iloc[i] > volume.iloc[i-1]:
+                            # 回測時加上寬鬆一點的乖離率檢查 (可選)
+                            if (c_curr - ma5.iloc[i]) / ma5.iloc[i] < 0.08:
+                                signal = True
+                                curr_sl = ma20.iloc[i] # 跌破月線停損
+                                curr_tp = c_curr * 1.15 # 預期15%獲利
+
+            # 3. 策略：盤整突破 - [已修復邏輯]
+            elif strategy_type == "consolidation":
+                 # 模擬條件：均線糾結後 + 爆量長紅突破
+                 if c_curr > ma5.iloc[i] and c_curr > ma20.iloc[i] and c_curr > ma60.iloc[i]:
+                      # 實體紅K > 3% 且 成交量放大 1.5 倍
+                      if (c_curr - open_p.iloc[i])/open_p.iloc[i] > 0.03 and volume.iloc[i] > volume.iloc[i-1]*1.5:
+                          signal = True
+                          curr_sl = open_p.iloc[i] # 跌破起漲點停損
+                          curr_tp = c_curr * 1.2 # 預期20%波段獲利
+
+            # 4. 策略：週線回檔守 5MA 回測
+            elif strategy_type == "weekly_pullback":
+                # i = 本週, i-1 = 上週
+                c_prev = close.iloc[i-1]; o_prev = open_p.iloc[i-1]; v_prev = volume.iloc[i-1]
+                h_prev = high.iloc[i-1]
+
+                # 條件
+                if v_prev < 100000 * 1000: continue
+                if c_curr < ma20.iloc[i]: continue
+                if not (c_prev > o_prev and c_prev > ma5.iloc[i-1]): continue
+
+                if c_curr < open_p.iloc[i] and volume.iloc[i] < v_prev and c_curr > ma5.iloc[i]:
+                    signal = True
+                    curr_sl = ma5.iloc[i] * 0.98
+                    curr_tp = h_prev
+
+            if signal:
+                in_position = True
+                entry_price = c_curr
+                stop_loss_price = curr_sl
+                target_price = curr_tp
+
+        return [float(p) for p in trades]
+    except Exception as e:
+        return None
+
+# -------------------------------------------------
+# 策略函式 (門檻由 register_strategy 宣告，指標由 ind 傳入)
+# -------------------------------------------------
+
+@register_strategy("🌀 布林中線 (量縮黑K)", min_bars=125, indicators=("ma20", "ma120", "bb20_hband"),
+                   volume_gate=(-1, 500_000), backtest="bollinger_mid")
+def strategy_bollinger_mid(ticker, name, df, backtest_months, ind):
+    try:
+        close = df["Close"]; open_p = df["Open"]; volume = df["Volume"]
+        c_now = float(close.iloc[-1]); o_now = float(open_p.iloc[-1])
+        v_now = float(volume.iloc[-1]); v_prev = float(volume.iloc[-2])
+
+        if c_now < ind["ma120"].iloc[-1]: return None
+
+        bb_mavg = ind["ma20"]
+        bb_hband = ind["bb20_hband"]
+        mid_now = float(bb_mavg.iloc[-1])
+        upper_now = float(bb_hband.iloc[-1])
+
+        if abs(c_now - mid_now) / mid_now > 0.015: return None
+        if mid_now < float(bb_mavg.iloc[-2]): return None
+        if c_now >= o_now: return None
+        if v_now >= v_prev: return None
+
+        bt_res = run_backtest(df, "bollinger_mid", backtest_months, ind)
+        sl_price = mid_now * 0.97
+        rr = risk.defer(c_now, sl_price, df.index[-1], target=upper_now)
+
+        return {
+            "代號": ticker, "名稱": name, "現價": round(c_now, 2),
+            "布林中線": round(mid_now, 2),
+            "布林上軌": round(upper_now, 2),
+            **rr, **(bt_res or {}),
+            "外資詳情": get_chip_link(ticker),
+            "狀態": "中線黑K量縮 🌀"
+        }
+    except Exception: return None
+
+# === 修改重點：加入乖離率 < 6% 過濾 ===
+@register_strategy("🛁 爆量回檔 (洗盤)", min_bars=125, indicators=("ma5", "ma10", "ma20", "ma60", "ma120"),
+                   volume_gate=(-1, 500_000), backtest="washout")
+def strategy_washout_rebound(ticker, name, df, backtest_months, ind):
+    try:
+        close = df["Close"]; open_p = df["Open"]; volume = df["Volume"]
+        ma5 = ind["ma5"]
+        ma10 = ind["ma10"]
+        ma20 = ind["ma20"]
+        ma60 = ind["ma60"]
+        ma120 = ind["ma120"]
+        c_now = float(close.iloc[-1]); ma5_now = ma5.iloc[-1]
+        c_prev = float(close.iloc[-2]); o_prev = float(open_p.iloc[-2])
+        v_curr = float(volume.iloc[-1]); v_prev = float(volume.iloc[-2]); v_prev_2 = float(volume.iloc[-3])
+
+        if c_prev >= o_prev: return None
+        if v_prev <= v_prev_2: return None
+        if c_prev < ma5.iloc[-2]: return None
+        if c_now < ma5_now: return None
+        if v_curr >= v_prev: return None
+        if not (c_now > ma5_now and c_now > ma10.iloc[-1] and c_now > ma20.iloc[-1] and c_now > ma60.iloc[-1] and c_now > ma120.iloc[-1]): return None
+
+        # --- [NEW] 新增乖離率過濾 ---
+        # 邏輯：現價距離 5MA 不超過 6%
+        bias_5 = ((c_now - ma5_now) / ma5_now) * 100
+        if bias_5 > 4: return None
+        # ---------------------------
+
+        bt_res = run_backtest(df, "washout", backtest_months, ind)
+        rr = risk.defer(c_now, ma5_now, df.index[-1])
+
+        return {
+            "代號": ticker,
+            "名稱": name,
+            "現價": round(c_now, 2),
+            "5日乖離率": f"{round(bias_5, 2)}%",  # 顯示乖離率
+            **rr,
+            **(bt_res or {}),
+            "外資詳情": get_chip_link(ticker),
+            "狀態": "強勢洗盤 🛁"
+        }
+    except: return None
+
+@register_strategy("📦 日線盤整突破", min_bars=130, indicators=("ma5", "ma10", "ma20", "ma60", "ma120", "vol_ma5"),
+                   volume_gate=(-1, 500_000), backtest="consolidation")
+def strategy_consolidation(ticker, name, df, backtest_months, ind):
+    try:
+        close = df["Close"]; open_p = df["Open"]; high = df["High"]; volume = df["Volume"]
+        c_now = float(close.iloc[-1])
+        ma5 = ind["ma5"].iloc[-1]
+        ma10 = ind["ma10"].iloc[-1]
+        ma20 = ind["ma20"].iloc[-1]
+        ma60 = ind["ma60"].iloc[-1]
+        ma120 = ind["ma120"].iloc[-1]
+
+        if not (c_now > ma5 and c_now > ma10 and c_now > ma20 and c_now > ma60 and c_now > ma120): return None
+
+        ma_vals = [ma5, ma10, ma20]
+        if (max(ma_vals) - min(ma_vals)) / c_now > 0.06: return None
+
+        resistance = float(high.iloc[:-1].tail(20).max())
+        if c_now <= resistance: return None
+
+        vol_ma5 = float(ind["vol_ma5"].iloc[-2])
+        if float(volume.iloc[-1]) < vol_ma5 * 1.5: return None
+        if c_now < float(open_p.iloc[-1]): return None
+
+        bt_res = run_backtest(df, "consolidation", backtest_months, ind)
+        rr = risk.defer(c_now, ma5, df.index[-1])
+        return {"代號": ticker, "名稱": name, "現價": round(c_now, 2), **rr, **(bt_res or {}), "狀態": "帶量突破 📦", "外資詳情": get_chip_link(ticker)}
+    except: return None
+
+@register_strategy("🔥 週線盤整突破 (爆量2.8倍)", timeframe="W", min_bars=30, indicators=("ma5", "ma10", "ma20"))
+def strategy_weekly_breakout(ticker, name, df_weekly, backtest_months, ind):
+    try:
+        close = df_weekly['Close']; volume = df_weekly['Volume']
+        ma5 = ind["ma5"]; ma10 = ind["ma10"]; ma20 = ind["ma20"]
+        c_now = float(close.iloc[-1]); v_now = float(volume.iloc[-1]); v_prev = float(volume.iloc[-2])
+        # 本週未收完時用推估週量比較，避免週中量能被低估
+        v_proj = float(df_weekly['ProjVolume'].iloc[-1]) if 'ProjVolume' in df_weekly else v_now
+        ma5_now = ma5.iloc[-1]; ma10_now = ma10.iloc[-1]; ma20_now = ma20.iloc[-1]
+
+        if not (c_now > ma5_now and c_now > ma10_now and c_now > ma20_now): return None
+        if v_proj <= v_prev * 2.8: return None
+
+        rr = risk.defer(c_now, ma5_now, df_weekly.index[-1])
+        return {"代號": ticker, "名稱": name, "現價": round(c_now, 2), **rr, "回測勝率": "N/A", "平均獲利": "-", "總交易": "-", "本週量(張)": int(v_now/1000), "預估週量(張)": int(v_proj/1000), "爆量倍數": f"{round(v_proj/v_prev, 1)}倍", "外資詳情": get_chip_link(ticker), "狀態": "週線爆量 🔥"}
+    except: return None
+
+# === 週線回檔守5MA (含回測功能 + 乖離率過濾) ===
+# 成交量過濾：上週成交量需 > 10萬張 (100,000 * 1000 股)，由 volume_gate 宣告
+@register_strategy("🛡️ 週線回檔守 5MA (New!)", timeframe="W", min_bars=40, indicators=("ma5", "ma20"),
+                   volume_gate=(-2, 100000 * 1000), backtest="weekly_pullback")
+def strategy_weekly_pullback(ticker, name, df_weekly, backtest_months, ind):
+    try:
+        close = df_weekly['Close']
+        open_p = df_weekly['Open']
+        high = df_weekly['High']
+        volume = df_weekly['Volume']
+
+        # 1. 取得指標 (週線 5MA / 20MA)
+        ma5 = ind["ma5"]
+        ma20 = ind["ma20"]
+
+        # 2. 取得數據 (T=本週, T-1=上週)
+        c_now = float(close.iloc[-1]); o_now = float(open_p.iloc[-1]); v_now = float(volume.iloc[-1])
+        ma5_now = float(ma5.iloc[-1]); ma20_now = float(ma20.iloc[-1])
+
+        c_prev = float(close.iloc[-2]); o_prev = float(open_p.iloc[-2])
+        h_prev = float(high.iloc[-2]); v_prev = float(volume.iloc[-2])
+        ma5_prev = float(ma5.iloc[-2])
+        # 本週量縮要用推估週量判斷，週中的累計量一定比上週小
+        v_proj = float(df_weekly['ProjVolume'].iloc[-1]) if 'ProjVolume' in df_weekly else v_now
+
+        # 3. 篩選邏輯
+        if c_now < ma20_now: return None
+
+        # 上週 (T-1): 紅K + 在 5MA 之上
+        if not (c_prev > o_prev): return None
+        if not (c_prev > ma5_prev): return None
+
+        # 本週 (T): 黑K + 量縮 + 守 5MA
+        if not (c_now < o_now): return None
+        if not (v_proj < v_prev): return None
+        if not (c_now > ma5_now): return None
+
+        # --- [NEW] 新增乖離率過濾 ---
+        # 邏輯：雖然股價守在 5MA 之上，但不能離太遠 (避免買在乖離過大處)
+        bias_5t = ((c_now - ma5_now) / ma5_now) * 100
+
+        # 如果乖離率超過 7%，直接剔除
+        if bias_5t > 7: return None
+        # ---------------------------
+
+        # 4. 執行週線回測
+        bt_res = run_backtest(df_weekly, "weekly_pullback", backtest_months, ind)
+
+        # 5. 計算風控
+        sl_price = ma5_now
+        tp_price = h_prev # 目標：過上週高
+
+        rr = risk.defer(c_now, sl_price, df_weekly.index[-1], target=tp_price)
+
+        return {
+            "代號": ticker,
+            "名稱": name,
+            "現價": round(c_now, 2),
+            "5週乖離率": f"{round(bias_5t, 2)}%", # 顯示
+            **rr,
+            **(bt_res or {}),
+            "本週量(張)": int(v_now/1000),
+            "預估週量(張)": int(v_proj/1000),
+            "上週量(張)": int(v_prev/1000),
+            "外資詳情": get_chip_link(ticker),
+            "狀態": "週線回檔守5MA 🛡️"
+        }
+    except Exception: return None
+
+# === 盤中：帶量站上 20MA (假跌破翻紅)，同一套邏輯跑在 5 / 15 / 30 / 60 分K ===
+# 最新一根可能未收完 (attrs["partial"])，與原本 5 分K 版本一樣直接判斷
+# 沒有結構性停損：停損 = 現價 - 2 倍 ATR14
+@register_strategy("⚡ 60分K 帶量過 20MA", timeframe="60m", min_bars=21, indicators=("ma20",), atr_stop=2)
+@register_strategy("⚡ 30分K 帶量過 20MA", timeframe="30m", min_bars=21, indicators=("ma20",), atr_stop=2)
+@register_strategy("⚡ 15分K 帶量過 20MA", timeframe="15m", min_bars=21, indicators=("ma20",), atr_stop=2)
+@register_strategy("⚡ 5分K 帶量過 20MA", timeframe="5m", min_bars=21, indicators=("ma20",), atr_stop=2)
+def strategy_intraday_breakout(ticker, name, df, backtest_months, ind):
+    try:
+        current = df.iloc[-1]; prev = df.iloc[-2]
+        ma20 = float(ind["ma20"].iloc[-1])
+
+        # 1. 實體紅K穿過 20MA：收盤 > 20MA 且 開盤 < 20MA
+        # 2. 爆量：當前成交量 > 前一根 2 倍
+        if not (current['Close'] > ma20 and current['Open'] < ma20): return None
+        if not (current['Volume'] > prev['Volume'] * 2) or prev['Volume'] <= 0: return None
+
+        tf = df.attrs.get("timeframe", "")
+        status = f"{tf.replace('m', '分')}K 帶量過 20MA ⚡" + (" (未收)" if df.attrs.get("partial") else "")
+        return {
+            "代號": ticker,
+            "名稱": name,
+            "時間": df.index[-1].strftime('%m-%d %H:%M'),
+            "現價": round(float(current['Close']), 2),
+            "20MA": round(ma20, 2),
+            "成交量倍數": round(float(current['Volume'] / prev['Volume']), 1),
+            **risk.defer(float(current['Close']), None, None),
+            # 同一根K棒只通知一次
+            "訊號日期": df.index[-1].strftime('%Y-%m-%d %H:%M'),
+            "外資詳情": get_chip_link(ticker),
+            "狀態": status,
+        }
+    except Exception: return None
+
+# -------------------------------------------------
+# 橫斷面統計：整批收盤價對齊成一張面板，一次算完所有股票
+# -------------------------------------------------
+PANEL_MA = {"站上20MA": 20, "站上120MA": 120}
+
+# 相對強弱：N 日報酬相對 0050 的超額報酬 (%)，排名用 RS_RANK_BY
+BENCHMARK = "0050.TW"
+RS_PERIODS = {"RS20": 20, "RS60": 60}
+RS_RANK_BY = "RS60"
+RS_PCT = "RS百分位"
+
+def load_benchmark(start):
+    df = get_bar_cache().get_many([BENCHMARK], start, download_batch_data).get(BENCHMARK)
+    return None if df is None else df["Close"]
+
+def needs_chips(selected):
+    return any(STRATEGIES[k].chip_gate for k in selected)
+
+def load_chips(refresh=True):
+    # 三大法人買賣超：整個市場每天只抓一次，倉庫缺的交易日才抓 (節流見 chips.due_days)；抓不到就不加籌碼欄位
+    # refresh=False：選的策略用不到籌碼，只讀倉庫現有的 (面板照樣有籌碼欄位)，不連線
+    try:
+        days = chips.recent_days()
+        if refresh: chips.update(days, get_fetcher())
+        return chips.load_panel(days)
+    except Exception:
+        return None
+
+def panel_stats(data_dict, industry=None, benchmark=None, chip_panel=None):
+    # 每檔一列：代號、產業別、是否站上各均線 (資料不足為 None)、RS、籌碼 (chip_panel 有資料時)
+    if not data_dict: return []
+    close = pd.DataFrame({t: df["Close"] for t, df in data_dict.items()}).sort_index().ffill()
+    last = close.iloc[-1]
+    stats = pd.DataFrame(index=close.columns)
+    for col, window in PANEL_MA.items():
+        tail = close.tail(window)
+        ma = tail.mean().where(tail.count() == window)
+        stats[col] = (last > ma).where(ma.notna())
+    bench = benchmark.reindex(close.index.union(benchmark.index)).ffill().reindex(close.index) if benchmark is not None else None
+    for col, n in RS_PERIODS.items():
+        if len(close) <= n:
+            stats[col] = None
+            continue
+        ret = last / close.iloc[-n - 1] - 1
+        if bench is not None:
+            ret = (1 + ret) / (1 + (bench.iloc[-1] / bench.iloc[-n - 1] - 1)) - 1
+        stats[col] = (ret * 100).round(2)
+    if chip_panel:
+        volume = pd.DataFrame({t: df["Volume"] for t, df in data_dict.items()})
+        stats = stats.join(chips.chip_stats(chip_panel, volume, list(close.columns)))
+    stats = stats.astype(object).where(stats.notna(), None)
+    stats.insert(0, "產業別", [industry(t) if industry else ticker_index.UNCLASSIFIED for t in stats.index])
+    stats.insert(0, "代號", stats.index)
+    return stats.to_dict("records")
+
+def rs_percentiles(panel_rows):
+    # 全部已掃描股票一起排名 (0~100，越高越強)；掃描中會隨新批次更新
+    if not panel_rows: return {}
+    panel = pd.DataFrame(panel_rows).set_index("代號")
+    if RS_RANK_BY not in panel: return {}
+    pct = (panel[RS_RANK_BY].astype(float).rank(pct=True) * 100).round(0)
+    return pct.dropna().to_dict()
+
+def sector_summary(panel_rows, results):
+    # 依產業彙總：檔數、站上均線比例、訊號數 (不含已消失的訊號)
+    if not panel_rows: return None
+    panel = pd.DataFrame(panel_rows)
+    cols = list(PANEL_MA)
+    panel[cols] = panel[cols].astype(float)
+    groups = panel.groupby("產業別")
+    summary = pd.DataFrame({"檔數": groups.size()})
+    summary[[f"{c}(%)" for c in cols]] = (groups[cols].mean() * 100).round(1).to_numpy()
+    hits = [r for rows in results.values() for r in rows if r.get("訊號變化") != signal_store.SIGNAL_DROPPED]
+    counts = pd.Series([r.get("產業別") or ticker_index.UNCLASSIFIED for r in hits], dtype=object).value_counts()
+    summary["訊號數"] = counts.reindex(summary.index, fill_value=0).astype(int)
+    return summary.sort_values(["站上20MA(%)", "檔數"], ascending=False)
+
+# -------------------------------------------------
+# 核心：單批掃描 (下載 + 品質檢查 + 跑策略)，回傳 (命中結果, 失敗代號, 面板統計, 品質報告)
+# -------------------------------------------------
+@resource
+def get_bar_cache():
+    return bar_cache.BarCache()
+
+@resource
+def get_backtest_cache():
+    return backtest_cache.BacktestCache()
+
+@resource
+def get_signal_store():
+    return signal_store.SignalStore()
+
+# 通知管道由環境變數設定 (TW_SCAN_ALERT_JSONL / _WEBHOOK / _STDOUT)，沒設定就是 None
+@resource
+def get_alerts():
+    return alerts.dispatcher_from_env()
+
+def scan_batch(batch_tickers, start, stock_map, selected, backtest_months, signals=None, benchmark=None, chip_panel=None):
+    hits = []
+    # 先查跨 session 共用快取，其他使用者正在抓的同一檔會等同一個下載
+    data_dict = get_bar_cache().get_many(batch_tickers, start, download_batch_data)
+    failed = [t for t in batch_tickers if t not in data_dict]
+    # 壞資料先修正，修不了的隔離 (不算下載失敗，不重試)
+    data_dict, quality = data_quality.validate_batch(data_dict)
+    # 有選盤中策略才抓分K：整批一次抓 5 分K，各週期共用
+    if any(is_intraday(k) for k in selected): load_intraday(list(data_dict))
+    index = get_ticker_index()
+    industry = index.industry if index else None
+    # 先算橫斷面統計：RS / 籌碼是策略的過濾條件 (rs_gate / chip_gate)，也併入命中結果
+    panel = panel_stats(data_dict, industry, benchmark, chip_panel)
+    metrics = [*RS_PERIODS, *chips.CHIP_COLUMNS] if chip_panel else list(RS_PERIODS)
+    rs = {r["代號"]: {c: r[c] for c in metrics} for r in panel}
+    fresh = {}
+    plans = {}
+    for t, df in data_dict.items():
+        name = stock_map.get(t, t)
+        if signals is None:
+            fresh[t] = scan_ticker(t, name, df, selected, backtest_months, rs.get(t))
+            continue
+        # 訊號變化模式：K棒沒變的策略沿用上次結果，只重跑有變的 (分K指紋不在日K裡，每次都重跑)
+        fp = signal_store.bar_fingerprint(df, backtest_months)
+        todo = [k for k in selected if is_intraday(k) or not signals.is_unchanged(t, k, fp)]
+        plans[t] = (fp, todo)
+        fresh[t] = scan_ticker(t, name, df, todo, backtest_months, rs.get(t)) if todo else {}
+    # 整批命中的停損 / 停利一次算完；這批新算的回測寫回磁碟
+    risk.apply([r for found in fresh.values() for r in found.values()])
+    get_backtest_cache().flush()
+    for t, found in fresh.items():
+        if signals is None:
+            hits.extend(found.values())
+            continue
+        fp, todo = plans[t]
+        for k in selected:
+            if k in todo:
+                r = signals.record(t, k, fp, found.get(k))
+            else:
+                r = signals.active(t, k)
+                if r: r["訊號變化"] = signal_store.SIGNAL_PERSIST
+            if r: hits.append(r)
+    if signals is not None: signals.save()
+    for r in hits:
+        r["產業別"] = industry(r["代號"]) if industry else ticker_index.UNCLASSIFIED
+        r.update(rs.get(r["代號"], {}))
+    return hits, failed, panel, quality
+
+# -------------------------------------------------
+# 核心：完整掃描 (在背景執行緒執行，結果邊掃邊寫進 job)
+# -------------------------------------------------
+@resource
+def get_worker():
+    return scan_worker.ScanWorker()
+
+def run_scan(job, scan_id, tickers, stock_map, selected, backtest_months, signals=None, dispatcher=None, batch_size=50):
+    total_tickers = len(tickers)
+    # 手動輸入沒帶名稱：在背景才查名稱庫，UI 重跑不必等
+    if stock_map is None:
+        job.update(message="載入名稱庫...")
+        index = get_ticker_index()
+        stock_map = {t: index.name(t) if index else t for t in tickers}
+    start = history_start(selected, backtest_months)
+    batches = [tickers[i : i + batch_size] for i in range(0, total_tickers, batch_size)]
+    # 命中結果邊掃邊寫出 (CSV / JSONL / Parquet)，不等整個掃描結束
+    benchmark = load_benchmark(start)
+    chip_panel = load_chips(refresh=needs_chips(selected))
+    export.prune_exports()
+    writer = export.ResultWriter(scan_id)
+    job.exports = writer.paths
+
+    def emit(hits, notify=True):
+        job.add_hits(hits)
+        writer.write(hits)
+        if dispatcher and notify: dispatcher.publish(hits)
+
+    try:
+        # 同參數的掃描中斷過 → 載入已完成批次的結果，從斷點續跑
+        checkpoint.prune_scans()
+        ckpt = checkpoint.ScanCheckpoint(scan_id)
+        emit([r for r in ckpt.load_hits() if r.get("策略") in job.results], notify=False)
+        job.add_panel(ckpt.load_panel())
+        job.add_quality(ckpt.load_quality())
+        job.resumed_batches = len(ckpt.state["done"])
+
+        for batch_no, batch_tickers in enumerate(batches):
+            job.check_cancelled()
+            if ckpt.is_done(batch_no): continue
+            i = batch_no * batch_size
+            job.update(progress=i / total_tickers, message=f"正在下載第 {i+1} ~ {min(i+batch_size, total_tickers)} 檔資料...")
+            hits, failed, panel, quality = scan_batch(batch_tickers, start, stock_map, selected, backtest_months, signals, benchmark, chip_panel)
+            ckpt.record_batch(batch_no, batch_tickers, hits, failed, panel, quality)
+            emit(hits)
+            job.add_panel(panel)
+            job.add_quality(quality)
+            job.update(progress=min((i + batch_size) / total_tickers, 1.0))
+            time.sleep(1 if len(failed) == len(batch_tickers) else 0.5)
+
+        # 只重試下載失敗的股票
+        retry = ckpt.failed
+        for j in range(0, len(retry), batch_size):
+            job.check_cancelled()
+            retry_batch = retry[j : j + batch_size]
+            job.update(message=f"重試下載失敗的 {len(retry)} 檔資料...")
+            hits, failed, panel, quality = scan_batch(retry_batch, start, stock_map, selected, backtest_months, signals, benchmark, chip_panel)
+            ckpt.record_batch(None, retry_batch, hits, failed, panel, quality)
+            emit(hits)
+            job.add_panel(panel)
+            job.add_quality(quality)
+            time.sleep(0.5)
+        ckpt.finish()
+        job.failed = ckpt.failed
+    finally:
+        writer.close()
+        if dispatcher: dispatcher.flush()
+
+def scan_runner():
+    # 設定了共用工作佇列 (TW_SCAN_QUEUE_DIR) 就切成分片交給 worker 行程 (見 shard)，參數與 run_scan 相同
+    return shard.run_sharded if shard.enabled() else run_scan
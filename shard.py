@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+import scan_worker
+import scanner
+
+# -------------------------------------------------
+# 分片掃描：把股票清單切成片，放進共用目錄當工作佇列，由多個 worker 行程 (或掛同一目錄的多台機器) 分頭處理
+# - 佇列就是目錄：pending/ 待處理、running/ 已領取 (rename 是原子操作，不會兩個 worker 領到同一片)、done/ 結果
+# - worker 每做完一小批就更新領取檔的時間；超過 LEASE_SECONDS 沒動靜視為掛掉，放回 pending 讓別人做
+# - 發起掃描的行程依分片順序合併 (片內依代號 / 策略順序排序)，結果與 worker 數量、完成順序無關
+# - 發起的行程自己也會領片來做，沒有 worker 也能跑完
+# - 同一個 scan ID 再送一次：上次中斷 (還有片待處理 / 處理中) 才沿用已完成的片 (等同斷點續跑)；
+#   上次已合併完成 (complete) 就清掉重新分片，盤中再掃一次會抓最新資料
+# 設定 TW_SCAN_QUEUE_DIR 後 UI / profiles.py run 的掃描改走分片
+# 用法：TW_SCAN_QUEUE_DIR=/mnt/shared/queue python shard.py worker --workers 4
+#       python shard.py status
+# -------------------------------------------------
+QUEUE_DIR = os.environ.get("TW_SCAN_QUEUE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "queue")
+SHARD_SIZE = 100
+BATCH_SIZE = 50
+LEASE_SECONDS = 300
+POLL_SECONDS = 0.5
+
+
+def enabled():
+    return bool(os.environ.get("TW_SCAN_QUEUE_DIR"))
+
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_json(path, data):
+    # 先寫暫存檔再 rename：其他行程不會讀到寫一半的檔
+    tmp = f"{path}.{worker_id()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _shard_name(n):
+    return f"{n:05d}.json"
+
+
+class WorkQueue:
+    def __init__(self, root=QUEUE_DIR):
+        self.root = root
+
+    def _dir(self, scan_id, *parts):
+        return os.path.join(self.root, scan_id, *parts)
+
+    def scans(self):
+        # 先送出的先做
+        found = []
+        for sid in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            try: found.append((os.path.getmtime(self._dir(sid, "job.json")), sid))
+            except OSError: continue
+        return [sid for _, sid in sorted(found)]
+
+    def _count(self, scan_id, sub):
+        try: return len([f for f in os.listdir(self._dir(scan_id, sub)) if f.endswith(".json")])
+        except OSError: return 0
+
+    def submit(self, scan_id, params, tickers, shard_size=SHARD_SIZE):
+        # 回傳 (分片數, 已完成的片數)；參數一樣、上次沒跑完的掃描就沿用
+        job = _read_json(self._dir(scan_id, "job.json"))
+        if (job is not None and job["params"] == params and job["tickers"] == tickers
+                and not os.path.exists(self._dir(scan_id, "cancelled")) and not os.path.exists(self._dir(scan_id, "complete"))
+                and self._count(scan_id, "pending") + self._count(scan_id, "running")):
+            # 整片失敗的 (worker 例外) 不沿用，放回 pending 重做
+            size = job["shard_size"]
+            for n in self.done(scan_id):
+                result = self.result(scan_id, n)
+                if result is not None and not result.get("error"): continue
+                _write_json(self._dir(scan_id, "pending", _shard_name(n)), job["tickers"][n * size : (n + 1) * size])
+                os.remove(self._dir(scan_id, "done", _shard_name(n)))
+            return job["shards"], len(self.done(scan_id))
+        shutil.rmtree(self._dir(scan_id), ignore_errors=True)
+        for sub in ("pending", "running", "done"): os.makedirs(self._dir(scan_id, sub), exist_ok=True)
+        shards = [tickers[i : i + shard_size] for i in range(0, len(tickers), shard_size)]
+        for n, part in enumerate(shards): _write_json(self._dir(scan_id, "pending", _shard_name(n)), part)
+        # job.json 最後寫：worker 看到它時分片已經全部就位
+        _write_json(self._dir(scan_id, "job.json"), {"params": params, "tickers": tickers, "shards": len(shards), "shard_size": shard_size})
+        return len(shards), 0
+
+    def cancel(self, scan_id):
+        open(self._dir(scan_id, "cancelled"), "w").close()
+
+    def complete(self, scan_id):
+        # 合併完成：下次同一個 scan ID 重新分片 (見 submit)
+        open(self._dir(scan_id, "complete"), "w").close()
+
+    def done(self, scan_id):
+        try:
+            return sorted(int(f[:-5]) for f in os.listdir(self._dir(scan_id, "done")) if f.endswith(".json"))
+        except OSError:
+            return []
+
+    def result(self, scan_id, n):
+        return _read_json(self._dir(scan_id, "done", _shard_name(n)))
+
+    def requeue_stale(self, scan_id, lease=LEASE_SECONDS):
+        # 領取檔名：<片號>.<worker>.json；太久沒更新就放回 pending
+        running = self._dir(scan_id, "running")
+        try: claims = os.listdir(running)
+        except OSError: return 0
+        requeued = 0
+        for name in claims:
+            path = os.path.join(running, name)
+            try:
+                if time.time() - os.path.getmtime(path) < lease: continue
+                os.rename(path, self._dir(scan_id, "pending", name.split(".")[0] + ".json"))
+                requeued += 1
+            except OSError: continue
+        return requeued
+
+    def claim(self, scan_id):
+        # 回傳 (片號, 代號清單, 領取檔路徑)；rename 失敗 = 被別人先領走，換下一片
+        pending = self._dir(scan_id, "pending")
+        try: names = sorted(os.listdir(pending))
+        except OSError: return None
+        for name in names:
+            if not name.endswith(".json"): continue
+            n = int(name[:-5])
+            claim = self._dir(scan_id, "running", f"{n:05d}.{worker_id()}.json")
+            try: os.rename(os.path.join(pending, name), claim)
+            except OSError: continue
+            if os.path.exists(self._dir(scan_id, "done", _shard_name(n))):
+                # 逾時被放回去、原本的 worker 後來還是做完了
+                os.remove(claim)
+                continue
+            tickers = _read_json(claim)
+            if tickers is None: continue
+            return n, tickers, claim
+        return None
+
+    def work_one(self, scan_id=None):
+        # 領一片來做 (scan_id = None：任何一個掃描)；沒有工作回傳 False
+        for sid in [scan_id] if scan_id else self.scans():
+            if os.path.exists(self._dir(sid, "cancelled")): continue
+            job = _read_json(self._dir(sid, "job.json"))
+            if job is None: continue
+            self.requeue_stale(sid)
+            got = self.claim(sid)
+            if got is None: continue
+            n, tickers, claim = got
+            try:
+                result = process_shard(job["params"], tickers, touch=lambda: os.utime(claim) if os.path.exists(claim) else None)
+            except Exception as e:
+                # 這片整片失敗也要交出結果，不然合併端會一直等
+                result = {"hits": [], "failed": tickers, "panel": [], "quality": [], "error": repr(e)}
+            _write_json(self._dir(sid, "done", _shard_name(n)), {"worker": worker_id(), **result})
+            try: os.remove(claim)
+            except OSError: pass
+            return True
+        return False
+
+    def prune(self, max_age_days=3):
+        if not os.path.isdir(self.root): return
+        cutoff = time.time() - max_age_days * 86400
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.getmtime(path) < cutoff: shutil.rmtree(path, ignore_errors=True)
+
+
+# 同一個掃描的分片共用大盤 / 籌碼資料，每個行程只載入一次
+_context = {}
+
+
+def _scan_context(params):
+    key = (params["start"], params["day"], scanner.needs_chips(params["selected"]))
+    if key not in _context:
+        _context.clear()
+        start = scanner.pd.Timestamp(params["start"])
+        _context[key] = (scanner.load_benchmark(start), scanner.load_chips(refresh=scanner.needs_chips(params["selected"])))
+    return _context[key]
+
+
+def process_shard(params, tickers, touch=None):
+    # 與 run_scan 相同：分小批下載 + 掃描，下載失敗的最後再重試一次
+    start = scanner.pd.Timestamp(params["start"])
+    benchmark, chip_panel = _scan_context(params)
+    stock_map = params["stock_map"]
+    hits, failed, panel, quality = [], [], [], []
+    batches = [tickers[i : i + BATCH_SIZE] for i in range(0, len(tickers), BATCH_SIZE)]
+    for batch in batches:
+        h, f, p, q = scanner.scan_batch(batch, start, stock_map, params["selected"], params["backtest_months"], None, benchmark, chip_panel)
+        hits += h; failed += f; panel += p; quality += q
+        if touch: touch()
+        time.sleep(1 if len(f) == len(batch) else 0.5)
+    if failed:
+        h, failed, p, q = scanner.scan_batch(failed, start, stock_map, params["selected"], params["backtest_months"], None, benchmark, chip_panel)
+        hits += h; panel += p; quality += q
+    # 片內排序：代號依清單順序，同一檔依策略順序
+    order = {t: i for i, t in enumerate(tickers)}
+    rank = {k: i for i, k in enumerate(params["selected"])}
+    by_ticker = lambda r: order.get(r["代號"], len(order))
+    return {
+        "hits": sorted(hits, key=lambda r: (by_ticker(r), rank.get(r["策略"], len(rank)))),
+        "failed": sorted(failed, key=order.get),
+        "panel": sorted(panel, key=by_ticker),
+        "quality": sorted(quality, key=by_ticker),
+    }
+
+
+def apply_signals(signals, selected, hits, panel):
+    # 訊號變化在合併端判斷 (worker 不碰本機的訊號檔)：每檔已掃描的股票 × 每個策略都記錄一次
+    # 分片模式不記K棒指紋，下次非分片的變化模式掃描會全部重跑
+    found = {(r["代號"], r["策略"]): r for r in hits}
+    columns = ["產業別", *scanner.RS_PERIODS, *scanner.chips.CHIP_COLUMNS]
+    out = []
+    for row in panel:
+        t = row["代號"]
+        for k in selected:
+            r = signals.record(t, k, None, found.get((t, k)))
+            if r is None: continue
+            r.update({c: row[c] for c in columns if c in row})
+            out.append(r)
+    signals.save()
+    return out
+
+
+def run_sharded(job, scan_id, tickers, stock_map, selected, backtest_months, signals=None, dispatcher=None,
+                shard_size=SHARD_SIZE, root=QUEUE_DIR, work=True):
+    # 參數與 run_scan 相同，可直接交給 ScanWorker
+    if stock_map is None:
+        job.update(message="載入名稱庫...")
+        index = scanner.get_ticker_index()
+        stock_map = {t: index.name(t) if index else t for t in tickers}
+    queue = WorkQueue(root)
+    queue.prune()
+    params = {
+        "day": scanner.pd.Timestamp.today().strftime('%Y-%m-%d'),
+        "start": scanner.history_start(selected, backtest_months).strftime('%Y-%m-%d'),
+        "stock_map": {t: stock_map.get(t, t) for t in tickers},
+        "selected": list(selected),
+        "backtest_months": backtest_months,
+    }
+    total, job.resumed_batches = queue.submit(scan_id, params, list(tickers), shard_size)
+    scanner.export.prune_exports()
+    writer = scanner.export.ResultWriter(scan_id)
+    job.exports = writer.paths
+    merged = 0
+    failed = []
+    try:
+        while merged < total:
+            try:
+                job.check_cancelled()
+            except scan_worker.ScanCancelled:
+                queue.cancel(scan_id)
+                raise
+            # 依片號順序合併，後面的片先做完就先留在 done/ 等
+            result = queue.result(scan_id, merged)
+            if result is None:
+                if not (work and queue.work_one(scan_id)):
+                    queue.requeue_stale(scan_id)
+                    time.sleep(POLL_SECONDS)
+                done = len(queue.done(scan_id))
+                job.update(message=f"分片掃描：{done} / {total} 片完成 (共 {len(tickers)} 檔)")
+                continue
+            hits = result["hits"]
+            if signals is not None: hits = apply_signals(signals, selected, hits, result["panel"])
+            job.add_hits(hits)
+            writer.write(hits)
+            if dispatcher: dispatcher.publish(hits)
+            job.add_panel(result["panel"])
+            job.add_quality(result["quality"])
+            failed += result["failed"]
+            merged += 1
+            job.update(progress=merged / total)
+        job.failed = failed
+        queue.complete(scan_id)
+    finally:
+        writer.close()
+        if dispatcher: dispatcher.flush()
+
+
+def work(root=QUEUE_DIR, idle_exit=None):
+    # worker 主迴圈：有工作就做，閒置超過 idle_exit 秒就結束 (None = 一直等)
+    queue = WorkQueue(root)
+    done = 0
+    idle_since = time.time()
+    while True:
+        if queue.work_one():
+            done += 1
+            idle_since = time.time()
+        elif idle_exit is not None and time.time() - idle_since > idle_exit:
+            return done
+        else:
+            time.sleep(POLL_SECONDS)
+
+
+def status(root=QUEUE_DIR):
+    queue = WorkQueue(root)
+    rows = []
+    for sid in queue.scans():
+        job = _read_json(queue._dir(sid, "job.json")) or {}
+        rows.append({"scan_id": sid, "分片": job.get("shards"), "待處理": queue._count(sid, "pending"), "處理中": queue._count(sid, "running"),
+                     "完成": queue._count(sid, "done"), "已合併": os.path.exists(queue._dir(sid, "complete")),
+                     "已取消": os.path.exists(queue._dir(sid, "cancelled"))})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分片掃描：worker / 佇列狀態")
+    parser.add_argument("--root", default=QUEUE_DIR, help="共用佇列目錄 (預設 TW_SCAN_QUEUE_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    wk = sub.add_parser("worker", help="處理佇列中的分片")
+    wk.add_argument("--workers", type=int, default=1, help="在本機開幾個 worker 行程")
+    wk.add_argument("--idle-exit", type=float, default=None, help="閒置幾秒後結束 (不指定 = 一直等)")
+    sub.add_parser("status", help="列出佇列中的掃描")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        rows = status(args.root)
+        if not rows: print(f"佇列是空的 ({args.root})")
+        for r in rows: print("  ".join(f"{k} {v}" for k, v in r.items()))
+        return 0
+
+    if args.workers > 1:
+        # 每個 worker 是獨立行程 (各自的下載器 / 快取)，這裡只負責開起來並等它們結束
+        cmd = [sys.executable, os.path.abspath(__file__), "--root", args.root, "worker"]
+        if args.idle_exit is not None: cmd += ["--idle-exit", str(args.idle_exit)]
+        procs = [subprocess.Popen(cmd) for _ in range(args.workers)]
+        try:
+            return max(p.wait() for p in procs)
+        except KeyboardInterrupt:
+            for p in procs: p.terminate()
+            return 1
+    print(f"worker {worker_id()} 開始 ({args.root})", flush=True)
+    try:
+        done = work(args.root, args.idle_exit)
+    except KeyboardInterrupt:
+        return 1
+    print(f"worker {worker_id()} 結束，完成 {done} 片", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
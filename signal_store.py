@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------
+# 訊號狀態：記錄每個 (代號, 策略, 訊號日期)，掃描間只回報變化
+# - K 棒沒變的股票直接沿用上次結果，不重跑策略
+# -------------------------------------------------
+SIGNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "signals.json")
+
+SIGNAL_NEW = "🆕 新訊號"
+SIGNAL_PERSIST = "持續"
+SIGNAL_DROPPED = "❌ 消失"
+
+
+def bar_fingerprint(df, backtest_months):
+    # 最後一根K棒 + 回測區間 + 整段K棒的雜湊：任何一個變了就要重跑策略
+    # 只看最後一根會漏掉前面被改寫的歷史 (新的還原因子、品質檢查修補 / 剔除的K棒)，訊號與回測統計會停在舊的
+    last = df.iloc[-1]
+    h = hashlib.sha1(df.index.asi8.tobytes())
+    h.update(np.ascontiguousarray(df[["Open", "High", "Low", "Close", "Volume"]].to_numpy(dtype="float64")).tobytes())
+    return f"{backtest_months}|{df.index[-1]:%Y-%m-%d}|{last['Close']:.4f}|{last['High']:.4f}|{last['Low']:.4f}|{last['Volume']:.0f}|{h.hexdigest()[:16]}"
+
+
+class SignalStore:
+    def __init__(self, path=SIGNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        except Exception:
+            self.state = {"signals": {}, "seen": {}}
+
+    @staticmethod
+    def _key(ticker, strategy):
+        return f"{ticker}|{strategy}"
+
+    def is_unchanged(self, ticker, strategy, fingerprint):
+        with self._lock:
+            return self.state["seen"].get(self._key(ticker, strategy)) == fingerprint
+
+    def active(self, ticker, strategy):
+        with self._lock:
+            rec = self.state["signals"].get(self._key(ticker, strategy))
+            return dict(rec["hit"]) if rec else None
+
+    def record(self, ticker, strategy, fingerprint, hit):
+        # 回傳要顯示的紀錄 (已標上「訊號變化」)，沒有訊號也沒消失則回傳 None
+        key = self._key(ticker, strategy)
+        now = pd.Timestamp.now().isoformat(timespec="seconds")
+        with self._lock:
+            self.state["seen"][key] = fingerprint
+            prev = self.state["signals"].get(key)
+            if hit:
+                is_new = prev is None or prev["signal_date"] != hit.get("訊號日期")
+                hit = {k: v for k, v in hit.items() if k != "訊號變化"}
+                self.state["signals"][key] = {
+                    "signal_date": hit.get("訊號日期"),
+                    "first_seen": now if is_new else prev["first_seen"],
+                    "last_seen": now,
+                    "hit": hit,
+                }
+                return {**hit, "訊號變化": SIGNAL_NEW if is_new else SIGNAL_PERSIST}
+            if prev is not None:
+                del self.state["signals"][key]
+                return {**prev["hit"], "訊號變化": SIGNAL_DROPPED}
+            return None
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, default=str)
+            os.replace(tmp, self.path)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+import market_calendar
+import signal_store
+
+# -------------------------------------------------
+# 部位試算：依帳戶權益與單筆風險 % 算每檔可買幾張
+# - 每股風險 = 現價 - 停損價；單筆風險金額 = 權益 × 風險 %
+# - 台股以張 (1000 股) 為單位，無條件捨去；其他市場以股為單位，建議張數留空
+# - 權益 / 投入 / 風險金額都是台幣：其他市場的股票要給匯率 (fx) 才試算，沒給就略過
+# - 單檔投入不超過 權益 × 單檔上限 %，全部加總不超過權益 (不融資)
+# - 總風險 (portfolio heat) 不超過 權益 × 總風險上限 %：依優先順序分配，額度用完的後面就是 0 張
+# 同一檔被多個策略選到只算一次 (取優先順序最高的那筆)
+# -------------------------------------------------
+TW_LOT = 1000
+COLUMNS = ["代號", "名稱", "策略", "現價", "停損價(SL)", "停利價(TP)", "建議張數", "股數", "投入金額", "風險金額", "風險占比(%)", "累計風險(%)"]
+
+
+def lot_size(ticker):
+    return TW_LOT if market_calendar.calendar_for(ticker) is market_calendar.TW else 1
+
+
+def fx_rate(ticker, fx=None):
+    # 1 單位當地貨幣 = 幾台幣；fx = {市場: 匯率}，例：{"US": 32.5}
+    cal = market_calendar.calendar_for(ticker)
+    return 1.0 if cal is market_calendar.TW else (fx or {}).get(cal.name, np.nan)
+
+
+def position_sizes(hits, equity, risk_pct=1.0, heat_pct=6.0, max_position_pct=100.0, priority=None, odd_lot=False, fx=None):
+    # hits = 掃描命中 (list of dict)；priority = {代號: 分數}，越高越先分配 (例：RS 百分位)
+    df = pd.DataFrame([r for r in hits if r.get("訊號變化") != signal_store.SIGNAL_DROPPED])
+    if df.empty or equity <= 0 or "停損價(SL)" not in df: return pd.DataFrame(columns=COLUMNS)
+    df = df.dropna(subset=["現價", "停損價(SL)"])
+    df = df[df["代號"].map(lambda t: fx_rate(t, fx)).notna()]
+    if df.empty: return pd.DataFrame(columns=COLUMNS)
+    # 優先順序相同時，R 倍數高的先分配
+    keys = pd.DataFrame({
+        "priority": df["代號"].map(priority or {}).astype("float64").fillna(-1),
+        "r": df["R倍數"].astype("float64").fillna(0) if "R倍數" in df else 0.0,
+    })
+    df = df.loc[keys.sort_values(["priority", "r"], ascending=False, kind="stable").index].drop_duplicates("代號")
+
+    price = df["現價"].to_numpy(dtype="float64")
+    rate = df["代號"].map(lambda t: fx_rate(t, fx)).to_numpy(dtype="float64")
+    per_share = price - df["停損價(SL)"].to_numpy(dtype="float64")
+    is_tw = (df["代號"].map(lot_size) == TW_LOT).to_numpy()
+    lot = np.where(is_tw & (not odd_lot), TW_LOT, 1).astype("float64")
+    valid = per_share > 0
+    # 停損不在現價之下的不配置；分母先填 1 避免除以 0，最後再清成 0 張 (金額一律換成台幣)
+    per_lot_risk = np.where(valid, per_share * rate * lot, 1)
+    per_lot_cost = price * rate * lot
+
+    # 單筆風險與單檔上限各自能買的張數，取小的
+    by_risk = np.floor(equity * risk_pct / 100 / per_lot_risk)
+    by_cash = np.floor(equity * max_position_pct / 100 / per_lot_cost)
+    lots = np.where(valid, np.minimum(by_risk, by_cash), 0)
+
+    # 總風險上限、總投入不超過權益：依序累計，超過的那檔縮減到剩餘額度，之後全部為 0
+    for unit, budget in ((per_lot_risk, equity * heat_pct / 100), (per_lot_cost, equity)):
+        wanted = lots * unit
+        allowed = np.clip(budget - (np.cumsum(wanted) - wanted), 0, wanted)
+        lots = np.floor(allowed / unit)
+
+    shares = lots * lot
+    risk_amount = shares * np.where(valid, per_share * rate, 0)
+    return pd.DataFrame({
+        "代號": df["代號"].to_numpy(),
+        "名稱": df.get("名稱", df["代號"]).to_numpy(),
+        "策略": df.get("策略", pd.Series(None, index=df.index)).to_numpy(),
+        "現價": price,
+        "停損價(SL)": df["停損價(SL)"].to_numpy(dtype="float64"),
+        "停利價(TP)": df.get("停利價(TP)", pd.Series(np.nan, index=df.index)).to_numpy(dtype="float64"),
+        "建議張數": np.where(is_tw, shares / TW_LOT, np.nan),
+        "股數": shares.astype("int64"),
+        "投入金額": np.round(shares * price * rate, 0),
+        "風險金額": np.round(risk_amount, 0),
+        "風險占比(%)": np.round(risk_amount / equity * 100, 2),
+        "累計風險(%)": np.round(np.cumsum(risk_amount) / equity * 100, 2),
+    })
+
+
+def summary(sizes, equity):
+    # 總投入 / 總風險 / 有部位的檔數
+    held = sizes[sizes["股數"] > 0]
+    return {
+        "檔數": int(len(held)),
+        "總投入": float(held["投入金額"].sum()),
+        "投入占比(%)": round(float(held["投入金額"].sum()) / equity * 100, 1) if equity else 0.0,
+        "總風險": float(held["風險金額"].sum()),
+        "總風險(%)": round(float(held["風險金額"].sum()) / equity * 100, 2) if equity else 0.0,
+    }
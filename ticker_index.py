@@ -0,0 +1,158 @@
+import bisect
+import difflib
+import json
+import os
+import re
+import time
+import unicodedata
+
+# -------------------------------------------------
+# 代號 / 名稱查詢索引：建在 get_all_tw_tickers 的清單上
+# - 4 位數代號自動補 .TW / .TWO，後綴打錯也會改正
+# - 代號、名稱前綴查詢 + 打錯字時的模糊建議
+# - 手動輸入的清單在排進下載前先驗證；清單只收 4 位數代號，ETF 等 (例：00878.TW) 打完整後綴就放行
+# - 保留 ISIN 頁的市場別 / 產業別，可依產業挑選掃描範圍
+# - 抓到的清單存檔，開盤前預熱抓過的，其他行程不必再抓一次
+# -------------------------------------------------
+UNIVERSE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "universe.json")
+SUFFIXES = (".TW", ".TWO")
+UNCLASSIFIED = "未分類"
+SPLIT_RE = re.compile(r"[\s,，、;；]+")
+TW_LIKE_RE = re.compile(r"^\d|\.TWO?$")
+
+
+def normalize(query):
+    # 全形轉半形、去空白、英文轉大寫
+    return unicodedata.normalize("NFKC", str(query)).strip().upper()
+
+
+def parse_tickers(raw):
+    return [q for q in (normalize(x) for x in SPLIT_RE.split(raw or "")) if q]
+
+
+def save_universe(universe, path=UNIVERSE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": time.time(), "universe": universe}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_universe(fresh_after, path=UNIVERSE_PATH):
+    # fresh_after = epoch 秒；存檔比這個時間舊就當作沒有
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        return saved["universe"] if saved["fetched_at"] >= fresh_after else None
+    except Exception:
+        return None
+
+
+def split_ticker(ticker):
+    code, _, suffix = ticker.partition(".")
+    return code, f".{suffix}" if suffix else ""
+
+
+class TickerIndex:
+    def __init__(self, universe):
+        # universe: {代號: 名稱} 或 {代號: {"名稱", "市場別", "產業別"}}
+        self.meta = {t: info if isinstance(info, dict) else {"名稱": info} for t, info in universe.items()}
+        self.names = {t: info["名稱"] for t, info in self.meta.items()}
+        self.by_code = {}
+        self.by_name = {}
+        for ticker, name in self.names.items():
+            code, _ = split_ticker(ticker)
+            self.by_code.setdefault(code, []).append(ticker)
+            self.by_name.setdefault(normalize(name), ticker)
+        # 前綴查詢：代號與名稱放在同一個排序表，用 bisect 找起點
+        self._keys = sorted({(code, t) for code, ts in self.by_code.items() for t in ts}
+                            | {(name, t) for name, t in self.by_name.items()})
+        self._fuzzy_keys = list(self.by_code) + list(self.by_name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, ticker):
+        return ticker in self.names
+
+    def name(self, ticker):
+        return self.names.get(ticker, ticker)
+
+    def stock_map(self):
+        return dict(self.names)
+
+    def industry(self, ticker):
+        return self.meta.get(ticker, {}).get("產業別") or UNCLASSIFIED
+
+    def industries(self):
+        # {產業別: 檔數}，依檔數多到少
+        counts = {}
+        for t in self.names:
+            ind = self.industry(t)
+            counts[ind] = counts.get(ind, 0) + 1
+        return dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+
+    def tickers_in(self, industries):
+        wanted = set(industries)
+        return [t for t in self.names if self.industry(t) in wanted]
+
+    def resolve(self, query):
+        # 完全對應才回傳代號：完整代號 / 只打代號 / 後綴打錯 / 完整名稱
+        q = normalize(query)
+        if q in self.names: return q
+        code, _ = split_ticker(q)
+        tickers = self.by_code.get(code)
+        if tickers and len(tickers) == 1: return tickers[0]
+        if tickers: return next((t for t in tickers if t.endswith(SUFFIXES[0])), tickers[0])
+        return self.by_name.get(q)
+
+    def prefix(self, query, limit=10):
+        q = normalize(query)
+        found = []
+        i = bisect.bisect_left(self._keys, (q, ""))
+        while i < len(self._keys) and len(found) < limit and self._keys[i][0].startswith(q):
+            t = self._keys[i][1]
+            if t not in found: found.append(t)
+            i += 1
+        return found
+
+    def search(self, query, limit=10):
+        q = normalize(query)
+        if not q: return []
+        found = []
+
+        def add(tickers):
+            for t in tickers:
+                if t not in found and len(found) < limit: found.append(t)
+
+        exact = self.resolve(q)
+        if exact: add([exact])
+        add(self.prefix(split_ticker(q)[0] if TW_LIKE_RE.search(q) else q, limit))
+        # 名稱中間的字 (例：「積電」)
+        if len(found) < limit: add(t for name, t in self.by_name.items() if q in name)
+        # 打錯字：相似度比對代號與名稱
+        if len(found) < limit:
+            key = split_ticker(q)[0] if TW_LIKE_RE.search(q) else q
+            for k in difflib.get_close_matches(key, self._fuzzy_keys, n=limit, cutoff=0.6):
+                add(self.by_code.get(k) or [self.by_name[k]])
+        return found
+
+    def validate(self, queries):
+        # 回傳 (可下載的代號, {無法辨識的輸入: 建議代號})
+        # 非台股格式 (例：AAPL、^TWII) 不在清單裡，照原樣放行
+        # 明確帶 .TW / .TWO 但不在清單的 (ETF、新上市) 也放行，由呼叫端用 unlisted() 提示
+        tickers = []
+        invalid = {}
+        for q in queries:
+            q = normalize(q)
+            t = self.resolve(q)
+            if t is None and q.isascii() and (not TW_LIKE_RE.search(q) or q.endswith(SUFFIXES)): t = q
+            if t is None:
+                invalid[q] = self.search(q, limit=5)
+            elif t not in tickers:
+                tickers.append(t)
+        return tickers, invalid
+
+    def unlisted(self, tickers):
+        # 台股後綴但不在上市上櫃清單 (4 位數代號) 裡的代號
+        return [t for t in tickers if t.endswith(SUFFIXES) and t not in self.names]
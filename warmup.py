@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+import market_calendar
+import profiles
+import scanner
+
+# -------------------------------------------------
+# 開盤前預熱：使用者進來之前先把第一次掃描要付的成本付掉
+# 1. 重抓上市上櫃清單 (存檔，其他行程直接讀)
+# 2. 要掃的股票日K補進本地倉庫，開盤後只要補最新一根
+# 3. 以「下一個交易日多一根K棒」算好所有註冊策略的指標與回測交易清單 (見 backtest_cache)
+# 4. 三大法人買賣超補到最新
+# 預熱範圍：有排程的掃描設定檔；都沒排程就是全部設定檔；沒有設定檔就是全市場前 N 檔
+# 用法：python warmup.py                      (依設定檔)
+#       python warmup.py --profile 每日全市場 --months 6 12
+# -------------------------------------------------
+REPORT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "warmup.json")
+DEFAULT_LIMIT = 2000
+
+
+def pick_profiles(names=None):
+    saved = profiles.load_profiles()
+    if names: return [saved[n] for n in names if n in saved]
+    scheduled = [p for p in saved.values() if p.schedule]
+    return scheduled or list(saved.values())
+
+
+def upcoming_session(calendar, now=None):
+    # 接下來的掃描會看到的最新交易日：盤前 / 盤中是今天，收盤後是下一個交易日
+    now = calendar._local(now if now is not None else calendar.now())
+    if calendar.is_open(now): return now.tz_localize(None).normalize()
+    return calendar.next_open(now).tz_localize(None).normalize()
+
+
+def next_session_frame(ticker, df, now=None):
+    # 回測不看最後一根，只要位置對：補一根假的K棒 (收盤價、量 0)，鍵就和開盤後的掃描相同
+    day = upcoming_session(market_calendar.calendar_for(ticker), now)
+    if df.index[-1] >= day: return df
+    last = float(df["Close"].iloc[-1])
+    row = pd.DataFrame({"Open": last, "High": last, "Low": last, "Close": last, "Volume": 0.0}, index=pd.DatetimeIndex([day], name=df.index.name))
+    return pd.concat([df, row[[c for c in df.columns if c in row]]])
+
+
+def backtest_frames(ticker, df, now=None):
+    # 日線 / 週線各一份；週線用無狀態的聚合，不動到掃描共用的週K建構器
+    daily = next_session_frame(ticker, df, now)
+    return {"D": daily, "W": scanner.weekly_bars.aggregate_weekly(daily)}
+
+
+def warm(names=None, months=(), limit=DEFAULT_LIMIT, batch_size=50, on_progress=None, now=None):
+    t_start = time.perf_counter()
+    timings = {}
+    report = {"started_at": pd.Timestamp.now().isoformat(timespec="seconds")}
+
+    # 1. 清單
+    t = time.perf_counter()
+    index = scanner.get_ticker_index(refresh=True)
+    report["清單檔數"] = len(index) if index else 0
+    timings["清單"] = time.perf_counter() - t
+
+    # 要預熱的股票與各自的回測月數
+    chosen = pick_profiles(names)
+    need = {}
+    if chosen:
+        for p in chosen:
+            plan = profiles.plan(p, refresh=True)
+            for ticker in plan["tickers"]: need.setdefault(ticker, set()).update([plan["backtest_months"], *months])
+    elif index:
+        for ticker in list(index.stock_map())[:limit]: need[ticker] = {*months} or {profiles.BACKTEST_MONTHS[0]}
+    report["設定檔"] = [p.name for p in chosen]
+    tickers = list(need)
+
+    keys = [k for k in scanner.STRATEGIES if not scanner.is_intraday(k)]
+    by_timeframe = scanner.group_by_timeframe(keys)
+    all_months = sorted(set().union(*need.values())) if need else []
+    start = scanner.history_start(keys, max(all_months)) if all_months else None
+    cache = scanner.get_backtest_cache()
+    stats0 = cache.stats()
+    loaded = set()
+    quarantined = set()
+    no_backtest = 0
+    timings["K棒"] = timings["回測"] = 0.0
+
+    for i in range(0, len(tickers), batch_size):
+        batch = tickers[i : i + batch_size]
+        if on_progress: on_progress(i, len(tickers), f"第 {i+1} ~ {i+len(batch)} 檔")
+        # 2. 日K：走和掃描相同的路徑 (倉庫 → 補抓 → 品質檢查)
+        t = time.perf_counter()
+        data = scanner.get_bar_cache().get_many(batch, start, scanner.download_batch_data)
+        raw = set(data)
+        data, _ = scanner.data_quality.validate_batch(data)
+        loaded.update(data)
+        quarantined.update(raw - set(data))
+        timings["K棒"] += time.perf_counter() - t
+
+        # 3. 指標 + 回測
+        t = time.perf_counter()
+        for ticker, df in data.items():
+            frames = backtest_frames(ticker, df, now)
+            for tf, ks in by_timeframe.items():
+                specs = [scanner.STRATEGIES[k] for k in ks if scanner.STRATEGIES[k].backtest]
+                if not specs: continue
+                frame = frames[tf]
+                ind = scanner.compute_indicators(frame, set().union(*(s.required_indicators() for s in specs)))
+                for spec in specs:
+                    for m in sorted(need[ticker]):
+                        if scanner.run_backtest(frame, spec.backtest, m, ind) is None: no_backtest += 1
+        cache.flush()
+        timings["回測"] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    if start is not None: scanner.load_benchmark(start)
+    # 掃描只在策略用到籌碼時才補抓；預熱一天一次，一律補抓讓面板的籌碼欄位有資料
+    chip_panel = scanner.load_chips()
+    timings["籌碼"] = time.perf_counter() - t
+
+    stats1 = cache.stats()
+    wanted = sum(len(m) for m in need.values()) * sum(1 for k in keys if scanner.STRATEGIES[k].backtest)
+    done = (stats1["hits"] - stats0["hits"]) + (stats1["misses"] - stats0["misses"])
+    report.update({
+        "finished_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "session": f"{upcoming_session(market_calendar.TW, now):%Y-%m-%d}",
+        "股票數": len(tickers),
+        "K棒已備妥": len(loaded),
+        "K棒隔離": sorted(quarantined),
+        "K棒缺少": sorted(set(tickers) - loaded - quarantined),
+        "K棒覆蓋(%)": round(len(loaded) / len(tickers) * 100, 1) if tickers else 0.0,
+        "回測數": wanted,
+        "回測覆蓋(%)": round(done / wanted * 100, 1) if wanted else 0.0,
+        "回測已快取": stats1["hits"] - stats0["hits"],
+        "回測新算": stats1["misses"] - stats0["misses"],
+        "回測資料不足": no_backtest,
+        "籌碼天數": len(chip_panel["三大法人"]) if chip_panel else 0,
+        "耗時(秒)": {k: round(v, 2) for k, v in {**timings, "總計": time.perf_counter() - t_start}.items()},
+    })
+    save_report(report)
+    return report
+
+
+def save_report(report, path=REPORT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="開盤前預熱：清單、日K倉庫、指標與回測快取")
+    parser.add_argument("--profile", action="append", help="只預熱指定設定檔 (可重複)；不指定 = 有排程的設定檔")
+    parser.add_argument("--months", type=int, nargs="*", default=[], choices=profiles.BACKTEST_MONTHS, help="另外預熱的回測區間 (月)")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="沒有設定檔時預熱全市場前幾檔")
+    args = parser.parse_args(argv)
+
+    missing = [n for n in args.profile or [] if n not in profiles.load_profiles()]
+    if missing: parser.error(f"找不到設定檔：{', '.join(missing)}")
+    report = warm(args.profile, args.months, args.limit,
+                  on_progress=lambda i, n, msg: print(f"\r{i / n if n else 1:6.1%} {msg}", end="", flush=True))
+    print()
+    print(f"預熱 {report['session']} 開盤：{', '.join(report['設定檔']) or f'全市場前 {args.limit} 檔'}")
+    print(f"清單 {report['清單檔數']} 檔｜日K {report['K棒已備妥']} / {report['股票數']} 檔 ({report['K棒覆蓋(%)']}%，資料品質隔離 {len(report['K棒隔離'])} 檔)")
+    print(f"回測 {report['回測數']} 組 ({report['回測覆蓋(%)']}%)：已快取 {report['回測已快取']}、新算 {report['回測新算']}、資料不足 {report['回測資料不足']}")
+    print(f"籌碼 {report['籌碼天數']} 天")
+    print("耗時 " + "、".join(f"{k} {v}s" for k, v in report["耗時(秒)"].items()))
+    if report["K棒隔離"]: print(f"資料品質隔離：{' '.join(report['K棒隔離'][:20])}")
+    if report["K棒缺少"]: print(f"無法取得日K：{' '.join(report['K棒缺少'][:20])}")
+    return 0 if report["K棒已備妥"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
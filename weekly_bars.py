@@ -0,0 +1,114 @@
+import threading
+
+import pandas as pd
+
+import market_calendar
+
+# -------------------------------------------------
+# 週K 聚合：已完成的週與「本週」分開維護
+# - 新的日K 只更新本週，不必每次整段 resample
+# - 本週未完成時提供依交易日比例推估的週量 (ProjVolume)
+# -------------------------------------------------
+AGG = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+
+def aggregate_weekly(df_daily):
+    # 與 resample('W') 相同：以週日為週線標籤
+    return df_daily[list(AGG)].resample('W').agg(AGG).dropna(subset=['Close'])
+
+
+def week_label(day):
+    return pd.Timestamp(day).to_period('W-SUN').end_time.normalize()
+
+
+def week_start(day):
+    return week_label(day) - pd.Timedelta(days=6)
+
+
+class WeeklyBars:
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self.calendar = market_calendar.calendar_for(ticker)
+        self.completed = None        # 已完成的週K
+        self.current_days = None     # 本週的日K
+        self.anchor = None           # (第一根日期, 本週前一天收盤)：不一樣代表歷史被改寫
+        self.lock = threading.Lock()
+
+    def _split(self, df_daily, start_of_week):
+        pos = df_daily.index.searchsorted(start_of_week)
+        anchor = (df_daily.index[0], float(df_daily['Close'].iloc[pos - 1]) if pos > 0 else None)
+        return pos, anchor
+
+    def update(self, df_daily):
+        if df_daily is None or df_daily.empty: return self
+        if self.current_days is not None and len(self.current_days):
+            pos, anchor = self._split(df_daily, week_start(self.current_days.index[0]))
+            if anchor == self.anchor and pos < len(df_daily):
+                # 只處理本週開始之後的日K (通常 1~6 根)
+                new_days = df_daily.iloc[pos:][list(AGG)]
+                new_start = week_start(new_days.index[-1])
+                done = new_days[new_days.index < new_start]
+                # 跨週了：把原本的「本週」結算進已完成的週K
+                if len(done):
+                    self.completed = pd.concat([self.completed, aggregate_weekly(done)])
+                    self.anchor = (self.anchor[0], float(done['Close'].iloc[-1]))
+                self.current_days = new_days[new_days.index >= new_start]
+                return self
+        # 第一次 / 歷史被改寫 (除權息還原、資料區間不同) → 整段重建
+        pos, self.anchor = self._split(df_daily, week_start(df_daily.index[-1]))
+        self.completed = aggregate_weekly(df_daily.iloc[:pos])
+        self.current_days = df_daily.iloc[pos:][list(AGG)]
+        return self
+
+    def _week_trading_days(self):
+        start = week_start(self.current_days.index[-1])
+        return [d for d in pd.date_range(start, start + pd.Timedelta(days=6)) if self.calendar.is_trading_day(d)]
+
+    def is_current_complete(self, now=None):
+        cal = self.calendar
+        now = cal._local(now if now is not None else cal.now())
+        last_day = self.current_days.index[-1]
+        trading_days = self._week_trading_days()
+        if trading_days and last_day < trading_days[-1]: return False
+        return now >= cal.session_settle(last_day)
+
+    def elapsed_days(self, now=None):
+        # 本週已過的交易日數；今天盤中依開盤時間比例計算
+        cal = self.calendar
+        now = cal._local(now if now is not None else cal.now())
+        days = float(len(self.current_days))
+        open_t = cal.session_open(self.current_days.index[-1])
+        close_t = open_t - cal.open_delta + cal.close_delta
+        if open_t <= now < close_t:
+            days -= 1 - max((now - open_t) / (close_t - open_t), 0.1)
+        return days
+
+    def projected_volume(self, now=None):
+        volume = float(self.current_days['Volume'].sum())
+        if self.is_current_complete(now): return volume
+        elapsed = self.elapsed_days(now)
+        expected = len(self._week_trading_days()) or 5
+        return volume * expected / elapsed if elapsed > 0 else volume
+
+    def frame(self, now=None):
+        # 與 resample('W') 相同欄位，多一欄 ProjVolume；attrs["partial"] 標示本週未完成
+        current = aggregate_weekly(self.current_days)
+        df = pd.concat([self.completed, current]) if len(self.completed) else current
+        df = df.assign(ProjVolume=df['Volume'])
+        partial = not self.is_current_complete(now)
+        if partial and len(df): df.iloc[-1, df.columns.get_loc('ProjVolume')] = self.projected_volume(now)
+        df.attrs["partial"] = partial
+        return df
+
+
+# 跨掃描共用：同一檔再次掃描只需要更新本週
+_builders = {}
+_lock = threading.Lock()
+
+
+def weekly_frame(ticker, df_daily):
+    with _lock:
+        builder = _builders.get(ticker)
+        if builder is None: builder = _builders[ticker] = WeeklyBars(ticker)
+    with builder.lock:
+        return builder.update(df_daily).frame()